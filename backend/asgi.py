@@ -0,0 +1,297 @@
+"""
+Async (ASGI) serving mode for the backend.
+
+The upstream-bound routes (/api/chat, /api/chat/stream, /api/autofill,
+/api/turn, /api/turn/stream) are served natively on the event loop with non-blocking httpx
+calls, so a slow model no longer ties up a worker thread per request. All
+other routes, including character CRUD, search and stats, are the Flask
+handlers from server.py mounted through a WSGI bridge; they only touch local
+state and run on its thread pool. Request and response shapes are identical
+to `python server.py`.
+
+  uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+Needs fastapi, uvicorn, httpx, a2wsgi and python-multipart on top of the
+Flask server's dependencies. bench/serving_bench.py compares both modes.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import metrics
+import server
+from server import (
+    chat_payload, autofill_payload, autofill_key, autofill_cacheable, turn_payload, cache_bypassed, open_session,
+    json_body, parse_turn_reply, turn_character, turn_result, strip_think, upstream_stats_data, ChatStreamRelay,
+    TurnStreamRelay, RAW_AUDIO_TYPES, NO_AUDIO,
+)
+from upstream import UpstreamError
+from reasoning import resolve_tier, completion_reasoning, record as record_reasoning
+from upstream_async import async_upstream
+from streaming import aiter_deltas, sse
+from sessions import session_store
+from response_cache import autofill_cache
+from singleflight import async_upstream_flight, payload_key
+from audio_preprocess import preprocess
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records its encoding time under the current route."""
+
+    def render(self, content):
+        start = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            metrics.observe_serialization(metrics.asgi_route(), time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_upstream.aclose()
+
+
+app = FastAPI(title="Chat Buddy backend (async)", lifespan=lifespan, default_response_class=TimedJSONResponse)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["X-Cache"])
+# Outermost, so it also times CORS handling. Flask-served routes record themselves.
+app.add_middleware(metrics.ASGIMetricsMiddleware)
+
+
+@app.post("/api/chat")
+async def proxy_chat(request: Request):
+    try:
+        body = json_body(await request.body())
+        tier = resolve_tier(body, request.headers)
+        character_json = json.loads(body.get("character_json", "{}"))
+        session_id, history = open_session(body, character_json)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    payload = chat_payload(body, character_json, history, tier)
+
+    try:
+        data = await async_upstream_flight.do("chat:" + payload_key(payload),
+                                              lambda: async_upstream.chat_completion("qwen", payload))
+    except UpstreamError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=502)
+    record_reasoning("/api/chat", tier, payload["model"], *completion_reasoning(data))
+    content = strip_think(data, tier)
+
+    session_store.append(session_id, ("user", body.get("prompt", "")), ("assistant", content))
+    return {"content": content, "raw": data, "session_id": session_id}
+
+
+@app.post("/api/chat/stream")
+async def proxy_chat_stream(request: Request):
+    start = time.perf_counter()
+    try:
+        body = json_body(await request.body())
+        tier = resolve_tier(body, request.headers)
+        character_json = json.loads(body.get("character_json", "{}"))
+        session_id, history = open_session(body, character_json)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    payload = {**chat_payload(body, character_json, history, tier), "stream": True}
+
+    try:
+        r = await async_upstream.post("qwen", payload, stream=True)
+    except UpstreamError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=502)
+    if r.status_code != 200:
+        raw = (await r.aread()).decode("utf-8", "replace")
+        await r.aclose()
+        return TimedJSONResponse({"error": f"upstream returned {r.status_code}", "raw": raw}, status_code=502)
+
+    async def generate():
+        relay = ChatStreamRelay(body.get("prompt", ""), session_id, tier, payload["model"], start)
+        try:
+            async for delta in aiter_deltas(r):
+                for event in relay.feed(delta):
+                    yield event
+            for event in relay.finish():
+                yield event
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+        finally:
+            await r.aclose()
+            relay.close()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/api/autofill")
+async def autofill(request: Request):
+    try:
+        body = json_body(await request.body())
+        tier = resolve_tier(body, request.headers)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    user_input = body.get("character_partial", "")
+    payload = autofill_payload(user_input, body.get("max_tokens", 4096), tier)
+
+    key = autofill_key(payload, tier, user_input)
+    bypass = cache_bypassed(request.headers)
+    if bypass:
+        autofill_cache.note_bypass()
+    else:
+        cached = await asyncio.to_thread(autofill_cache.get, key)
+        if cached is not None:
+            return TimedJSONResponse(cached, headers={"X-Cache": "HIT"})
+
+    try:
+        data = await async_upstream_flight.do("autofill:" + key,
+                                              lambda: async_upstream.chat_completion("qwen", payload))
+    except UpstreamError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=502)
+    record_reasoning("/api/autofill", tier, payload["model"], *completion_reasoning(data))
+    content = strip_think(data, tier)
+
+    result = {"content": content, "raw": data}
+    if autofill_cacheable(data, content):
+        await asyncio.to_thread(autofill_cache.put, key, result)
+    return TimedJSONResponse(result, headers={"X-Cache": "BYPASS" if bypass else "MISS"})
+
+
+class BodyStream:
+    """
+    Blocking file-like view of an ASGI request body, for `preprocess` running
+    in a worker thread: each read pulls the next chunks from the event loop,
+    so the body is decoded as it arrives and never buffered whole.
+    """
+
+    def __init__(self, request, loop):
+        self._chunks = request.stream().__aiter__()
+        self._loop = loop
+        self._buffer = b""
+        self._eof = False
+
+    async def _pull(self):
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            return b""
+
+    def _fill(self):
+        self._buffer += asyncio.run_coroutine_threadsafe(self._pull(), self._loop).result()
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            while not self._eof:
+                self._fill()
+            n = len(self._buffer)
+        while len(self._buffer) < n and not self._eof:
+            self._fill()
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def close(self):
+        self._buffer = b""
+
+
+async def turn_upload(request):
+    """Async counterpart of `server.turn_upload`: (binary file or None, fields)."""
+    if request.headers.get("content-type", "").split(";")[0].strip().lower() in RAW_AUDIO_TYPES:
+        chunked = "chunked" in request.headers.get("transfer-encoding", "").lower()
+        if request.headers.get("content-length", "0") == "0" and not chunked:
+            return None, request.query_params
+        return BodyStream(request, asyncio.get_running_loop()), request.query_params
+    form = await request.form()
+    upload = form.get("audio")
+    if upload is None or isinstance(upload, str):
+        return None, form
+    return upload.file, form
+
+
+async def preprocess_upload(upload):
+    # numpy resampling/VAD is CPU work; keep it off the event loop.
+    try:
+        return await asyncio.to_thread(preprocess, upload)
+    finally:
+        upload.close()
+
+
+@app.post("/api/turn")
+async def api_turn(request: Request):
+    upload, fields = await turn_upload(request)
+    if upload is None:
+        return TimedJSONResponse({"error": NO_AUDIO}, status_code=400)
+    try:
+        character_json = turn_character(fields)
+        session_id, history = open_session(fields, character_json)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    try:
+        audio = await preprocess_upload(upload)
+        upstream_start = time.perf_counter()
+        data = await async_upstream.chat_completion("boson", turn_payload(audio.data, character_json, history))
+        upstream_ms = (time.perf_counter() - upstream_start) * 1000
+        return turn_result(session_id, parse_turn_reply(data.get("choices", [])), audio, upstream_ms)
+    except Exception as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post("/api/turn/stream")
+async def api_turn_stream(request: Request):
+    start = time.perf_counter()
+    upload, fields = await turn_upload(request)
+    if upload is None:
+        return TimedJSONResponse({"error": NO_AUDIO}, status_code=400)
+    try:
+        character_json = turn_character(fields)
+        session_id, history = open_session(fields, character_json)
+    except ValueError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=400)
+    try:
+        audio = await preprocess_upload(upload)
+    except Exception as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=500)
+    upstream_start = time.perf_counter()
+    payload = {**turn_payload(audio.data, character_json, history), "stream": True}
+    try:
+        r = await async_upstream.post("boson", payload, stream=True)
+    except UpstreamError as e:
+        return TimedJSONResponse({"error": str(e)}, status_code=502)
+    if r.status_code != 200:
+        raw = (await r.aread()).decode("utf-8", "replace")
+        await r.aclose()
+        return TimedJSONResponse({"error": f"upstream returned {r.status_code}", "raw": raw}, status_code=502)
+
+    async def generate():
+        relay = TurnStreamRelay(session_id, audio, start, upstream_start)
+        try:
+            async for delta in aiter_deltas(r):
+                for event in relay.feed(delta):
+                    yield event
+            for event in relay.finish():
+                yield event
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+        finally:
+            await r.aclose()
+            relay.close()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    return {
+        "success": True,
+        "data": {**upstream_stats_data(), "async_single_flight": async_upstream_flight.stats()},
+        "message": "上游統計獲取成功"
+    }
+
+
+# Everything else (character CRUD, search, stats) is served by the Flask app.
+app.mount("/", WSGIMiddleware(server.app))
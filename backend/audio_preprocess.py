@@ -0,0 +1,219 @@
+"""
+In-memory audio ingestion for /api/turn, run before the upload is sent to the
+Higgs understanding model.
+
+PCM WAV input is downmixed to mono, resampled to 16 kHz, trimmed of leading
+and trailing silence with a frame-energy VAD, and optionally capped in length,
+then re-encoded as 16-bit WAV. Anything that is not PCM WAV (e.g. webm/ogg
+from MediaRecorder) is passed through unchanged.
+
+`preprocess` takes the upload as bytes or as a binary stream (the request
+body, or the spooled file of a multipart part). A stream is decoded block by
+block, so neither the raw upload nor its multichannel float copy is ever
+held in memory at once; only the downmixed samples are. The data length in
+the WAV header is not trusted: samples are read until that length or the
+end of the upload, whichever comes first (a length of 0 means to the end),
+so memory follows the bytes actually received.
+
+  AUDIO_TARGET_RATE   output sample rate (default 16000)
+  AUDIO_MAX_SECONDS   cap on the kept speech, 0 disables (default 0)
+  AUDIO_VAD_DB        frames quieter than the loudest frame minus this many dB
+                      count as silence (default 35)
+"""
+
+import io
+import os
+import threading
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+TARGET_RATE = int(os.environ.get("AUDIO_TARGET_RATE", "16000"))
+MAX_SECONDS = float(os.environ.get("AUDIO_MAX_SECONDS", "0"))
+VAD_DB = float(os.environ.get("AUDIO_VAD_DB", "35"))
+
+FRAME_MS = 20
+PAD_MS = 150        # keep a little context around the detected speech
+FLOOR_DBFS = -55.0  # never treat anything below this as speech
+BLOCK_FRAMES = 8192  # frames decoded per read; bounds the per-block temporaries
+
+ProcessedAudio = namedtuple("ProcessedAudio", ["data", "bytes_in", "bytes_out", "duration_in", "duration_out", "elapsed_ms"])
+
+
+class _Upload:
+    """Read-only wrapper over the upload that counts bytes and keeps the header for passthrough."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+        self.head = []  # bytes read while `wave` parses the header
+        self.recording = True
+
+    def read(self, n=-1):
+        data = self.stream.read(n)
+        self.size += len(data)
+        if self.recording:
+            self.head.append(data)
+        return data
+
+    def rest(self):
+        """Everything read so far while recording plus whatever is left, for non-WAV uploads."""
+        return b"".join(self.head) + self.read()
+
+    def drain(self):
+        while self.read(1 << 16):
+            pass
+
+
+def _to_float(frames, width):
+    if width == 1:
+        return (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if width == 2:
+        return np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    if width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        return ints.astype(np.float32) / float(1 << 23)
+    return np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+
+
+def _decode_wav(upload):
+    """Return (float32 mono samples, sample_rate), or None if not PCM WAV."""
+    try:
+        with wave.open(upload, "rb") as w:
+            channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            declared = w.getnframes() * width * channels
+    except (wave.Error, EOFError):
+        return None
+    if width not in (1, 2, 3, 4) or rate <= 0:
+        return None
+    upload.recording = False
+    upload.head = []
+    # header 裡的 data 長度由客戶端決定，不能拿來配置記憶體：讀到宣告的長度或 EOF 為止，
+    # 緩衝區只隨實際收到的資料增長。長度 0 是串流寫入端的佔位值，表示一直到結尾
+    frame_size = width * channels
+    left = declared or None
+    blocks = []
+    carry = b""
+    while left is None or left > 0:
+        chunk = upload.read(BLOCK_FRAMES * frame_size if left is None else min(BLOCK_FRAMES * frame_size, left))
+        if not chunk:
+            break
+        if left is not None:
+            left -= len(chunk)
+        chunk = carry + chunk
+        usable = len(chunk) // frame_size * frame_size
+        carry = chunk[usable:]
+        if usable:
+            samples = _to_float(chunk[:usable], width).reshape(-1, channels)
+            blocks.append(samples.mean(axis=1) if channels > 1 else samples[:, 0])
+    mono = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    return mono, rate
+
+
+def _encode_wav(samples, rate):
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def resample(samples, src_rate, dst_rate):
+    """Integer ratios use a boxcar average (cheap anti-aliasing); others use linear interpolation."""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    if src_rate % dst_rate == 0:
+        factor = src_rate // dst_rate
+        n = len(samples) // factor * factor
+        return samples[:n].reshape(-1, factor).mean(axis=1)
+    n_out = int(len(samples) * dst_rate / src_rate)
+    positions = np.arange(n_out) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def trim_silence(samples, rate, vad_db=VAD_DB):
+    """Cut leading/trailing frames whose RMS is well below the loudest frame. Keeps everything if no speech is found."""
+    frame = max(1, rate * FRAME_MS // 1000)
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return samples
+    frames = samples[:n_frames * frame].reshape(n_frames, frame)
+    rms_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    threshold = max(FLOOR_DBFS, float(rms_db.max()) - vad_db)
+    voiced = np.flatnonzero(rms_db > threshold)
+    if len(voiced) == 0:
+        return samples
+    pad = PAD_MS // FRAME_MS
+    start = max(0, voiced[0] - pad) * frame
+    end = min(n_frames, voiced[-1] + 1 + pad) * frame
+    return samples[start:end]
+
+
+def preprocess(data, target_rate=TARGET_RATE, max_seconds=MAX_SECONDS):
+    """
+    Shrink an uploaded clip (bytes or a binary stream) for the understanding model.
+    Returns ProcessedAudio.
+    """
+    start = time.perf_counter()
+    upload = _Upload(io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data)
+    decoded = _decode_wav(upload)
+    if decoded is None:
+        data = upload.rest()
+        return ProcessedAudio(data, len(data), len(data), None, None, (time.perf_counter() - start) * 1000)
+
+    mono, rate = decoded
+    upload.drain()
+    duration_in = len(mono) / rate if rate else 0.0
+    mono = resample(mono, rate, target_rate)
+    mono = trim_silence(mono, target_rate)
+    if max_seconds > 0:
+        mono = mono[:int(max_seconds * target_rate)]
+    out = _encode_wav(mono, target_rate)
+    duration_out = len(mono) / target_rate
+    if isinstance(data, (bytes, bytearray)) and len(out) >= len(data):
+        # Already compact (e.g. the browser sent trimmed 16 kHz mono); keep the original bytes.
+        out, duration_out = bytes(data), duration_in
+    return ProcessedAudio(out, upload.size, len(out), duration_in, duration_out,
+                          (time.perf_counter() - start) * 1000)
+
+
+class IngestStats:
+    """Running totals for /api/turn ingestion: bytes saved and time spent before/at the upstream."""
+
+    def __init__(self):
+        self.turns = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.preprocess_ms = 0.0
+        self.upstream_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, processed, upstream_ms):
+        with self._lock:
+            self.turns += 1
+            self.bytes_in += processed.bytes_in
+            self.bytes_out += processed.bytes_out
+            self.preprocess_ms += processed.elapsed_ms
+            self.upstream_ms += upstream_ms
+
+    def snapshot(self):
+        with self._lock:
+            turns = self.turns or 1
+            return {
+                "turns": self.turns,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "avg_preprocess_ms": round(self.preprocess_ms / turns, 2),
+                "avg_upstream_ms": round(self.upstream_ms / turns, 2),
+            }
+
+
+ingest_stats = IngestStats()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire and server memory per request for audio uploads to
+/api/turn and audio downloads from the Higgs /generate endpoint.
+
+Upload: serves the Flask app in-process (the upstream is a stub subprocess,
+so its allocations are not counted) and posts --requests clips of each
+--seconds length as multipart form-data and as a raw audio/wav body. For
+each it prints the request body size and the peak Python heap allocated
+inside the WSGI call (tracemalloc), then `preprocess` on a spooled upload
+read whole first (what the route did before, `f.read()`) against the same
+file decoded as a stream. The base64 JSON the backend sends upstream is also
+shown; the understanding API only accepts `input_audio` that way.
+
+Download: the generation model needs a GPU, so this replays what /generate
+does with a 24 kHz mono wav of each length: base64 in JSON (read, encode,
+serialize), url (small JSON plus a second GET of the file) and the raw wav
+body (read from disk in FileResponse's 64 KiB chunks). Run from backend/:
+
+  python -m bench.audio_transport_bench --seconds 5 30 --requests 5
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from urllib.parse import urlencode
+
+from bench.load_test import make_wav
+from bench.serving_bench import CHARACTER, free_port
+from upstream import upstream
+
+CHUNK = 64 * 1024  # starlette FileResponse chunk size
+
+
+def multipart(wav):
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"character_json\"\r\n\r\n{CHARACTER}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"turn.wav\"\r\n"
+            f"Content-Type: audio/wav\r\n\r\n").encode("utf-8")
+    return head + wav + f"\r\n--{boundary}--\r\n".encode("utf-8"), f"multipart/form-data; boundary={boundary}"
+
+
+def measure(fn):
+    """(result, peak bytes allocated above the starting heap) for one call."""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    return result, tracemalloc.get_traced_memory()[1] - base
+
+
+class PeakMiddleware:
+    """Records the heap peak of each request's WSGI call; requests must not overlap."""
+
+    def __init__(self, app):
+        self.app = app
+        self.peaks = []
+
+    def __call__(self, environ, start_response):
+        def handle():
+            result = self.app(environ, start_response)
+            try:
+                return b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        body, peak = measure(handle)
+        self.peaks.append(peak)
+        return [body]
+
+
+def post(port, path, body, content_type):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("POST", path, body=body, headers={"Content-Type": content_type})
+    r = conn.getresponse()
+    data = r.read()
+    conn.close()
+    if r.status != 200:
+        raise RuntimeError(f"{path} returned {r.status}: {data[:200]!r}")
+    return data
+
+
+def wait_stub(port, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            http.client.HTTPConnection("127.0.0.1", port, timeout=1).request("GET", "/health")
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def bench_upload(port, peaks, wav, requests):
+    from audio_preprocess import preprocess
+    from server import turn_payload
+    from upstream import encode_payload
+
+    body, content_type = multipart(wav)
+    raw_path = "/api/turn?" + urlencode({"character_json": CHARACTER})
+    for label, wire, call in [
+        ("multipart", len(body), lambda: post(port, "/api/turn", body, content_type)),
+        ("raw", len(wav), lambda: post(port, raw_path, wav, "audio/wav")),
+    ]:
+        del peaks[:]
+        for _ in range(requests):
+            call()
+        print(f"    {label:>10}: wire={wire / 1024:9.1f} KiB  peak heap={max(peaks) / 1024:9.1f} KiB  (whole request)")
+
+    with tempfile.TemporaryFile() as spooled:
+        spooled.write(wav)
+        for label, call in [("read()", lambda: preprocess(spooled.read())), ("stream", lambda: preprocess(spooled))]:
+            results = []
+            for _ in range(requests):
+                spooled.seek(0)
+                results.append(measure(call)[1])
+            print(f"    {label:>10}: {'':20}  peak heap={max(results) / 1024:9.1f} KiB  (preprocess only)")
+
+    upstream_body = encode_payload(turn_payload(preprocess(wav).data, json.loads(CHARACTER)))
+    print(f"    {'upstream':>10}: wire={len(upstream_body) / 1024:9.1f} KiB  (base64 input_audio in JSON)")
+
+
+def bench_download(seconds, requests):
+    wav = make_wav(seconds, rate=24000, channels=1)
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(wav)
+        path = f.name
+
+    def as_base64():
+        b64 = base64.b64encode(open(path, "rb").read()).decode("utf-8")
+        return json.dumps({"id": "bench", "temperature": 0.35, "duration_sec": None,
+                           "audio_base64": b64, "audio_url": None}).encode("utf-8")
+
+    def as_url():
+        return json.dumps({"id": "bench", "temperature": 0.35, "duration_sec": None, "audio_base64": None,
+                           "audio_url": f"http://127.0.0.1:8787/audio/{os.path.basename(path)}"}).encode("utf-8")
+
+    def as_binary():
+        sent = 0
+        with open(path, "rb") as src:
+            while chunk := src.read(CHUNK):
+                sent += len(chunk)
+        return sent
+
+    try:
+        for label, call, wire in [
+            ("base64", as_base64, lambda out: len(out)),
+            ("url", as_url, lambda out: len(out) + len(wav)),
+            ("wav", as_binary, lambda out: out),
+        ]:
+            results = [measure(call) for _ in range(requests)]
+            print(f"    {label:>10}: wire={wire(results[0][0]) / 1024:9.1f} KiB  "
+                  f"peak heap={max(p for _, p in results) / 1024:9.1f} KiB"
+                  + ("  (JSON + GET /audio/...)" if label == "url" else ""))
+    finally:
+        os.unlink(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, nargs="+", default=[5.0, 30.0], help="clip lengths")
+    ap.add_argument("--requests", type=int, default=5, help="requests per case (the max peak is reported)")
+    args = ap.parse_args()
+
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, "-m", "bench.stub_upstream", "--port", str(stub_port)],
+                            stdout=subprocess.DEVNULL)
+    wait_stub(stub_port)
+    upstream.register("boson", f"http://127.0.0.1:{stub_port}/v1/chat/completions")
+    os.chdir(tempfile.mkdtemp())  # characters/sessions of the in-process app stay out of the tree
+    try:
+        from werkzeug.serving import make_server
+        import server
+
+        port = free_port()
+        server.app.wsgi_app = app = PeakMiddleware(server.app.wsgi_app)
+        httpd = make_server("127.0.0.1", port, server.app, threaded=True)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        tracemalloc.start()
+        post(port, "/api/turn?" + urlencode({"character_json": CHARACTER}), make_wav(0.5), "audio/wav")  # warm up
+
+        for seconds in args.seconds:
+            wav = make_wav(seconds)
+            print(f"upload /api/turn, {seconds:g} s of 48 kHz stereo:")
+            bench_upload(port, app.peaks, wav, args.requests)
+        for seconds in args.seconds:
+            print(f"download /generate, {seconds:g} s of 24 kHz mono:")
+            bench_download(seconds, args.requests)
+        httpd.shutdown()
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Read/write contention on CharacterManager under threads.
+
+Runs a --read-ratio mix (default 95% reads) of lookups, searches, listing
+pages and stats against updates from --threads threads, once against the
+snapshot manager and once against the same manager behind one global lock
+(what serializing every call would cost). Prints throughput, read/write
+latency percentiles and any exceptions raised by concurrent access. The
+characters live in a temporary SQLite store. Run from backend/:
+
+  python -m bench.contention_bench --characters 10000 --threads 16 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from bench.storage_bench import synthetic, VOICES
+from bench.upstream_bench import percentile as _percentile
+from character import CharacterManager
+from storage import SQLiteStorage
+
+
+def percentile(sorted_values, q):
+    return _percentile(sorted_values, q) if sorted_values else 0.0
+
+
+class LockedManager:
+    """Baseline: every call, read or write, takes the same lock."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.manager, name)
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return method(*args, **kwargs)
+        return locked
+
+
+def reads(manager, ids, rng):
+    op = rng.random()
+    if op < 0.4:
+        manager.get_character(rng.choice(ids))
+    elif op < 0.7:
+        manager.search_characters(f"character {rng.randrange(100)}", limit=20)
+    elif op < 0.9:
+        manager.page_characters(limit=50)
+    else:
+        manager.get_stats()
+
+
+def run(label, manager, ids, threads, seconds, read_ratio):
+    stop = time.perf_counter() + seconds
+    read_ms, write_ms, errors = [], [], []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        r, w = [], []
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                if rng.random() < read_ratio:
+                    reads(manager, ids, rng)
+                    r.append((time.perf_counter() - t0) * 1000)
+                else:
+                    manager.update_character(rng.choice(ids), {"voice": rng.choice(VOICES), "description": str(t0)})
+                    w.append((time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                errors.append(repr(e))
+        read_ms.extend(r)
+        write_ms.extend(w)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    read_ms.sort()
+    write_ms.sort()
+    ops = len(read_ms) + len(write_ms)
+    print(f"{label:>9}: {ops / seconds:9.1f} ops/s  "
+          f"read p50={percentile(read_ms, 0.50):6.2f}ms p99={percentile(read_ms, 0.99):7.2f}ms  "
+          f"write p50={percentile(write_ms, 0.50):6.2f}ms p99={percentile(write_ms, 0.99):7.2f}ms  "
+          f"errors={len(errors)}")
+    for e in sorted(set(errors))[:5]:
+        print("           ", e)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--characters", type=int, default=10000)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--read-ratio", type=float, default=0.95)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStorage(os.path.join(tmp, "characters.db"), migrate_from=None)
+        records = synthetic(args.characters)
+        store.seed(records)
+        manager = CharacterManager(store)
+        ids = [r["id"] for r in records]
+
+        run("snapshot", manager, ids, args.threads, args.seconds, args.read_ratio)
+        run("locked", LockedManager(manager), ids, args.threads, args.seconds, args.read_ratio)
+        print(f"stats consistent after run: {manager.verify_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Offline stand-in for `voice_fetcher.YouTubeBackend`.
+
+Search results, caption availability and per-call latency are scripted, so
+`voice_fetcher.fetch` can run with no network access:
+
+  backend = FakeBackend([
+      FakeVideo("a", captions=None, latency=0.3),
+      FakeVideo("b", captions="Hello there.", latency=0.1),
+  ])
+  voice_fetcher.fetch("Morgan Freeman", out_dir, backend=backend)
+
+Every call is recorded in `backend.calls` as (method, argument).
+"""
+
+import io
+import threading
+import time
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from voice_fetcher import sanitize_filename
+
+
+@dataclass
+class FakeVideo:
+    video_id: str
+    captions: Optional[str] = None   # None: no usable captions
+    latency: float = 0.0             # seconds the caption lookup takes
+    error: Optional[Exception] = None  # raised by the caption lookup instead of answering
+    seconds: float = 5.0             # length of the downloaded clip
+
+
+def silent_wav(seconds, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\0\0" * int(seconds * rate))
+    return buf.getvalue()
+
+
+class FakeBackend:
+    def __init__(self, videos, search_latency=0.0, download_latency=0.0):
+        self.videos = {v.video_id: v for v in videos}
+        self.order = [v.video_id for v in videos]
+        self.search_latency = search_latency
+        self.download_latency = download_latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, method, arg):
+        with self._lock:
+            self.calls.append((method, arg))
+
+    def count(self, method):
+        with self._lock:
+            return sum(1 for m, _ in self.calls if m == method)
+
+    def search(self, query, limit):
+        self._record("search", query)
+        time.sleep(self.search_latency)
+        return [{
+            "video_id": vid,
+            "title": f"{query} #{i}",
+            "url": f"https://www.youtube.com/watch?v={vid}",
+            "duration": None,
+            "uploader": "fake",
+        } for i, vid in enumerate(self.order[:limit])]
+
+    def captions(self, video_id, lang_preference, max_seconds=5):
+        self._record("captions", video_id)
+        video = self.videos[video_id]
+        time.sleep(video.latency)
+        if video.error is not None:
+            raise video.error
+        return video.captions
+
+    def download(self, url, out_dir, filename, start=0.0, seconds=None):
+        self._record("download", url)
+        time.sleep(self.download_latency)
+        video = self.videos[url.rsplit("v=", 1)[-1]]
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        path = out_dir / f"{sanitize_filename(filename)}.wav"
+        path.write_bytes(silent_wav(video.seconds))
+        return path
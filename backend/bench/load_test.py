@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Offline load test: the backend against stub Qwen and Higgs upstreams.
+
+Starts one stub upstream per model endpoint (see bench/stub_upstream.py for
+latency, token-rate and failure injection), then the backend itself as a
+subprocess in a scratch directory, so its characters.json, SQLite files and
+autofill cache start empty and the repo's copies are never touched. Voice
+sample jobs are queued but not run (VOICE_WORKERS=0), so nothing reaches
+YouTube. --concurrency clients then run a weighted mix of requests for
+--duration seconds:
+
+  chat       POST /api/chat, a running conversation per client
+  stream     POST /api/chat/stream, read to the end
+  turn       POST /api/turn with a generated 48 kHz stereo WAV
+  autofill   POST /api/autofill over a small pool of partial profiles (so
+             mostly cache hits once warm, as in real use)
+  crud       character list / get / search / create / update / delete
+
+For each request type it prints throughput, p50/p95/p99 latency, server
+errors (5xx or no response) and client errors (4xx, e.g. a character deleted
+by another client), then the backend's own upstream retry and breaker
+counters. --json writes the same numbers to a file for comparing runs.
+Run from backend/:
+
+  python -m bench.load_test --mode both --concurrency 64 --duration 30 \\
+      --qwen-latency 0.2 --qwen-token-rate 80 --qwen-fail-rate 0.02 \\
+      --mix chat=40,stream=10,turn=20,autofill=10,crud=20
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+
+import httpx
+
+from bench.serving_bench import CHARACTER, SERVERS, free_port, wait_ready
+from bench.upstream_bench import percentile as _percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "chat=40,stream=10,turn=20,autofill=10,crud=20"
+CRUD_MIX = (("list", 0.35), ("get", 0.25), ("search", 0.20), ("create", 0.10), ("update", 0.07), ("delete", 0.03))
+NAMES = ["Ada", "Bruno", "Chen", "Dara", "Elio", "Fatima", "Goro", "Hana", "Ivo", "Jun", "Kemal", "Lena"]
+UPSTREAM_OPTIONS = ("latency", "token-rate", "think-tokens", "fail-rate", "drop-rate")
+
+
+def percentile(sorted_values, q):
+    return _percentile(sorted_values, q) if sorted_values else float("nan")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chat", "stream", "turn", "autofill", "crud"):
+            raise SystemExit(f"unknown request type '{name}' in --mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_wav(seconds=2.0, rate=48000, channels=2):
+    """Speech-like test clip: silence, a warbling tone with noise, silence (exercises resampling and trimming)."""
+    rng = random.Random(0)
+    frames = bytearray()
+    n = int(seconds * rate)
+    for i in range(n):
+        t = i / rate
+        voiced = 0.25 * seconds < t < 0.75 * seconds
+        sample = 0.3 * math.sin(2 * math.pi * (180 + 40 * math.sin(6 * t)) * t) if voiced else 0.0
+        value = int(max(-1.0, min(1.0, sample + rng.gauss(0, 0.003))) * 32767)
+        frames += struct.pack("<h", value) * channels
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.server_errors = {}
+        self.client_errors = {}
+
+    def record(self, op, ms, status):
+        self.latencies.setdefault(op, []).append(ms)
+        if status is None or status >= 500:
+            self.server_errors[op] = self.server_errors.get(op, 0) + 1
+        elif status >= 400:
+            self.client_errors[op] = self.client_errors.get(op, 0) + 1
+
+    def report(self, elapsed):
+        rows = {}
+        everything = []
+        for op in sorted(self.latencies):
+            values = sorted(self.latencies[op])
+            everything.extend(values)
+            rows[op] = self._row(values, self.server_errors.get(op, 0), self.client_errors.get(op, 0), elapsed)
+        everything.sort()
+        rows["total"] = self._row(everything, sum(self.server_errors.values()), sum(self.client_errors.values()),
+                                  elapsed)
+        return rows
+
+    @staticmethod
+    def _row(values, server_errors, client_errors, elapsed):
+        n = len(values)
+        return {
+            "requests": n,
+            "rps": round(n / elapsed, 1),
+            "p50_ms": round(percentile(values, 0.50), 1),
+            "p95_ms": round(percentile(values, 0.95), 1),
+            "p99_ms": round(percentile(values, 0.99), 1),
+            "server_error_rate": round(server_errors / n, 4) if n else 0.0,
+            "client_error_rate": round(client_errors / n, 4) if n else 0.0,
+        }
+
+
+class Client:
+    """One simulated user: its own conversation, characters it created and a random stream."""
+
+    def __init__(self, base, http, wav, ids, seed, autofill_pool):
+        self.base = base
+        self.http = http
+        self.wav = wav
+        self.ids = ids  # shared between clients
+        self.initial = len(ids)  # characters present at startup are never deleted
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.session_id = uuid.uuid4().hex  # sessions are opt-in: the client names its own
+        self.turns = 0
+        self.autofill_pool = autofill_pool
+
+    async def chat(self):
+        self.turns += 1
+        body = {"prompt": f"client {self.seed} message {self.turns}", "character_json": CHARACTER,
+                "session_id": self.session_id}
+        r = await self.http.post(f"{self.base}/api/chat", json=body)
+        return r.status_code
+
+    async def stream(self):
+        self.turns += 1
+        body = {"prompt": f"client {self.seed} message {self.turns}", "character_json": CHARACTER}
+        async with self.http.stream("POST", f"{self.base}/api/chat/stream", json=body) as r:
+            text = ""
+            async for chunk in r.aiter_text():
+                text += chunk
+        return 500 if "event: error" in text else r.status_code
+
+    async def turn(self):
+        files = {"audio": ("turn.wav", self.wav, "audio/wav")}
+        data = {"character_json": CHARACTER}
+        r = await self.http.post(f"{self.base}/api/turn", files=files, data=data)
+        return r.status_code
+
+    async def autofill(self):
+        name = NAMES[self.rng.randrange(len(NAMES))] + f" {self.rng.randrange(self.autofill_pool)}"
+        r = await self.http.post(f"{self.base}/api/autofill",
+                                 json={"character_partial": json.dumps({"name": name})})
+        return r.status_code
+
+    async def crud(self):
+        roll, op = self.rng.random(), CRUD_MIX[-1][0]
+        for name, weight in CRUD_MIX:
+            if roll < weight:
+                op = name
+                break
+            roll -= weight
+        ids = self.ids
+        if op == "list":
+            r = await self.http.get(f"{self.base}/api/characters", params={"limit": 50})
+        elif op == "get":
+            r = await self.http.get(f"{self.base}/api/characters/{self.rng.choice(ids)}")
+        elif op == "search":
+            r = await self.http.get(f"{self.base}/api/characters/search",
+                                    params={"q": self.rng.choice(NAMES)[:3], "limit": 20})
+        elif op == "create":
+            name = f"{self.rng.choice(NAMES)} {self.seed}-{self.rng.randrange(10 ** 6)}"
+            r = await self.http.post(f"{self.base}/api/characters", json={
+                "name": name, "description": "load test", "personality": "calm",
+                "traits": ["curious"], "voice": "neutral-calm",
+            })
+            if r.status_code == 201:
+                ids.append(r.json()["data"]["id"])
+        elif op == "update":
+            r = await self.http.put(f"{self.base}/api/characters/{self.rng.choice(ids)}",
+                                    json={"description": f"updated {time.time()}"})
+        else:
+            # only characters created during the run, so the defaults survive
+            created = ids[self.initial:]
+            if not created:
+                r = await self.http.get(f"{self.base}/api/characters/{self.rng.choice(ids)}")
+            else:
+                victim = self.rng.choice(created)
+                r = await self.http.delete(f"{self.base}/api/characters/{victim}")
+                if victim in ids:
+                    ids.remove(victim)
+        return f"crud:{op}", r.status_code
+
+
+async def drive(base, args, mix, wav):
+    names, weights = zip(*mix.items())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as http:
+        r = await http.get(f"{base}/api/characters")
+        ids = [c["id"] for c in r.json()["data"]]
+        clients = [Client(base, http, wav, ids, args.seed + i, args.autofill_pool) for i in range(args.concurrency)]
+        rng = random.Random(args.seed)
+        deadline = time.perf_counter() + args.duration
+
+        async def run(client):
+            while time.perf_counter() < deadline:
+                kind = rng.choices(names, weights)[0]
+                t0 = time.perf_counter()
+                try:
+                    result = await getattr(client, kind)()
+                except httpx.HTTPError:
+                    result = None
+                ms = (time.perf_counter() - t0) * 1000
+                op, status = result if isinstance(result, tuple) else (kind, result)
+                recorder.record(op, ms, status)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(client) for client in clients))
+        elapsed = time.perf_counter() - start
+        stats = (await http.get(f"{base}/api/upstream/stats")).json()["data"]
+    return recorder.report(elapsed), stats
+
+
+def print_report(name, rows, stats):
+    print(f"\n== {name} ==")
+    print(f"{'request':<14}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'5xx%':>8}{'4xx%':>8}")
+    for op, row in rows.items():
+        print(f"{op:<14}{row['requests']:>8}{row['rps']:>9.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}"
+              f"{row['p99_ms']:>9.1f}{row['server_error_rate'] * 100:>7.2f}%{row['client_error_rate'] * 100:>7.2f}%")
+    for endpoint in ("qwen", "boson"):
+        ep = stats.get(endpoint, {})
+        print(f"upstream {endpoint}: calls={ep.get('calls')} errors={ep.get('errors')} retries={ep.get('retries')} "
+              f"rejected={ep.get('rejected')} breaker={ep.get('breaker')} p95={ep.get('p95_ms')}ms")
+
+
+def start_stub(prefix, args):
+    port = free_port()
+    cmd = [sys.executable, "-m", "bench.stub_upstream", "--port", str(port), "--seed", str(args.seed)]
+    for option in UPSTREAM_OPTIONS:
+        value = getattr(args, f"{prefix}_{option.replace('-', '_')}")
+        if value is not None:
+            cmd += [f"--{option}", str(value)]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    return proc, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=("flask", "asgi", "both"), default="flask")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds per mode")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="weights per request type")
+    ap.add_argument("--autofill-pool", type=int, default=50, help="distinct autofill inputs per name")
+    ap.add_argument("--store", choices=("json", "sqlite"), default="json", help="CHARACTER_STORE for the backend")
+    ap.add_argument("--tier", choices=("fast", "balanced", "deep"), default=None, help="REASONING_TIER for the backend")
+    ap.add_argument("--timeout", type=float, default=120.0, help="client timeout per request")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="also write the results to this file")
+    for prefix, label in (("qwen", "Qwen"), ("higgs", "Higgs understanding")):
+        ap.add_argument(f"--{prefix}-latency", type=float, default=0.1, help=f"{label} stub: seconds before answering")
+        ap.add_argument(f"--{prefix}-token-rate", type=float, default=None, help=f"{label} stub: tokens per second")
+        ap.add_argument(f"--{prefix}-think-tokens", type=int, default=None, help=f"{label} stub: reasoning length")
+        ap.add_argument(f"--{prefix}-fail-rate", type=float, default=None, help=f"{label} stub: fraction of 503s")
+        ap.add_argument(f"--{prefix}-drop-rate", type=float, default=None, help=f"{label} stub: fraction dropped")
+    args = ap.parse_args()
+    mix = parse_mix(args.mix)
+    wav = make_wav()
+
+    qwen, qwen_url = start_stub("qwen", args)
+    higgs, higgs_url = start_stub("higgs", args)
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR, "QWEN_API": qwen_url, "BOSON_API": higgs_url,
+           "UPSTREAM_POOL_SIZE": str(args.concurrency), "CHARACTER_STORE": args.store, "VOICE_WORKERS": "0"}
+    if args.tier:
+        env["REASONING_TIER"] = args.tier
+        # the stub honours enable_thinking=false like a hybrid checkpoint
+        env.setdefault("QWEN_HYBRID", "1")
+
+    results = {}
+    try:
+        for name in (("flask", "asgi") if args.mode == "both" else (args.mode,)):
+            with tempfile.TemporaryDirectory() as scratch:
+                port = free_port()
+                proc = subprocess.Popen(SERVERS[name] + [str(port)], cwd=scratch, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    base = f"http://127.0.0.1:{port}"
+                    wait_ready(base)
+                    rows, stats = asyncio.run(drive(base, args, mix, wav))
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            print_report(name, rows, stats)
+            results[name] = {"requests": rows, "upstream": {k: stats.get(k) for k in ("qwen", "boson")}}
+    finally:
+        qwen.terminate()
+        higgs.terminate()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Bytes fetched per reference clip: whole-file download then trim, against a
+ranged fetch of just the clip window.
+
+Writes a --minutes long 16 kHz mono WAV (a stand-in for an hour-long
+interview), serves it from bench/range_server.py, once with Range support
+and once with Range headers ignored, and cuts --seconds clips at a few
+offsets with `voice_fetcher.download_audio`. Prints the bytes the server
+sent, the bytes the client read and the time per clip, and checks each
+clip's length. Run from backend/:
+
+  python -m bench.range_fetch_bench --minutes 60 --seconds 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from bench.range_server import RangeServer
+from voice_fetcher import download_audio, download_stats
+
+RATE = 16000
+
+
+def write_long_wav(path, minutes):
+    rng = np.random.default_rng(0)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        for _ in range(int(minutes * 60)):
+            w.writeframes((rng.normal(0, 0.1, RATE) * 32767).astype("<i2").tobytes())
+
+
+def clip_seconds(path):
+    with wave.open(str(path), "rb") as w:
+        return w.getnframes() / w.getframerate()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, default=60.0, help="length of the source file")
+    ap.add_argument("--seconds", type=float, default=5.0, help="clip length")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        media = Path(tmp, "media")
+        media.mkdir()
+        write_long_wav(media / "interview.wav", args.minutes)
+        size = os.path.getsize(media / "interview.wav")
+        print(f"source: {args.minutes:g} min, {size / 2**20:.1f} MiB")
+        offsets = [0.0, args.minutes * 30, args.minutes * 60 - args.seconds]
+
+        for ranges in (True, False):
+            server = RangeServer(media, ranges=ranges).start()
+            print(f"server {'with' if ranges else 'without'} Range support:")
+            for ranged in (False, True):
+                for start in offsets:
+                    server.reset()
+                    t0 = time.perf_counter()
+                    out = download_audio(server.url("interview.wav"), Path(tmp, "out"), "clip", start=start,
+                                         seconds=args.seconds, ranged=ranged)
+                    elapsed = time.perf_counter() - t0
+                    sent = sum(server.bytes_sent.values())
+                    read = download_stats.last["bytes"]
+                    print(f"  {'ranged' if ranged else 'full':>6} @{start:7.1f}s: sent={sent / 1024:10.1f} KiB  "
+                          f"read={read / 1024:10.1f} KiB  requests={len(server.requests)}  "
+                          f"{elapsed * 1000:7.1f}ms  clip={clip_seconds(out):.2f}s")
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
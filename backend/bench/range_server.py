@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Local static file server with HTTP Range support, for trying ranged media
+fetches without network access:
+
+  python -m bench.range_server --dir /tmp/media --port 9200
+  curl -r 0-99 http://127.0.0.1:9200/long.wav
+
+Answers a single `bytes=a-b`, `bytes=a-` or `bytes=-n` range with 206 and
+Content-Range (416 if it starts past the end), anything else with 200 and the
+whole file. --no-ranges ignores Range headers, like some CDNs and proxies;
+--hide-length answers `Content-Range: bytes a-b/*`, as origins that do not
+know the complete length yet may.
+`bytes_sent` counts what was written per path; a client that hangs up early
+is only charged for what made it into the socket.
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK = 64 * 1024
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self):
+        name = unquote(urlparse(self.path).path).lstrip("/")
+        path = os.path.realpath(os.path.join(self.server.directory, name))
+        if not path.startswith(self.server.directory + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _range(self, size):
+        """(first, last) inclusive, None for the whole file, or "invalid" for a 416."""
+        header = self.headers.get("Range")
+        if not header or not self.server.ranges:
+            return None
+        m = RANGE_RE.match(header.strip())
+        if not m or m.groups() == ("", ""):
+            return None  # multiple or malformed ranges: serve the whole file
+        first, last = m.groups()
+        if first == "":
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            first, last = int(first), min(size - 1, int(last) if last else size - 1)
+        if first >= size or first > last:
+            return "invalid"
+        return first, last
+
+    def _serve(self, body):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        span = self._range(size)
+        if span == "invalid":
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        first, last = span or (0, size - 1)
+        self.send_response(206 if span else 200)
+        if span:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{'*' if self.server.hide_length else size}")
+        self.send_header("Accept-Ranges", "bytes" if self.server.ranges else "none")
+        self.send_header("Content-Type", "audio/wav" if path.endswith(".wav") else "application/octet-stream")
+        self.send_header("Content-Length", str(last - first + 1))
+        self.end_headers()
+        self.server.count_request(self.path, self.headers.get("Range"), span is not None)
+        if not body:
+            return
+        with open(path, "rb") as f:
+            f.seek(first)
+            left = last - first + 1
+            while left > 0:
+                block = f.read(min(CHUNK, left))
+                if not block:
+                    break
+                self.wfile.write(block)
+                self.server.count_bytes(self.path, len(block))
+                left -= len(block)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+
+class RangeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory, host="127.0.0.1", port=0, ranges=True, hide_length=False):
+        super().__init__((host, port), RangeHandler)
+        self.directory = os.path.realpath(directory)
+        self.ranges = ranges
+        self.hide_length = hide_length
+        self.requests = []  # (path, Range header, answered with 206)
+        self.bytes_sent = {}
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # ranged readers hang up once they have their window
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self, path, range_header, partial):
+        with self._lock:
+            self.requests.append((path, range_header, partial))
+
+    def count_bytes(self, path, n):
+        with self._lock:
+            self.bytes_sent[path] = self.bytes_sent.get(path, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.requests = []
+            self.bytes_sent = {}
+
+    def url(self, name):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        """Serve from a daemon thread and return self (for benchmarks)."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Static file server with HTTP Range support")
+    ap.add_argument("--dir", default=".")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9200)
+    ap.add_argument("--no-ranges", action="store_true", help="ignore Range headers and always send the whole file")
+    ap.add_argument("--hide-length", action="store_true", help="send `*` as the complete length in Content-Range")
+    args = ap.parse_args()
+
+    server = RangeServer(args.dir, args.host, args.port, ranges=not args.no_ranges, hide_length=args.hide_length)
+    print(f"Serving {server.directory} on {server.url('')}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
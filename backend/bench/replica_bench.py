@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tail latency with one slow upstream replica, with and without hedging.
+
+Starts --replicas stub upstreams in-process, one of which answers after
+--slow-latency instead of --latency (and optionally one that drops every
+connection, to exercise ejection), then sends --requests chat completions
+from --threads threads through the pooled client in three set-ups:
+
+  single     all traffic on the slow replica (the old single-URL setup)
+  balanced   least-outstanding routing over all replicas
+  hedged     the same plus hedging after the recent p95
+
+and prints throughput, latency percentiles, hedges sent/won and replica
+ejections. Run from backend/:
+
+  python -m bench.replica_bench --replicas 3 --threads 16 --requests 2000 --dead
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.stub_upstream import StubServer
+from bench.upstream_bench import PAYLOAD, percentile
+from upstream import UpstreamClient, UpstreamError
+
+
+def run(label, urls, args, hedge, requests=None):
+    client = UpstreamClient(pool_size=args.threads)
+    ep = client.register("qwen", urls, hedge=hedge)
+
+    def timed(_):
+        t0 = time.perf_counter()
+        try:
+            client.chat_completion("qwen", PAYLOAD)
+            ok = True
+        except UpstreamError:
+            ok = False
+        return (time.perf_counter() - t0) * 1000, ok
+
+    requests = requests or args.requests
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(ms for ms, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    stats = ep.stats.snapshot()
+    ejections = sum(r["ejections"] for r in ep.snapshot())
+    print(f"{label:>9}: {requests / elapsed:8.1f} req/s  "
+          f"p50={percentile(latencies, 0.50):7.2f}ms  p95={percentile(latencies, 0.95):7.2f}ms  "
+          f"p99={percentile(latencies, 0.99):7.2f}ms  errors={errors}  "
+          f"hedged={stats['hedged']} won={stats['hedge_wins']} retries={stats['retries']} ejections={ejections}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--replicas", type=int, default=3)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--latency", type=float, default=0.02, help="healthy replica latency in seconds")
+    ap.add_argument("--slow-latency", type=float, default=0.5, help="slow replica latency in seconds")
+    ap.add_argument("--dead", action="store_true", help="add a replica that drops every connection")
+    args = ap.parse_args()
+
+    slow = StubServer(latency=args.slow_latency).start()
+    fast = [StubServer(latency=args.latency).start() for _ in range(args.replicas - 1)]
+    urls = [slow.url] + [s.url for s in fast]
+    if args.dead:
+        urls.append(StubServer(drop_rate=1.0).start().url)
+
+    # every call takes --slow-latency here, so a few rounds per thread are enough
+    run("single", [slow.url], args, hedge=False, requests=min(args.requests, args.threads * 10))
+    run("balanced", urls, args, hedge=False)
+    run("hedged", urls, args, hedge=True)
+
+
+if __name__ == "__main__":
+    main()
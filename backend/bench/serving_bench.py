@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Concurrent throughput of the Flask dev server vs. the ASGI serving mode.
+
+Starts a stub upstream with --latency seconds per completion, then runs the
+backend twice as a subprocess -- once as `app.run(debug=True)` (what
+`python server.py` does, minus the reloader) and once under uvicorn with
+asgi:app -- and drives --concurrency parallel /api/chat requests at each.
+Run from backend/:
+
+  python -m bench.serving_bench --concurrency 200 --requests 1000 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+CHARACTER = json.dumps({
+    "id": "bench", "updated_at": "bench", "name": "Bench", "description": "", "personality": "",
+    "backstory": "", "traits": [], "voice": "neutral-calm",
+})
+
+SERVERS = {
+    "flask": [sys.executable, "-c",
+              "import sys, server; server.app.run(host='127.0.0.1', port=int(sys.argv[1]), debug=True, use_reloader=False)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--log-level", "warning", "--port"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(f"{base}/api/upstream/stats", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base} did not come up")
+
+
+async def drive(base, n, concurrency):
+    # One small pool per 16 in-flight requests; a single large httpcore pool
+    # burns CPU assigning requests and would make the client the bottleneck.
+    shards = max(1, concurrency // 16)
+    limits = httpx.Limits(max_connections=-(-concurrency // shards))
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    clients = [httpx.AsyncClient(limits=limits, timeout=120) for _ in range(shards)]
+    try:
+        async def one(i):
+            nonlocal errors
+            client = clients[i % shards]
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    # Unique prompts so single-flight does not coalesce them.
+                    r = await client.post(f"{base}/api/chat", json={"prompt": f"hello {i}", "character_json": CHARACTER})
+                    r.raise_for_status()
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float("nan")
+    return n / elapsed, pct(0.50), pct(0.95), errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--latency", type=float, default=0.5, help="stub upstream latency in seconds")
+    args = ap.parse_args()
+
+    # The stub gets its own process so it does not share a GIL with the load generator.
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, "-m", "bench.stub_upstream", "--port", str(stub_port),
+                             "--latency", str(args.latency)], stdout=subprocess.DEVNULL)
+    stub_url = f"http://127.0.0.1:{stub_port}/v1/chat/completions"
+    env = {**os.environ, "QWEN_API": stub_url, "BOSON_API": stub_url, "UPSTREAM_POOL_SIZE": str(args.concurrency)}
+
+    for name, cmd in SERVERS.items():
+        port = free_port()
+        proc = subprocess.Popen(cmd + [str(port)], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            wait_ready(base)
+            rps, p50, p95, errors = asyncio.run(drive(base, args.requests, args.concurrency))
+            print(f"{name:>6}: {rps:8.1f} req/s  p50={p50:8.1f}ms  p95={p95:8.1f}ms  errors={errors}")
+        finally:
+            proc.terminate()
+            proc.wait()
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
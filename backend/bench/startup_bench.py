@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Startup time and resident memory of CharacterManager at --sizes characters.
+
+For each size, writes a synthetic characters.json (indented, like
+JSONStorage writes it) to a temporary directory, then loads it in a fresh
+child process and reports the load time, the RSS the loaded manager adds
+on top of the imported modules, and the process's peak RSS. Run from
+backend/:
+
+  python -m bench.startup_bench --sizes 100000,1000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.storage_bench import iter_synthetic
+
+
+def rss_mb(field="VmRSS"):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def write_file(path, n):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, record in enumerate(iter_synthetic(n)):
+            f.write(",\n  " if i else "\n  ")
+            f.write(json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+        f.write("\n]")
+
+
+def child(path):
+    from character import CharacterManager
+    from storage import JSONStorage
+
+    base = rss_mb()
+    start = time.perf_counter()
+    manager = CharacterManager(JSONStorage(path))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "characters": len(manager.characters),
+        "load_s": round(elapsed, 2),
+        "rss_mb": round(rss_mb() - base, 1),
+        "peak_mb": round(rss_mb("VmHWM"), 1),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100000,1000000")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.child)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(s) for s in args.sizes.split(",")):
+            path = os.path.join(tmp, "characters.json")
+            write_file(path, n)
+            size_mb = os.path.getsize(path) / 1e6
+            out = subprocess.run([sys.executable, "-m", "bench.startup_bench", "--child", path],
+                                 capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)) or ".")
+            if out.returncode:
+                print(f"{n:>9}: failed\n{out.stderr[-2000:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{n:>9} characters ({size_mb:6.1f} MB file): load={r['load_s']:7.2f}s  "
+                  f"manager rss={r['rss_mb']:8.1f} MB  peak rss={r['peak_mb']:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Write throughput of the character storage backends at --characters rows.
+
+Seeds a temporary characters.json with synthetic characters, loads it through
+CharacterManager once per backend (the SQLite run goes through the one-shot
+JSON migration) and times single-character updates and deletes. With
+--processes > 1 the SQLite database is additionally hammered by that many
+writer processes at once, each also polling the others' changes. Run from
+backend/:
+
+  python -m bench.storage_bench --characters 100000 --writes 2000 --json-writes 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from character import CharacterManager
+from storage import JSONStorage, SQLiteStorage
+
+VOICES = ["female-calm", "neutral-energetic", "male-deep", "female-bright"]
+TRAITS = ["Helpful", "Creative", "Curious", "Patient", "Witty", "Brave", "Calm", "Kind"]
+
+
+def iter_synthetic(n):
+    rng = random.Random(0)
+    now = "2025-01-01T00:00:00"
+    return ({
+        "id": f"char-{i:07d}",
+        "name": f"Character {i}",
+        "personality": "Synthetic benchmark character",
+        "description": "A generated character used to measure storage writes.",
+        "avatar": "🤖",
+        "voice": rng.choice(VOICES),
+        "traits": rng.sample(TRAITS, 3),
+        "backstory": "Generated.",
+        "created_at": now,
+        "updated_at": now,
+    } for i in range(n))
+
+
+def synthetic(n):
+    return list(iter_synthetic(n))
+
+
+def timed_writes(manager, ids, n):
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for i in range(n):
+        manager.update_character(rng.choice(ids), {"description": f"update {i}", "voice": rng.choice(VOICES)})
+    update_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for id in ids[-n:]:
+        manager.delete_character(id)
+    delete_s = time.perf_counter() - start
+    return n / update_s, n / delete_s
+
+
+def report(label, load_s, updates, deletes):
+    print(f"{label:>8}: load={load_s:6.2f}s  updates={updates:9.1f}/s  deletes={deletes:9.1f}/s")
+
+
+def writer(db_path, ids, n, seed, barrier, results):
+    manager = CharacterManager(SQLiteStorage(db_path, migrate_from=None))
+    rng = random.Random(seed)
+    barrier.wait()
+    start = time.time()
+    for i in range(n):
+        manager.update_character(rng.choice(ids), {"description": f"writer {seed} update {i}"})
+    results.put((start, time.time()))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--characters", type=int, default=100000)
+    ap.add_argument("--writes", type=int, default=2000, help="updates/deletes per SQLite run")
+    ap.add_argument("--json-writes", type=int, default=5, help="updates/deletes for the JSON run (each rewrites the file)")
+    ap.add_argument("--processes", type=int, default=4, help="concurrent SQLite writer processes")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "characters.json")
+        records = synthetic(args.characters)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        ids = [r["id"] for r in records]
+        print(f"{args.characters} characters, characters.json = {os.path.getsize(json_path) / 1e6:.1f} MB")
+
+        start = time.perf_counter()
+        manager = CharacterManager(JSONStorage(json_path))
+        load_s = time.perf_counter() - start
+        report("json", load_s, *timed_writes(manager, ids, args.json_writes))
+
+        # JSON run rewrote the file; migrate the untouched records instead.
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        db_path = os.path.join(tmp, "characters.db")
+        start = time.perf_counter()
+        manager = CharacterManager(SQLiteStorage(db_path, migrate_from=json_path))
+        load_s = time.perf_counter() - start
+        report("sqlite", load_s, *timed_writes(manager, ids, args.writes))
+
+        if args.processes > 1:
+            live = ids[:-args.writes]
+            per_proc = args.writes // args.processes
+            barrier, results = multiprocessing.Barrier(args.processes), multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=writer, args=(db_path, live, per_proc, seed, barrier, results))
+                     for seed in range(args.processes)]
+            for p in procs:
+                p.start()
+            spans = [results.get() for _ in procs]
+            for p in procs:
+                p.join()
+            elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+            print(f"{args.processes} writer processes: {per_proc * args.processes / elapsed:9.1f} updates/s "
+                  f"(each also applying the others' changes)")
+            manager.refresh()
+            print(f"parent converged on {len(manager.characters)} characters, stats consistent={manager.verify_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an OpenAI-compatible /v1/chat/completions endpoint.
+
+Answers Qwen-style (`<think>...</think>answer`) for text requests and
+Higgs-style (`<user>...</user><response>...</response>`) when the last user
+message carries `input_audio`, so the backend can run with no network access:
+
+  python -m bench.stub_upstream --port 9100 --latency 0.05
+  QWEN_API=http://127.0.0.1:9100/v1/chat/completions \\
+  BOSON_API=http://127.0.0.1:9100/v1/chat/completions python server.py
+
+To look like a real model under load it can also generate at --token-rate
+tokens per second (one token per word; streamed responses are paced word by
+word), think for --think-tokens words, and inject failures: --fail-rate
+answers 503 and --drop-rate closes the connection without answering. Like a
+real server it stops at the request's max_tokens (or max_completion_tokens)
+and then reports finish_reason "length".
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+THINK = "The user wants a short in-character answer. Keep it warm and brief."
+ANSWER = "Hello there! It is lovely to hear from you today."
+CAPTION = "Hi, how was your day?"
+
+
+def _is_audio_request(payload):
+    content = (payload.get("messages") or [{}])[-1].get("content")
+    return isinstance(content, list) and any(part.get("type") == "input_audio" for part in content)
+
+
+def _thinks(payload):
+    # fast tier: a non-thinking model, or thinking switched off in the chat template
+    kwargs = payload.get("chat_template_kwargs") or {}
+    return "thinking" in payload.get("model", "") and kwargs.get("enable_thinking", True)
+
+
+def completion_text(payload, think_tokens=None):
+    if _is_audio_request(payload):
+        return f"<user>{CAPTION}</user><response>{ANSWER}</response>"
+    if not _thinks(payload):
+        return ANSWER
+    think = THINK
+    if think_tokens is not None:
+        words = THINK.split(" ")
+        think = " ".join(words[i % len(words)] for i in range(think_tokens))
+    return f"<think>{think}</think>\n\n{ANSWER}"
+
+
+def limit_tokens(payload, text):
+    """(text cut to the request's token limit, finish_reason); one token per word."""
+    limit = payload.get("max_tokens") or payload.get("max_completion_tokens")
+    words = text.split(" ")
+    if limit is None or len(words) <= limit:
+        return text, "stop"
+    return " ".join(words[:limit]), "length"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real vLLM server
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, payload, text, finish_reason):
+        """Stream `text` word by word as OpenAI `chat.completion.chunk` SSE events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        delay = 1 / self.server.token_rate if self.server.token_rate else 0
+        for i, word in enumerate(text.split(" ")):
+            if delay:
+                time.sleep(delay)
+            piece = word if i == 0 else " " + word
+            chunk = {
+                "id": "stub-completion",
+                "object": "chat.completion.chunk",
+                "model": payload.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        last = {
+            "id": "stub-completion",
+            "object": "chat.completion.chunk",
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+        }
+        write_chunk(f"data: {json.dumps(last)}\n\n".encode("utf-8"))
+        write_chunk(b"data: [DONE]\n\n")
+        write_chunk(b"")
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/health", "/v1/models"):
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+
+        self.server.count_request()
+        time.sleep(self.server.latency)
+        fault = self.server.fault()
+        if fault == "drop":
+            self.close_connection = True
+            return
+        if fault == "fail":
+            self._send_json(503, {"error": "injected failure"})
+            return
+        text, finish_reason = limit_tokens(payload, completion_text(payload, self.server.think_tokens))
+        if payload.get("stream"):
+            self._send_stream(payload, text, finish_reason)
+            return
+        if self.server.token_rate:
+            time.sleep(len(text.split(" ")) / self.server.token_rate)
+        self._send_json(200, {
+            "id": "stub-completion",
+            "object": "chat.completion",
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default of 5 drops SYNs when a benchmark opens many connections at once
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_rate=0.0, think_tokens=None,
+                 fail_rate=0.0, drop_rate=0.0, seed=None):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.token_rate = token_rate
+        self.think_tokens = think_tokens
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.failed = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # clients that hang up mid-reply (a cancelled hedge, a timeout) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def fault(self):
+        """"drop", "fail" or None for the current request, drawn from the configured rates."""
+        if not (self.fail_rate or self.drop_rate):
+            return None
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.drop_rate:
+                self.dropped += 1
+                return "drop"
+            if roll < self.drop_rate + self.fail_rate:
+                self.failed += 1
+                return "fail"
+        return None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        """Serve from a daemon thread and return self (for benchmarks)."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    ap.add_argument("--token-rate", type=float, default=0.0, help="generated tokens per second (0: instant)")
+    ap.add_argument("--think-tokens", type=int, default=None, help="length of the <think> block in words")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="fraction of connections closed without a reply")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    server = StubServer(args.host, args.port, latency=args.latency, token_rate=args.token_rate,
+                        think_tokens=args.think_tokens, fail_rate=args.fail_rate, drop_rate=args.drop_rate,
+                        seed=args.seed)
+    print(f"Stub upstream listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
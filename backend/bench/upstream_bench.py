@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare per-call `requests.post` against the pooled `upstream` client.
+
+Starts a stub upstream in-process, fires --requests chat completions from
+--threads worker threads through each path and prints throughput and
+latency percentiles. Run from backend/:
+
+  python -m bench.upstream_bench --threads 32 --requests 2000
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.stub_upstream import StubServer
+from upstream import UpstreamClient
+
+PAYLOAD = {
+    "model": "qwen3-30b-a3b-thinking-fp8",
+    "messages": [{"role": "user", "content": "hello"}],
+    "max_tokens": 64,
+}
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(label, call, n, threads):
+    def timed(_):
+        t0 = time.perf_counter()
+        call()
+        return (time.perf_counter() - t0) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(timed, range(n)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:>10}: {n / elapsed:8.1f} req/s  "
+          f"p50={percentile(latencies, 0.50):6.2f}ms  "
+          f"p95={percentile(latencies, 0.95):6.2f}ms  "
+          f"p99={percentile(latencies, 0.99):6.2f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--latency", type=float, default=0.0, help="stub upstream latency in seconds")
+    args = ap.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+
+    def fresh():
+        requests.post(stub.url, headers={"Content-Type": "application/json"}, json=PAYLOAD, timeout=60).json()
+
+    client = UpstreamClient(pool_size=args.threads)
+    client.register("stub", stub.url)
+
+    run("fresh", fresh, args.requests, args.threads)
+    run("pooled", lambda: client.chat_completion("stub", PAYLOAD), args.requests, args.threads)
+    print(client.metrics()["stub"])
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Time `voice_fetcher.fetch` with the candidates' caption lookups checked one
+at a time (--workers 1, the old loop) and concurrently, against the offline
+fake backend in bench/fake_voice.py.
+
+Each scenario scripts three search results with --latency seconds per
+caption lookup; "slow first" makes the best-ranked one take three times as
+long. Prints the elapsed time, the chosen video (it must not change with the
+worker count) and how many caption lookups were made, then the same fetch
+repeated through a fresh voice cache (the second run must make no backend
+calls at all). Run from backend/:
+
+  python -m bench.voice_fetch_bench --latency 0.3 --workers 4
+"""
+
+import argparse
+import tempfile
+import time
+
+from bench.fake_voice import FakeBackend, FakeVideo
+from voice_cache import CachedBackend, VoiceCache
+from voice_fetcher import fetch
+
+TEXT = "Hello, this is my voice."
+
+
+def scenarios(latency):
+    return {
+        "first has captions": [FakeVideo("v1", TEXT, latency), FakeVideo("v2", TEXT, latency),
+                               FakeVideo("v3", TEXT, latency)],
+        "only last has captions": [FakeVideo("v1", None, latency), FakeVideo("v2", None, latency),
+                                   FakeVideo("v3", TEXT, latency)],
+        "none has captions": [FakeVideo("v1", None, latency), FakeVideo("v2", None, latency),
+                              FakeVideo("v3", None, latency)],
+        "slow first": [FakeVideo("v1", TEXT, latency * 3), FakeVideo("v2", TEXT, latency),
+                       FakeVideo("v3", TEXT, latency)],
+        "first errors": [FakeVideo("v1", error=ConnectionError("reset"), latency=latency),
+                         FakeVideo("v2", TEXT, latency), FakeVideo("v3", TEXT, latency)],
+    }
+
+
+def run(videos, workers, args, runs=1):
+    """(elapsed of the last run, chosen video, backend calls in the last run); runs > 1 go through a cache."""
+    with tempfile.TemporaryDirectory() as out_dir:
+        fake = FakeBackend(videos, search_latency=args.search_latency, download_latency=args.download_latency)
+        backend = CachedBackend(fake, VoiceCache(f"{out_dir}/cache")) if runs > 1 else fake
+        chosen = "-"
+        for _ in range(runs):
+            del fake.calls[:]
+            start = time.perf_counter()
+            try:
+                fetch("Bench Voice", out_dir, backend=backend, workers=workers)
+                # a cached rerun downloads nothing and keeps the first run's choice
+                chosen = next((arg.rsplit("v=", 1)[-1] for m, arg in fake.calls if m == "download"), chosen)
+            except Exception as e:
+                chosen = f"raised {type(e).__name__}"
+            elapsed = time.perf_counter() - start
+    return elapsed, chosen, len(fake.calls) if runs > 1 else fake.count("captions")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--latency", type=float, default=0.3, help="seconds per caption lookup")
+    ap.add_argument("--search-latency", type=float, default=0.0)
+    ap.add_argument("--download-latency", type=float, default=0.0)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    for label, videos in scenarios(args.latency).items():
+        line = [f"{label:>24}:"]
+        for workers in (1, args.workers):
+            elapsed, chosen, lookups = run(videos, workers, args)
+            line.append(f"workers={workers} {elapsed * 1000:7.1f}ms chose={chosen:<3} lookups={lookups}")
+        elapsed, chosen, calls = run(videos, args.workers, args, runs=2)
+        line.append(f"cached rerun {elapsed * 1000:6.1f}ms calls={calls}")
+        print("  ".join(line))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
-import os, uuid, json
+import uuid
+import bisect
+import copy
+import threading
+from collections import Counter
 from datetime import datetime
-from voice_fetcher import fetch
+from voice_jobs import get_voice_jobs
+from character_index import SearchIndex
+from storage import open_storage
 
-DATA_FILE = "./characters.json"
+CHARACTER_FIELDS = ("id", "name", "personality", "description", "avatar", "voice",
+                    "traits", "backstory", "created_at", "updated_at")
 
 
 class Character:
+    # 固定欄位：不為每個實例分配 __dict__，大量角色時明顯省內存
+    __slots__ = CHARACTER_FIELDS
+    
     def __init__(self, name="", personality="", description="", 
-                 avatar="🤖", voice="neutral-calm", traits=None, backstory="", id=None):
+                 avatar="🤖", voice="neutral-calm", traits=None, backstory="", id=None,
+                 created_at=None, updated_at=None):
         self.id = id or str(uuid.uuid4())
         self.name = name
         self.personality = personality
@@ -16,10 +27,18 @@ class Character:
         self.voice = voice
         self.traits = traits or []
         self.backstory = backstory
-        self.created_at = datetime.now().isoformat()
-        self.updated_at = datetime.now().isoformat()
+        # 時間戳保持原始 ISO 字串，只有缺少時才取當前時間
+        if created_at is None or updated_at is None:
+            now = datetime.now().isoformat()
+            created_at = created_at or now
+            updated_at = updated_at or now
+        self.created_at = created_at
+        self.updated_at = updated_at
     
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        """fields: 只輸出指定欄位（投影），None 表示全部"""
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
         return {
             "id": self.id,
             "name": self.name,
@@ -35,7 +54,7 @@ class Character:
     
     @classmethod
     def from_dict(cls, data):
-        character = cls(
+        return cls(
             name=data.get("name", ""),
             personality=data.get("personality", ""),
             description=data.get("description", ""),
@@ -43,41 +62,107 @@ class Character:
             voice=data.get("voice", "neutral-calm"),
             traits=data.get("traits", []),
             backstory=data.get("backstory", ""),
-            id=data.get("id")
+            id=data.get("id"),
+            created_at=data.get("created_at"),
+            updated_at=data.get("updated_at")
         )
-        character.created_at = data.get("created_at", character.created_at)
-        character.updated_at = data.get("updated_at", character.updated_at)
-        return character
 
-class CharacterManager:
+class Snapshot:
+    """
+    某一版本的角色狀態。發布後讀者可以不加鎖地使用；寫者只修改自己的副本
+    （draft），完成後整體替換 CharacterManager.snapshot。
+    順序索引與搜索索引在版本之間共用：順序索引只在 order_len 之後追加，
+    搜索索引可能比快照略新，查詢結果會按快照中的角色過濾。寫者在存儲寫入
+    成功之後才改動這些共用的索引。
+    """
+    __slots__ = ("version", "characters", "seq_of", "order_seqs", "order_ids", "order_len",
+                 "voice_counts", "trait_counts", "index")
+
     def __init__(self):
+        self.version = 0
         self.characters = {}
-        self.load_data()
+        self.seq_of = {}
+        self.order_seqs = []
+        self.order_ids = []
+        self.order_len = 0
+        self.voice_counts = Counter()
+        self.trait_counts = Counter()
+        self.index = SearchIndex()
+
+    def draft(self):
+        """寫者的可變副本：字典與計數器各複製一份，索引共用"""
+        d = Snapshot.__new__(Snapshot)
+        d.version = self.version
+        d.characters = dict(self.characters)
+        d.seq_of = dict(self.seq_of)
+        d.order_seqs = self.order_seqs
+        d.order_ids = self.order_ids
+        d.order_len = self.order_len
+        d.voice_counts = self.voice_counts.copy()
+        d.trait_counts = self.trait_counts.copy()
+        d.index = self.index
+        return d
+
+
+class CharacterManager:
+    def __init__(self, storage=None):
+        self.storage = storage or open_storage()
+        # 寫者之間互斥；讀者只讀取 self.snapshot，不取鎖
+        self._write_lock = threading.Lock()
+        self._next_seq = 0
+        self._tombstones = 0
+        self.snapshot = self._build(self.storage.load())
         
         # 如果沒有數據，創建默認角色
-        if not self.characters:
+        if not self.snapshot.characters:
             self._create_default_characters()
     
-    def load_data(self):
-        """從文件加載角色數據"""
-        if os.path.exists(DATA_FILE):
-            try:
-                with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for char_data in data:
-                        character = Character.from_dict(char_data)
-                        self.characters[character.id] = character
-            except Exception as e:
-                print(f"載入數據時出錯: {e}")
-    
-    def save_data(self):
-        """保存角色數據到文件"""
-        try:
-            data = [char.to_dict() for char in self.characters.values()]
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存數據時出錯: {e}")
+    @property
+    def characters(self):
+        return self.snapshot.characters
+    
+    @property
+    def version(self):
+        return self.snapshot.version
+    
+    def _build(self, records, version=0):
+        """從完整的記錄列表建立一個新快照（含新的搜索索引）"""
+        d = Snapshot()
+        d.version = version
+        self._tombstones = 0
+        for char_data in records:
+            self._add(d, Character.from_dict(char_data))
+        d.order_len = len(d.order_ids)
+        return d
+    
+    def _publish(self, d):
+        """原子地發布寫者的副本；之後不得再修改它"""
+        d.order_len = len(d.order_ids)
+        if d.index.needs_compaction():
+            # 搜索索引中的過期條目過多時重建（舊快照仍使用原索引）
+            d.index = SearchIndex.build(d.characters.values())
+        self.snapshot = d
+    
+    def refresh(self):
+        """應用其他進程寫入的變更；沒有變更時不取鎖（JSON 後端永遠沒有）"""
+        if not self.storage.changed():
+            return
+        with self._write_lock:
+            changes = self.storage.poll()
+            if changes is None:
+                # 變更日誌跟不上時，從存儲後端完整重新載入
+                self._publish(self._build(self.storage.load(), self.snapshot.version + 1))
+                return
+            if not changes:
+                return
+            d = self.snapshot.draft()
+            for id, char_data in changes:
+                if char_data is None:
+                    if id in d.characters:
+                        self._discard(d, id)
+                else:
+                    self._apply(d, Character.from_dict(char_data))
+            self._publish(d)
     
     def _create_default_characters(self):
         """創建默認角色"""
@@ -102,35 +187,165 @@ class CharacterManager:
             }
         ]
         
-        for char_data in default_chars:
-            character = Character(**char_data)
-            self.characters[character.id] = character
-        
-        self.save_data()
+        # 由存儲後端決定最終寫入的角色：多個進程同時啟動時只會有一份默認角色
+        records = [Character(**char_data).to_dict() for char_data in default_chars]
+        with self._write_lock:
+            self._publish(self._build(self.storage.seed(records), self.snapshot.version + 1))
     
-    def get_all_characters(self):
+    def _add(self, d, character):
+        if character.id in d.characters:
+            self._discard(d, character.id)
+        d.version += 1
+        d.seq_of[character.id] = self._next_seq
+        d.order_seqs.append(self._next_seq)
+        d.order_ids.append(character.id)
+        self._next_seq += 1
+        d.characters[character.id] = character
+        d.index.add(character)
+        self._count(d, character.voice, character.traits, 1)
+    
+    def _apply(self, d, character):
+        """新增角色，或替換已存在的同 id 角色（保持原有順序）"""
+        old = d.characters.get(character.id)
+        if old is None:
+            self._add(d, character)
+            return
+        d.version += 1
+        self._count(d, old.voice, old.traits or [], -1)
+        d.characters[character.id] = character
+        d.index.update(character, old)
+        self._count(d, character.voice, character.traits or [], 1)
+    
+    def _discard(self, d, id):
+        """從所有索引中移除角色，返回被移除的角色"""
+        character = d.characters.pop(id)
+        d.version += 1
+        d.index.remove(character)
+        self._count(d, character.voice, character.traits or [], -1)
+        del d.seq_of[id]
+        self._tombstones += 1
+        if self._tombstones > 64 and self._tombstones * 2 > len(d.order_ids):
+            self._compact_order(d)
+        return character
+    
+    def _compact_order(self, d):
+        # 產生新的列表，舊快照仍持有原來的列表
+        live = [(seq, id) for seq, id in zip(d.order_seqs, d.order_ids) if d.seq_of.get(id) == seq]
+        d.order_seqs = [seq for seq, _ in live]
+        d.order_ids = [id for _, id in live]
+        self._tombstones = 0
+    
+    def page_characters(self, cursor=None, limit=50, snap=None):
+        """
+        按插入順序分頁，返回 (角色列表, 下一頁游標)。
+        游標是上一頁最後一個角色的插入序號；只掃描本頁範圍，不複製整個字典。
+        傳入 snap 時在該快照上分頁（與呼叫方的 ETag 對應）。
+        """
+        if snap is None:
+            self.refresh()
+            snap = self.snapshot
+        start = bisect.bisect_right(snap.order_seqs, int(cursor), 0, snap.order_len) if cursor else 0
+        page = []
+        last_seq = None
+        for i in range(start, snap.order_len):
+            seq, id = snap.order_seqs[i], snap.order_ids[i]
+            if snap.seq_of.get(id) != seq:
+                continue  # 已刪除（墓碑）
+            if len(page) == limit:
+                return page, str(last_seq)
+            page.append(snap.characters[id])
+            last_seq = seq
+        return page, None
+    
+    @staticmethod
+    def _count(d, voice, traits, sign):
+        """按 sign (+1/-1) 調整聲音與特質計數，計數歸零時移除鍵"""
+        if voice is not None:
+            d.voice_counts[voice] += sign
+            if d.voice_counts[voice] <= 0:
+                del d.voice_counts[voice]
+        for trait in traits:
+            d.trait_counts[trait] += sign
+            if d.trait_counts[trait] <= 0:
+                del d.trait_counts[trait]
+    
+    def get_stats(self, snap=None):
+        """獲取統計信息（O(1)，不重新掃描角色）"""
+        if snap is None:
+            self.refresh()
+            snap = self.snapshot
+        return {
+            "total_characters": len(snap.characters),
+            "voice_distribution": dict(snap.voice_counts),
+            "trait_distribution": dict(snap.trait_counts)
+        }
+    
+    def recompute_stats(self, snap=None):
+        """從所有角色完整重新計算統計，用於一致性檢查"""
+        snap = snap or self.snapshot
+        voice_counts, trait_counts = Counter(), Counter()
+        for char in snap.characters.values():
+            voice_counts[char.voice] += 1
+            trait_counts.update(char.traits or [])
+        return {
+            "total_characters": len(snap.characters),
+            "voice_distribution": dict(voice_counts),
+            "trait_distribution": dict(trait_counts)
+        }
+    
+    def verify_stats(self):
+        """在同一個快照上比較增量統計與完整重算結果是否一致"""
+        snap = self.snapshot
+        return self.get_stats(snap) == self.recompute_stats(snap)
+    
+    def get_all_characters(self, fields=None):
         """獲取所有角色"""
-        return [char.to_dict() for char in self.characters.values()]
+        self.refresh()
+        return [char.to_dict(fields) for char in self.snapshot.characters.values()]
+    
+    def search_characters(self, query, offset=0, limit=None):
+        """搜索角色，返回 (總數, 排序後的一頁角色)"""
+        self.refresh()
+        snap = self.snapshot
+        if query:
+            ids = snap.index.search(query, snap.characters)
+        else:
+            ids = list(snap.characters)
+        end = None if limit is None else offset + limit
+        return len(ids), [snap.characters[i] for i in ids[offset:end]]
     
     def get_character(self, id):
         """根據ID獲取角色"""
-        return self.characters.get(id)
+        self.refresh()
+        return self.snapshot.characters.get(id)
     
     def create_character(self, character_data):
         """創建新角色"""
+        self.refresh()
         character = Character(**character_data)
-        self.characters[character.id] = character
-        self.save_data()
+        with self._write_lock:
+            d = self.snapshot.draft()
+            # 先寫入存儲：搜索索引與順序列表和已發布的快照共用，寫入失敗時不能已經改動它們
+            self.storage.upsert(character.to_dict(), {**d.characters, character.id: character})
+            self._add(d, character)
+            self._publish(d)
+        # 聲音樣本在背景工作池中下載，查詢進度見 voice_jobs.status
+        # 角色已經寫入並發布：排隊失敗（例如 database is locked）只記錄下來，
+        # 不能讓請求報錯，否則客戶端重試會創建重複的角色
         try:
-            fetch(character.name, out_dir="../higgs-audio-hackathon-starter/ref_audio")
+            get_voice_jobs().enqueue(character.id, character.name)
         except Exception as e:
-            print(f"Error fetching voice sample: {e}")
+            print(f"無法為角色 {character.id} 排入聲音樣本任務: {e}")
         return character
     
     def update_character(self, id, character_data):
-        """更新角色"""
-        if id in self.characters:
-            character = self.characters[id]
+        """更新角色（在副本上修改，讀者手上的舊對象不受影響）"""
+        self.refresh()
+        with self._write_lock:
+            d = self.snapshot.draft()
+            if id not in d.characters:
+                return None
+            character = copy.copy(d.characters[id])
             
             # 更新屬性
             for key, value in character_data.items():
@@ -138,14 +353,20 @@ class CharacterManager:
                     setattr(character, key, value)
             
             character.updated_at = datetime.now().isoformat()
-            self.save_data()
+            self.storage.upsert(character.to_dict(), {**d.characters, id: character})
+            self._apply(d, character)
+            self._publish(d)
             return character
-        return None
     
     def delete_character(self, id):
         """刪除角色"""
-        if id in self.characters:
-            del self.characters[id]
-            self.save_data()
-            return True
-        return False
\ No newline at end of file
+        self.refresh()
+        with self._write_lock:
+            d = self.snapshot.draft()
+            if id not in d.characters:
+                return False
+            self.storage.delete(id, {k: v for k, v in d.characters.items() if k != id})
+            self._discard(d, id)
+            self._publish(d)
+        get_voice_jobs().forget(id)
+        return True
@@ -0,0 +1,152 @@
+"""
+Incremental inverted index over character name, personality and traits.
+
+n-gram postings (1- to 3-grams of each lowercased field) answer the existing
+case-insensitive substring search: a query's grams are intersected, smallest
+posting list first, and the few survivors are verified against the
+character itself, which also decides the ranking.
+
+There are no per-token postings: the search matches substrings, so "cat"
+must also find "scatter", and a token list could only answer whole-word
+hits that the n-gram lookup already returns. Tokens are used only when
+ranking the verified candidates (a match at the start of a word ranks
+higher).
+
+Each character gets a small integer document number and postings are
+append-only `array('i')`s of those numbers, which keeps the index at a few
+bytes per posting instead of a set entry per posting. A write only appends
+the grams the character gained; grams it lost (and everything of a removed
+character) stay behind as stale entries that verification filters out.
+`needs_compaction()` tells the owner when stale entries outnumber live ones
+and the index should be rebuilt with `build()`.
+
+Searches run without a lock while a writer updates the index (see
+CharacterManager.snapshot). Postings are only appended to and are copied
+into sets by single C-level calls, and search() skips characters missing
+from the `characters` it is given, so a concurrent search sees either side
+of a write but never fails.
+"""
+
+import re
+from array import array
+
+GRAM_SIZE = 3
+TOKEN_RE = re.compile(r"\w+")
+COMPACT_MIN_STALE = 10000
+
+
+def _fields(character):
+    return (character.name.lower(), character.personality.lower(), [t.lower() for t in character.traits])
+
+
+def _grams(character):
+    name, personality, traits = _fields(character)
+    out = set()
+    for text in (name, personality, *traits):
+        for n in range(1, GRAM_SIZE + 1):
+            for i in range(len(text) - n + 1):
+                out.add(text[i:i + n])
+    return out
+
+
+class SearchIndex:
+    def __init__(self):
+        self.grams = {}       # gram -> array of document numbers (append-only)
+        self.ids = []         # document number -> character id, None once removed
+        self.docno = {}       # character id -> document number
+        self.postings = 0     # entries across all posting arrays
+        self.stale = 0        # entries that no longer match their character
+
+    @classmethod
+    def build(cls, characters):
+        index = cls()
+        for character in characters:
+            index.add(character)
+        return index
+
+    def add(self, character, old=None):
+        """Index a new character, or re-index one whose fields changed (`old` is the previous version)."""
+        n = self.docno.get(character.id)
+        if n is None:
+            n = self.docno[character.id] = len(self.ids)
+            self.ids.append(character.id)
+        old_grams = _grams(old) if old is not None else set()
+        new_grams = _grams(character)
+        added = new_grams - old_grams
+        for gram in added:
+            postings = self.grams.get(gram)
+            if postings is None:
+                postings = self.grams[gram] = array("i")
+            postings.append(n)
+        self.postings += len(added)
+        self.stale += len(old_grams - new_grams)
+
+    update = add
+
+    def remove(self, character):
+        n = self.docno.pop(character.id, None)
+        if n is None:
+            return
+        self.ids[n] = None
+        self.stale += len(_grams(character))
+
+    def needs_compaction(self):
+        return self.stale > COMPACT_MIN_STALE and self.stale * 2 > self.postings
+
+    def _candidates(self, query):
+        if len(query) <= GRAM_SIZE:
+            return set(self.grams.get(query, ()))
+        lists = []
+        for i in range(len(query) - GRAM_SIZE + 1):
+            postings = self.grams.get(query[i:i + GRAM_SIZE])
+            if not postings:
+                return set()
+            lists.append(postings)
+        lists.sort(key=len)
+        result = set(lists[0])
+        for postings in lists[1:]:
+            result.intersection_update(postings)
+            if not result:
+                break
+        return result
+
+    @staticmethod
+    def _score(character, query, word_query):
+        name, personality, traits = _fields(character)
+        if name == query:
+            return 100
+        if name.startswith(query):
+            return 80
+        # a query that is a whole word ranks "starts a word" above mid-word matches
+        word_prefix = word_query and any(
+            t.startswith(query) for text in (name, personality, *traits) for t in TOKEN_RE.findall(text))
+        score = 0
+        if query in name:
+            score = 60 if word_prefix and any(t.startswith(query) for t in TOKEN_RE.findall(name)) else 40
+        if any(t == query for t in traits):
+            score = max(score, 30)
+        elif any(query in t for t in traits):
+            score = max(score, 20 if word_prefix else 15)
+        if query in personality:
+            score = max(score, 10 if word_prefix else 5)
+        return score
+
+    def search(self, query, characters):
+        """
+        Ids of characters whose name, personality or a trait contains `query`
+        (case-insensitive), best matches first. `characters` maps id -> Character.
+        """
+        query = query.lower()
+        word_query = bool(TOKEN_RE.fullmatch(query))
+        ids = self.ids
+        ranked = []
+        for n in self._candidates(query):
+            character_id = ids[n]
+            character = characters.get(character_id) if character_id is not None else None
+            if character is None:
+                continue
+            score = self._score(character, query, word_query)
+            if score:
+                ranked.append((-score, character.name.lower(), character_id))
+        ranked.sort()
+        return [character_id for _, _, character_id in ranked]
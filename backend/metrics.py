@@ -0,0 +1,292 @@
+"""
+Request, upstream and serialization metrics in Prometheus text format.
+
+Served at GET /metrics (by the Flask app, so both serving modes expose it):
+
+  http_request_duration_seconds{route,method,status}   handler time per route
+                                                        (streamed bodies: until headers)
+  http_request_size_bytes{route} / http_response_size_bytes{route}
+  http_serialization_duration_seconds{route}            JSON encoding of responses
+  upstream_request_duration_seconds{upstream,route}     whole call, retries included, by the
+                                                        inbound route that made it ("background"
+                                                        outside a request)
+  upstream_responses_total{upstream,status}             every attempt; "error" for
+                                                        transport failures, "circuit_open"
+                                                        for calls the breaker rejected
+  upstream_request_size_bytes{upstream} / upstream_response_size_bytes{upstream}
+  reasoning_tokens{route,tier}                          hidden reasoning per Qwen call
+
+Routes are labelled with their rule (/api/characters/<character_id>), not
+the raw path, so label sets stay small. Recording is a dict lookup, a
+bisect over the buckets and three increments under a per-series lock;
+rendering happens only when /metrics is scraped.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SERIALIZATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+TOKEN_BUCKETS = (0, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ASGI 模式下由中間件設置為當前請求的 scope，路由匹配後可從中取得路由模板
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labelnames, values, out):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = 'le="%s"' % bound
+            out.append(f"{name}_bucket{_labels(labelnames, values, le)} {cumulative}")
+        le = 'le="+Inf"'
+        out.append(f"{name}_bucket{_labels(labelnames, values, le)} {count}")
+        out.append(f"{name}_sum{_labels(labelnames, values)} {total}")
+        out.append(f"{name}_count{_labels(labelnames, values)} {count}")
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values, out):
+        out.append(f"{name}{_labels(labelnames, values)} {self.value}")
+
+
+class Family:
+    """One metric name with a fixed set of label names; series are created on first use."""
+
+    def __init__(self, kind, name, help, labelnames, buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        series = self.series.get(values)
+        if series is None:
+            with self._lock:
+                series = self.series.get(values)
+                if series is None:
+                    series = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+                    self.series[values] = series
+        return series
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for values, series in sorted(self.series.items()):
+            series.render(self.name, self.labelnames, values, out)
+
+
+class Registry:
+    def __init__(self):
+        self.families = []
+
+    def histogram(self, name, help, labelnames, buckets):
+        family = Family("histogram", name, help, labelnames, buckets)
+        self.families.append(family)
+        return family
+
+    def counter(self, name, help, labelnames):
+        family = Family("counter", name, help, labelnames)
+        self.families.append(family)
+        return family
+
+    def render(self):
+        out = []
+        for family in self.families:
+            family.render(out)
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", ("route", "method", "status"), LATENCY_BUCKETS)
+request_size = registry.histogram(
+    "http_request_size_bytes", "Request body size.", ("route",), SIZE_BUCKETS)
+response_size = registry.histogram(
+    "http_response_size_bytes", "Response body size (when known up front).", ("route",), SIZE_BUCKETS)
+serialization_duration = registry.histogram(
+    "http_serialization_duration_seconds", "Time spent encoding JSON responses.", ("route",), SERIALIZATION_BUCKETS)
+upstream_duration = registry.histogram(
+    "upstream_request_duration_seconds", "Upstream call time, retries included.", ("upstream", "route"),
+    LATENCY_BUCKETS)
+upstream_responses = registry.counter(
+    "upstream_responses_total", "Upstream attempts by HTTP status.", ("upstream", "status"))
+upstream_request_size = registry.histogram(
+    "upstream_request_size_bytes", "Upstream request body size.", ("upstream",), SIZE_BUCKETS)
+upstream_response_size = registry.histogram(
+    "upstream_response_size_bytes", "Upstream response body size (non-streamed).", ("upstream",), SIZE_BUCKETS)
+
+reasoning_tokens = registry.histogram(
+    "reasoning_tokens", "Reasoning tokens spent per model call.", ("route", "tier"), TOKEN_BUCKETS)
+
+
+def observe_request(route, method, status, seconds, request_bytes, response_bytes):
+    request_duration.labels(route, method, str(status)).observe(seconds)
+    if request_bytes:
+        request_size.labels(route).observe(request_bytes)
+    if response_bytes is not None:
+        response_size.labels(route).observe(response_bytes)
+
+
+def observe_serialization(route, seconds):
+    serialization_duration.labels(route or "unmatched").observe(seconds)
+
+
+def observe_upstream_status(name, status):
+    upstream_responses.labels(name, str(status)).inc()
+
+
+def observe_upstream(name, seconds, request_bytes, response_bytes=None):
+    upstream_duration.labels(name, current_route()).observe(seconds)
+    upstream_request_size.labels(name).observe(request_bytes)
+    if response_bytes is not None:
+        upstream_response_size.labels(name).observe(response_bytes)
+
+
+def observe_reasoning(route, tier, tokens):
+    reasoning_tokens.labels(route, tier).observe(tokens)
+
+
+def asgi_route():
+    """Route template of the ASGI request being handled, if it has been routed yet."""
+    scope = current_scope.get()
+    return getattr(scope.get("route"), "path", None) if scope is not None else None
+
+
+def current_route():
+    """Route template of the request being handled in either serving mode, or "background"."""
+    route = asgi_route()
+    if route is not None:
+        return route
+    from flask import request, has_request_context
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return "background"
+
+
+def instrument_flask(app):
+    """Time every Flask request and every JSON body it encodes."""
+    from flask import request, has_request_context
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            if not has_request_context():
+                return super().dumps(obj, **kwargs)
+            start = time.perf_counter()
+            try:
+                return super().dumps(obj, **kwargs)
+            finally:
+                rule = request.url_rule
+                observe_serialization(rule.rule if rule is not None else None, time.perf_counter() - start)
+
+    app.json = TimedJSONProvider(app)
+
+    # 計時起點在 WSGI 層記錄，只保留一個 after_request 鉤子
+    wsgi_app = app.wsgi_app
+
+    def timed_wsgi_app(environ, start_response):
+        environ["metrics.start"] = time.perf_counter()
+        return wsgi_app(environ, start_response)
+
+    app.wsgi_app = timed_wsgi_app
+
+    @app.after_request
+    def _record(response):
+        environ = request.environ
+        start = environ.get("metrics.start")
+        if start is not None:
+            rule = request.url_rule
+            observe_request(rule.rule if rule is not None else "unmatched", environ["REQUEST_METHOD"],
+                            response.status_code, time.perf_counter() - start,
+                            request.content_length, None if response.is_streamed else response.content_length)
+        return response
+
+
+class ASGIMetricsMiddleware:
+    """
+    Records natively served ASGI routes. Requests that fall through to the
+    mounted Flask app are recorded by Flask's own hooks and skipped here.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+        response_bytes = None
+        token = current_scope.set(scope)
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key == b"content-length":
+                        response_bytes = int(value)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_scope.reset(token)
+            route = scope.get("route")
+            if hasattr(route, "endpoint"):
+                request_bytes = 0
+                for key, value in scope.get("headers", ()):
+                    if key == b"content-length":
+                        request_bytes = int(value)
+                observe_request(route.path, scope["method"], status, time.perf_counter() - start,
+                                request_bytes, response_bytes)
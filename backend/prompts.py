@@ -0,0 +1,110 @@
+"""
+System-prompt compiler for the chat (Qwen) and voice-turn (Higgs) calls.
+
+Prompts are laid out static-rules-first, character-block-second, so every
+request of the same kind starts with a byte-identical prefix and the upstream
+vLLM prefix cache can reuse it across turns and characters. The rendered text
+and its token estimate are cached per (kind, character id) and tagged with the
+character's `updated_at`, which `update_character` bumps on every edit, so a
+hit skips rendering entirely. Characters without an id or `updated_at` (e.g.
+an unsaved draft) are rendered on every call.
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+
+CompiledPrompt = namedtuple("CompiledPrompt", ["text", "tokens"])
+
+ROLEPLAY_RULES = (
+    "You are to roleplay as a fictional character. Follow the character’s personality, backstory, traits, "
+    "and description strictly. Stay in character at all times. "
+    "Rules: "
+    "1. Always respond as the character described below. "
+    "2. Never break character or mention that you are an AI. "
+    "3. Base your answers on the character's perspective, knowledge, and worldview. "
+    "4. When uncertain, improvise in a way consistent with the backstory and traits. "
+    "Dialogue Style: Speak in the character's voice tone. Use empathetic and supportive language. "
+)
+
+TURN_FORMAT_RULES = (
+    "Always output exactly ONE string with this format: <user>caption</user><response></response>. "
+    "Format Rules: (1) The caption is a faithful transcription of the user's audio, in their language. "
+    "(2) Immediately after the caption, output the literal token </user>. "
+    "(3) Immediately after </user><response>, output your response. "
+    "(4) There must be exactly one <user>, </user>, <response>, and </response>. "
+    "(5) Do not wrap in quotes, code blocks, or add newlines. "
+    "(6) If audio is unintelligible, caption as [inaudible]. "
+    "(7) If no speech, caption as [no speech]. "
+    "Examples: User Input: Hi, how was your day? → "
+    "Output: <user>Hi, how was your day?</user><response>Hello! I'm great—how about you?</response> "
+    "User Input: ¿Puedes poner un recordatorio para mañana? → "
+    "Output: <user>¿Puedes poner un recordatorio para mañana?</user><response>¡Claro! ¿A qué hora te gustaría el recordatorio?</resonse> "
+    "User Input: [garbled audio] → Output: <user>[inaudible]</user><response>Sorry, I couldn’t catch that. Could you repeat more clearly?</response> "
+)
+
+# Static prefix per prompt kind; the character block is always appended last.
+PREFIXES = {
+    "chat": ROLEPLAY_RULES,
+    "turn": ROLEPLAY_RULES + TURN_FORMAT_RULES,
+}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 UTF-8 bytes per token) used for budgeting."""
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def character_block(character):
+    return (
+        f"Character Name: {character.get('name', '')} "
+        f"Appearance / Description: {character.get('description', '')} "
+        f"Personality: {character.get('personality', '')} "
+        f"Backstory: {character.get('backstory', '')} "
+        f"Core Traits: {', '.join(character.get('traits') or [])} "
+        f"Voice Tone: {character.get('voice', '')}"
+    )
+
+
+class PromptCompiler:
+    """LRU cache of compiled system prompts, one slot per (kind, character id)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (kind, id) -> (updated_at, CompiledPrompt)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def compile(self, kind, character):
+        char_id, version = character.get("id"), character.get("updated_at")
+        slot = (kind, char_id)
+        with self._lock:
+            cached = self.entries.get(slot) if char_id and version else None
+            if cached and cached[0] == version:
+                self.entries.move_to_end(slot)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        text = PREFIXES[kind] + character_block(character)
+        compiled = CompiledPrompt(text, estimate_tokens(text))
+        if not (char_id and version):
+            return compiled
+        with self._lock:
+            self.entries[slot] = (version, compiled)
+            self.entries.move_to_end(slot)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, char_id):
+        with self._lock:
+            for slot in [s for s in self.entries if s[1] == char_id]:
+                del self.entries[slot]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+prompt_compiler = PromptCompiler()
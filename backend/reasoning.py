@@ -0,0 +1,154 @@
+"""
+Latency tiers for the Qwen calls (/api/chat, /api/chat/stream, /api/autofill).
+
+The thinking model spends most of its completion budget on reasoning that
+`strip_think` throws away. A request picks a tier with `"tier"` in its JSON
+body or the `X-Reasoning-Tier` header; REASONING_TIER sets the default.
+
+  fast       no reasoning. Routed to QWEN_FAST_MODEL (a non-thinking model
+             served by the same endpoint); with QWEN_HYBRID=1 the model is
+             instead asked to skip it with chat_template_kwargs.enable_thinking=false,
+             which only hybrid Qwen3 checkpoints honour (the default
+             thinking-only model ignores it and would spend the whole capped
+             budget reasoning). Without either the tier is rejected with 400.
+             max_tokens is capped at ANSWER_TOKENS, and streamed answers are
+             passed through from the first token.
+  balanced   reasoning capped at REASONING_BUDGET tokens (`thinking_token_budget`)
+             and max_tokens at REASONING_BUDGET + ANSWER_TOKENS, so a server that
+             ignores the budget is still bounded.
+  deep       unchanged: thinking model, max_tokens as requested (default 4096).
+
+Every call logs its tier and the reasoning tokens it used, taken from
+usage.completion_tokens_details.reasoning_tokens when the server reports it and
+otherwise estimated from the reasoning text, and records them in
+metrics (reasoning_tokens{route,tier}) and in `tier_stats`.
+
+  REASONING_TIER     default tier (default deep)
+  QWEN_MODEL         thinking model (default qwen3-30b-a3b-thinking-fp8)
+  QWEN_FAST_MODEL    non-thinking model for the fast tier (default: none)
+  QWEN_HYBRID        1 if QWEN_MODEL honours enable_thinking=false (default 0)
+  REASONING_BUDGET   balanced-tier reasoning budget in tokens (default 512)
+  ANSWER_TOKENS      answer allowance for fast and balanced (default 1024)
+"""
+
+import os
+import threading
+
+import metrics
+from prompts import estimate_tokens
+from streaming import THINK_END
+
+TIERS = ("fast", "balanced", "deep")
+DEFAULT_TIER = os.environ.get("REASONING_TIER", "deep")
+QWEN_MODEL = os.environ.get("QWEN_MODEL", "qwen3-30b-a3b-thinking-fp8")
+FAST_MODEL = os.environ.get("QWEN_FAST_MODEL", "")
+HYBRID = os.environ.get("QWEN_HYBRID", "0") == "1"
+FAST_UNAVAILABLE = "the fast tier needs QWEN_FAST_MODEL, or QWEN_HYBRID=1 for a hybrid QWEN_MODEL"
+REASONING_BUDGET = int(os.environ.get("REASONING_BUDGET", "512"))
+ANSWER_TOKENS = int(os.environ.get("ANSWER_TOKENS", "1024"))
+
+if DEFAULT_TIER not in TIERS:
+    raise ValueError(f"unknown REASONING_TIER '{DEFAULT_TIER}'")
+if DEFAULT_TIER == "fast" and not (FAST_MODEL or HYBRID):
+    raise ValueError(f"REASONING_TIER=fast: {FAST_UNAVAILABLE}")
+
+
+def reasons(tier):
+    """Whether completions of this tier start with reasoning."""
+    return tier != "fast"
+
+
+def resolve_tier(body, headers):
+    """The request's tier; raises ValueError for an unknown one."""
+    tier = body.get("tier") or headers.get("X-Reasoning-Tier") or DEFAULT_TIER
+    if not isinstance(tier, str):
+        raise ValueError(f"tier must be a string (one of {', '.join(TIERS)})")
+    tier = tier.strip().lower()
+    if tier not in TIERS:
+        raise ValueError(f"unknown tier '{tier}' (expected one of {', '.join(TIERS)})")
+    if tier == "fast" and not (FAST_MODEL or HYBRID):
+        raise ValueError(FAST_UNAVAILABLE)
+    return tier
+
+
+def apply_tier(payload, tier):
+    """Return `payload` (built for the thinking model) with the tier's upstream parameters."""
+    if tier == "deep":
+        return payload
+    max_tokens = payload.get("max_tokens", 4096)
+    if tier == "fast":
+        if FAST_MODEL:
+            return {**payload, "model": FAST_MODEL, "max_tokens": min(max_tokens, ANSWER_TOKENS)}
+        return {**payload, "max_tokens": min(max_tokens, ANSWER_TOKENS),
+                "chat_template_kwargs": {"enable_thinking": False}}
+    return {**payload, "max_tokens": min(max_tokens, REASONING_BUDGET + ANSWER_TOKENS),
+            "thinking_token_budget": REASONING_BUDGET}
+
+
+def _reasoning_text(reasoning, content):
+    if THINK_END in content:
+        reasoning += content.split(THINK_END)[0]
+    return reasoning
+
+
+def completion_reasoning(data):
+    """(reasoning tokens, source) for a non-streamed completion; source is "reported" or "estimated"."""
+    details = (data.get("usage") or {}).get("completion_tokens_details") or {}
+    if details.get("reasoning_tokens") is not None:
+        return details["reasoning_tokens"], "reported"
+    message = (data.get("choices") or [{}])[0].get("message") or {}
+    text = _reasoning_text(message.get("reasoning_content") or "", message.get("content") or "")
+    return estimate_tokens(text) if text else 0, "estimated"
+
+
+class ReasoningMeter:
+    """Collects the reasoning of a streamed completion from its deltas."""
+
+    def __init__(self):
+        self.reasoning = []
+        self.content = []
+
+    def feed(self, delta):
+        if delta.get("reasoning_content"):
+            self.reasoning.append(delta["reasoning_content"])
+        if delta.get("content"):
+            self.content.append(delta["content"])
+
+    def tokens(self):
+        text = _reasoning_text("".join(self.reasoning), "".join(self.content))
+        return estimate_tokens(text) if text else 0
+
+
+class TierStats:
+    """Calls and reasoning tokens per tier, for /api/upstream/stats."""
+
+    def __init__(self):
+        self.calls = {tier: 0 for tier in TIERS}
+        self.tokens = {tier: 0 for tier in TIERS}
+        self._lock = threading.Lock()
+
+    def observe(self, tier, tokens):
+        with self._lock:
+            self.calls[tier] += 1
+            self.tokens[tier] += tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                tier: {
+                    "calls": self.calls[tier],
+                    "reasoning_tokens": self.tokens[tier],
+                    "avg_reasoning_tokens": round(self.tokens[tier] / self.calls[tier], 1) if self.calls[tier] else 0.0,
+                }
+                for tier in TIERS
+            }
+
+
+tier_stats = TierStats()
+
+
+def record(route, tier, model, tokens, source="estimated"):
+    """Log and count one call's reasoning usage."""
+    tier_stats.observe(tier, tokens)
+    metrics.observe_reasoning(route, tier, tokens)
+    print(f"[reasoning] {route} tier={tier} model={model} reasoning_tokens={tokens} ({source})")
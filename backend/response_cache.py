@@ -0,0 +1,128 @@
+"""
+Content-addressed cache for deterministic-enough upstream responses (/api/autofill).
+
+Entries are keyed on a SHA-256 of the model name plus the canonicalized
+request JSON. Lookups go through an in-memory LRU first and fall back to a
+JSON file per entry under AUTOFILL_CACHE_DIR; both layers honour the TTL.
+
+  AUTOFILL_CACHE_DIR       on-disk store (default ./cache/autofill)
+  AUTOFILL_CACHE_ENTRIES   in-memory LRU size (default 512)
+  AUTOFILL_CACHE_TTL       seconds an entry stays valid (default 7 days)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get("AUTOFILL_CACHE_DIR", "./cache/autofill")
+CACHE_ENTRIES = int(os.environ.get("AUTOFILL_CACHE_ENTRIES", "512"))
+CACHE_TTL = float(os.environ.get("AUTOFILL_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def canonical_json(value):
+    """
+    Stable encoding of a request body: JSON strings are parsed, keys sorted,
+    whitespace removed and empty fields ("", [], {}, null) dropped, so
+    `{"name": "Miku", "traits": []}` and `{ "name":"Miku" }` hash the same.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return json.dumps(value.strip(), ensure_ascii=False)
+    if isinstance(value, dict):
+        value = {k: v for k, v in value.items() if v not in ("", [], {}, None)}
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def cache_key(model, value):
+    return hashlib.sha256(f"{model}\n{canonical_json(value)}".encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_ENTRIES, ttl=CACHE_TTL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()  # key -> (stored_at, value)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _remember(self, key, stored_at, value):
+        with self._lock:
+            self.memory[key] = (stored_at, value)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry and now - entry["stored_at"] < self.ttl:
+            self._remember(key, entry["stored_at"], entry["value"])
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+            return entry["value"]
+        if entry:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        stored_at = time.time()
+        self._remember(key, stored_at, value)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so concurrent readers never see a torn file.
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": stored_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"寫入快取時出錯: {e}")
+
+    def note_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.memory),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+            }
+
+
+autofill_cache = ResponseCache()
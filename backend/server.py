@@ -1,74 +1,236 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from app.routes import bp as api_bp
-import requests
 import os, json, uuid
-import openai
 import base64
+import threading
+import time
+import zlib
 from datetime import datetime
 
-from character import CharacterManager
+from character import CharacterManager, CHARACTER_FIELDS
+from upstream import upstream, UpstreamError, LatencyStats
+from streaming import ThinkStripper, TurnParser, iter_deltas, parse_turn, sse
+from prompts import prompt_compiler
+from sessions import session_store, HISTORY_TOKENS
+from response_cache import autofill_cache, cache_key
+from singleflight import upstream_flight, payload_key
+from audio_preprocess import preprocess, ingest_stats
+from voice_jobs import get_voice_jobs
+from voice_cache import get_voice_cache
+from voice_fetcher import download_stats
+from reasoning import (QWEN_MODEL, resolve_tier, reasons, apply_tier, completion_reasoning, ReasoningMeter,
+                       tier_stats, record as record_reasoning)
+import metrics
 
 app = Flask(__name__, static_folder=None)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+# 每個路由的請求/序列化耗時與大小，見 GET /metrics
+metrics.instrument_flask(app)
 # app.register_blueprint(api_bp, url_prefix="/api")
 
-QWEN_API = "http://20.66.111.167:31022/v1/chat/completions"
 
+# Time from request arrival to the first token the user can see (after </think>).
+chat_stream_first_token = LatencyStats()
+# Time from request arrival to the caption event of /api/turn/stream.
+turn_stream_caption = LatencyStats()
 
-@app.route("/api/chat", methods=["POST"])
-def proxy_chat():
-    user_input = request.json.get("prompt", "")
-    character_json = json.loads(request.json.get("character_json", "{}"))
-    max_tokens = request.json.get("max_tokens", 4096)
-    payload = {
-        "model": "qwen3-30b-a3b-thinking-fp8",
+
+INAUDIBLE_REPLY = "Sorry, I couldn’t catch that. Could you repeat more clearly?"
+
+# /api/turn 也接受原始音訊 body（欄位放在 query string），不必包成 multipart
+RAW_AUDIO_TYPES = ("audio/wav", "audio/x-wav", "audio/wave", "audio/ogg", "audio/webm", "application/octet-stream")
+NO_AUDIO = "no 'audio' file in form-data and no audio/* body"
+
+
+def strip_think(data, tier="deep"):
+    """
+    Extract the assistant text (like jq does) and cut the thinking part out.
+    A completion that max_tokens cut off before `</think>` is all reasoning,
+    so it gives "" instead of being passed off as the answer.
+    """
+    choice = (data.get("choices") or [{}])[0]
+    message = choice.get("message") or {}
+    content = message.get("content") or ""
+    if "</think>" in content:
+        return content.split("</think>")[-1].strip()
+    if choice.get("finish_reason") == "length" and reasons(tier) and not message.get("reasoning_content"):
+        return ""
+    return content
+
+
+def json_body(raw):
+    """Parse a request body that must be a JSON object; raises ValueError (a 400) otherwise."""
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise ValueError("request body must be valid JSON")
+    if not isinstance(body, dict):
+        raise ValueError("request body must be a JSON object")
+    return body
+
+
+def open_session(body, character_json):
+    """
+    Resolve the request's session and the history that fits its token budget.
+
+    Sessions are opt-in: the client picks a `session_id` (e.g. a random
+    UUID) and sends it with every turn; an unknown id starts that session.
+    Without one the call is stateless and nothing is stored, so clients
+    that never reuse a session do not churn the store. Raises ValueError
+    for a malformed session_id or history_tokens.
+    """
+    session_id = body.get("session_id") or None
+    if session_id is not None and (not isinstance(session_id, str) or len(session_id) > 128):
+        raise ValueError("session_id must be a string of at most 128 characters")
+    try:
+        budget = int(body.get("history_tokens", HISTORY_TOKENS))
+    except (TypeError, ValueError):
+        raise ValueError("history_tokens must be an integer")
+    if budget < 0:
+        raise ValueError("history_tokens must not be negative")
+    if session_id is None:
+        return None, []
+    session_id = session_store.open(session_id, character_json.get("id"))
+    return session_id, session_store.history(session_id, budget)
+
+
+def chat_payload(body, character_json, history=(), tier="deep"):
+    user_input = body.get("prompt", "")
+    max_tokens = body.get("max_tokens", 4096)
+    return apply_tier({
+        "model": QWEN_MODEL,
         "messages": [
-            # {"role": "system", "content": f"You are now a human whose name is {character} with backgroud story that {character_json["backstory"]}. \
-            # Your personality is {character_json["personality"]}. You possess the following traits: {character_json["traits"]}."},
-            {"role": "system", "content": f"""You are to roleplay as a fictional character. Follow the character’s personality, backstory, traits, and description strictly. Stay in character at all times. """
-                f"""Character Name: {character_json['name']} """
-                f"""Appearance / Description: {character_json['description']} """
-                f"""Personality: {character_json['personality']} """
-                f"""Backstory: {character_json['backstory']} """
-                f"""Core Traits: {", ".join(character_json['traits'])} """
-                f"""Dialogue Style: Speak with a {character_json['voice']} tone. Use empathetic and supportive language. """
-                f"""Rules: """
-                f"""1. Always respond as {character_json['name']}. """
-                f"""2. Never break character or mention that you are an AI. """
-                f"""3. Base your answers on {character_json['name']}'s perspective, knowledge, and worldview. """
-                f"""4. When uncertain, improvise in a way consistent with the backstory and traits. """
-                },
+            {"role": "system", "content": prompt_compiler.compile("chat", character_json).text},
+            *history,
             {"role": "user", "content": user_input}
         ],
         "max_tokens": max_tokens,
-    }
+    }, tier)
+
 
-    # This is the Python equivalent of your curl
-    r = requests.post(
-        QWEN_API,
-        headers={"Content-Type": "application/json"},
-        json=payload,
-        timeout=60
-    )
-    data = r.json()
+@app.route("/api/chat", methods=["POST"])
+def proxy_chat():
+    try:
+        body = json_body(request.get_data())
+        tier = resolve_tier(body, request.headers)
+        character_json = json.loads(body.get("character_json", "{}"))
+        session_id, history = open_session(body, character_json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    payload = chat_payload(body, character_json, history, tier)
+
+    try:
+        # Identical concurrent requests (e.g. the same greeting) share one completion.
+        data = upstream_flight.do("chat:" + payload_key(payload),
+                                  lambda: upstream.chat_completion("qwen", payload))
+    except UpstreamError as e:
+        return jsonify({"error": str(e)}), 502
     # print(data)
+    record_reasoning("/api/chat", tier, payload["model"], *completion_reasoning(data))
+    content = strip_think(data, tier)
 
-    # Extract the text like jq does
-    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    session_store.append(session_id, ("user", body.get("prompt", "")), ("assistant", content))
+    return jsonify({"content": content, "raw": data, "session_id": session_id})
 
-    # cut the thinking part out
-    if "</think>" in content:
-        content = content.split("</think>")[-1].strip()
+class ChatStreamRelay:
+    """
+    Upstream deltas -> SSE events of one /api/chat/stream response. Shared by
+    the Flask and ASGI handlers, which only differ in how they iterate and
+    close the upstream stream.
+    """
 
-    return jsonify({"content": content, "raw": data})
+    def __init__(self, prompt, session_id, tier, model, start):
+        self.prompt = prompt
+        self.session_id = session_id
+        self.tier = tier
+        self.model = model
+        self.start = start
+        self.stripper = ThinkStripper(reasoning=reasons(tier))
+        self.meter = ReasoningMeter()
+        self.first_token_ms = None
+        self.finish_reason = None
+        self.ok = False
+        self.answer = []
 
-@app.route("/api/autofill", methods=["POST"])
-def autofill():
-    user_input = request.json.get("character_partial", "")
-    max_tokens = request.json.get("max_tokens", 4096)
-    payload = {
-        "model": "qwen3-30b-a3b-thinking-fp8",
+    def _content(self, text):
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.start) * 1000
+            chat_stream_first_token.observe(self.first_token_ms, True)
+        self.answer.append(text)
+        return sse({"content": text})
+
+    def feed(self, delta):
+        """Events for one upstream delta (none while the reasoning is being skipped)."""
+        self.meter.feed(delta)
+        self.finish_reason = delta.get("finish_reason") or self.finish_reason
+        if delta.get("reasoning_content"):
+            self.stripper.mark_reasoning_separated()
+        text = self.stripper.feed(delta.get("content") or "")
+        return [self._content(text)] if text else []
+
+    def finish(self):
+        """Closing events once the upstream stream has ended: held-back text, then `done`."""
+        text = self.stripper.flush(truncated=self.finish_reason == "length")
+        events = [self._content(text)] if text else []
+        self.ok = True
+        session_store.append(self.session_id, ("user", self.prompt), ("assistant", "".join(self.answer)))
+        events.append(sse({
+            "session_id": self.session_id,
+            "tier": self.tier,
+            "first_token_ms": round(self.first_token_ms, 2) if self.first_token_ms is not None else None,
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+        }, event="done"))
+        return events
+
+    def close(self):
+        """Record the call's metrics; called once the upstream response is closed."""
+        record_reasoning("/api/chat/stream", self.tier, self.model, self.meter.tokens())
+        if self.first_token_ms is None:
+            chat_stream_first_token.observe((time.perf_counter() - self.start) * 1000, self.ok)
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def proxy_chat_stream():
+    """
+    Same as /api/chat but streams the visible answer as server-sent events:
+    `data: {"content": "..."}` per chunk, then `event: done` with timings.
+    """
+    start = time.perf_counter()
+    try:
+        body = json_body(request.get_data())
+        tier = resolve_tier(body, request.headers)
+        character_json = json.loads(body.get("character_json", "{}"))
+        session_id, history = open_session(body, character_json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    payload = {**chat_payload(body, character_json, history, tier), "stream": True}
+
+    try:
+        r = upstream.post("qwen", payload, stream=True)
+    except UpstreamError as e:
+        return jsonify({"error": str(e)}), 502
+    if r.status_code != 200:
+        return jsonify({"error": f"upstream returned {r.status_code}", "raw": r.text}), 502
+
+    def generate():
+        relay = ChatStreamRelay(body.get("prompt", ""), session_id, tier, payload["model"], start)
+        try:
+            for delta in iter_deltas(r):
+                yield from relay.feed(delta)
+            yield from relay.finish()
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+        finally:
+            r.close()
+            relay.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def autofill_payload(user_input, max_tokens, tier="deep"):
+    return apply_tier({
+        "model": QWEN_MODEL,
         "messages": [
             {"role": "system", "content": f"""You are an assistant that completes a character profile for a chat app. """
                 f"""Return ONLY a JSON object (no prose) matching this exact TypeScript shape. """
@@ -105,68 +267,69 @@ def autofill():
             {"role": "user", "content": user_input}
         ],
         "max_tokens": max_tokens,
-    }
+    }, tier)
 
-    # This is the Python equivalent of your curl
-    r = requests.post(
-        QWEN_API,
-        headers={"Content-Type": "application/json"},
-        json=payload,
-        timeout=60
-    )
-    data = r.json()
-    print(data)
 
-    # Extract the text like jq does
-    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+def cache_bypassed(headers):
+    return bool(headers.get("X-Cache-Bypass")) or "no-cache" in headers.get("Cache-Control", "")
 
-    # cut the thinking part out
-    if "</think>" in content:
-        content = content.split("</think>")[-1].strip()
 
-    return jsonify({"content": content, "raw": data})
+def autofill_key(payload, tier, user_input):
+    """Same partial profile + model + tier + token limit -> same completion."""
+    return cache_key(f"{payload['model']}:{tier}:{payload['max_tokens']}", user_input)
 
 
-BOSON_API_KEY = "fdjshifohudsoiaf"
-client = openai.Client(
-    api_key=BOSON_API_KEY,
-    base_url="http://37.120.212.230:55843/v1"
-)
+def finish_reason(data):
+    return (data.get("choices") or [{}])[0].get("finish_reason")
 
-def getResponse(audio, character) -> str:
-    audio_base64 = base64.b64encode(audio).decode("utf-8")
 
-    response = client.chat.completions.create(
-        model="higgs-audio-understanding-7b-v1.0",
-        messages=[
-            # The model can also act as a general purpose chat model.
-            # It can understand user's questions and directly generate text responses.
-            {"role": "system",   "content": f"""You are to roleplay as a fictional character."""
-                f"""Follow the character’s personality, backstory, traits, and description strictly. Stay in character at all times. """
-                f"""Character Name: {character['name']} """
-                f"""Appearance / Description: {character['description']} """
-                f"""Personality: {character['personality']} """
-                f"""Backstory: {character['backstory']} """
-                f"""Core Traits: {", ".join(character['traits'])} """
-                f"""Dialogue Style: Speak with a {character['voice']} tone. Use empathetic and supportive language. """
-                f"""Rules: """
-                f"""1. Always respond as {character['name']}. """
-                f"""2. Never break character or mention that you are an AI. """
-                f"""3. Base your answers on {character['name']}'s perspective, knowledge, and worldview. """
-                f"""4. When uncertain, improvise in a way consistent with the backstory and traits. """
-                f"""Always output exactly ONE string with this format: <user>caption</user><response></response>. """
-                f"""Format Rules: (1) The caption is a faithful transcription of the user's audio, in their language. """
-                f"""(2) Immediately after the caption, output the literal token </user>. """
-                f"""(3) Immediately after </user><response>, output your response. """
-                f"""(4) There must be exactly one <user>, </user>, <response>, and </response>. """
-                f"""(5) Do not wrap in quotes, code blocks, or add newlines. """
-                f"""(6) If audio is unintelligible, caption as [inaudible]. """
-                f"""(7) If no speech, caption as [no speech]. """
-                f"""Examples: User Input: Hi, how was your day? → """
-                f"""Output: <user>Hi, how was your day?</user><response>Hello! I'm great—how about you?</response> """
-                f"""User Input: ¿Puedes poner un recordatorio para mañana? → """
-                f"""Output: <user>¿Puedes poner un recordatorio para mañana?</user><response>¡Claro! ¿A qué hora te gustaría el recordatorio?</resonse> """
-                f"""User Input: [garbled audio] → Output: <user>[inaudible]</user><response>Sorry, I couldn’t catch that. Could you repeat more clearly?</response>"""},
+def autofill_cacheable(data, content):
+    # 只快取正常結束的回答；被 max_tokens 截斷的可能只是半截 JSON 或推理文字
+    return bool(content) and finish_reason(data) == "stop"
+
+
+@app.route("/api/autofill", methods=["POST"])
+def autofill():
+    try:
+        body = json_body(request.get_data())
+        tier = resolve_tier(body, request.headers)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_input = body.get("character_partial", "")
+    payload = autofill_payload(user_input, body.get("max_tokens", 4096), tier)
+
+    # Same partial profile + model + tier + max_tokens -> same completion; skip the upstream call.
+    key = autofill_key(payload, tier, user_input)
+    bypass = cache_bypassed(request.headers)
+    if bypass:
+        autofill_cache.note_bypass()
+    else:
+        cached = autofill_cache.get(key)
+        if cached is not None:
+            return jsonify(cached), 200, {"X-Cache": "HIT"}
+
+    try:
+        data = upstream_flight.do("autofill:" + key, lambda: upstream.chat_completion("qwen", payload))
+    except UpstreamError as e:
+        return jsonify({"error": str(e)}), 502
+    print(data)
+    record_reasoning("/api/autofill", tier, payload["model"], *completion_reasoning(data))
+    content = strip_think(data, tier)
+
+    result = {"content": content, "raw": data}
+    if autofill_cacheable(data, content):
+        autofill_cache.put(key, result)
+    return jsonify(result), 200, {"X-Cache": "BYPASS" if bypass else "MISS"}
+
+
+def turn_payload(audio, character, history=()):
+    audio_base64 = base64.b64encode(audio).decode("utf-8")
+    return {
+        "model": "higgs-audio-understanding-7b-v1.0",
+        "messages": [
+            # Static rules first, character block last: keeps a shared prefix for upstream caching.
+            {"role": "system", "content": prompt_compiler.compile("turn", character).text},
+            *history,
             {
                 "role": "user",
                 "content": [
@@ -180,51 +343,320 @@ def getResponse(audio, character) -> str:
                 ],
             },
         ],
-        max_completion_tokens=256,
-        temperature=0.0,
-    )
+        "max_completion_tokens": 256,
+        "temperature": 0.0,
+    }
+
+
+def getResponse(audio, character, history=()) -> list:
+    return upstream.chat_completion("boson", turn_payload(audio, character, history)).get("choices", [])
+
+
+def parse_turn_reply(replies):
+    """Return (user_caption, bot_reply) from the first well-formed choice, or None."""
+    for reply in replies:
+        reply = reply.get("message", {}).get("content") or ""
+        # 容忍 </resonse> 之類拼錯的結束標籤
+        parsed = parse_turn(reply)
+        if parsed is None:
+            print(f"Bad reply: {reply}")
+            continue
+
+        user_caption, bot_reply = parsed
+        print(f"User: {user_caption}")
+        print(f"Bot: {bot_reply}")
+        return user_caption, bot_reply
+    return None
+
+
+def turn_result(session_id, parsed, audio, upstream_ms):
+    """Record the exchange and build the /api/turn response body."""
+    ingest_stats.record(audio, upstream_ms)
+    print(f"Audio: {audio.bytes_in} -> {audio.bytes_out} bytes, "
+          f"preprocess {audio.elapsed_ms:.1f}ms, upstream {upstream_ms:.1f}ms")
+    user_caption, bot_reply = parsed or ("[inaudible]", INAUDIBLE_REPLY)
+    if parsed:
+        session_store.append(session_id, ("user", user_caption), ("assistant", bot_reply))
+    return {
+        "user": user_caption,
+        "bot": bot_reply,
+        "session_id": session_id,
+        "audio": {
+            "bytes_in": audio.bytes_in,
+            "bytes_out": audio.bytes_out,
+            "preprocess_ms": round(audio.elapsed_ms, 2),
+            "upstream_ms": round(upstream_ms, 2),
+        },
+        "ts": datetime.utcnow().isoformat() + "Z",
+    }
+
+def turn_upload():
+    """
+    (audio stream, fields) of a /api/turn request: a raw audio/* body with
+    the fields in the query string (what the frontend sends), decoded as it
+    is read and never buffered whole; or the `audio` part of multipart
+    form-data, which werkzeug spools first (to disk past 500 KiB).
+    """
+    if request.mimetype in RAW_AUDIO_TYPES:
+        chunked = "chunked" in request.headers.get("Transfer-Encoding", "").lower()
+        return (request.stream if request.content_length or chunked else None), request.args
+    f = request.files.get("audio")
+    return (f.stream if f else None), request.form
+
+
+def turn_character(fields):
+    """
+    The character of a /api/turn request: looked up by `character_id` (what
+    the frontend sends, so the query string stays short) or given whole as
+    `character_json`. Raises ValueError for an unknown id or bad JSON.
+    """
+    character_id = fields.get("character_id")
+    if character_id:
+        character = character_manager.get_character(character_id)
+        if character is None:
+            raise ValueError(f"unknown character_id: {character_id}")
+        return character.to_dict()
+    return json.loads(fields.get("character_json", "{}"))
 
-    return response.choices
 
 @app.route("/api/turn", methods=["POST"])
 def api_turn():
-    if "audio" not in request.files:
-        return jsonify({"error": "no 'audio' file in form-data"}), 400
-    f = request.files["audio"]
-    audio_bytes = f.read()
-    character_json = json.loads(request.form.get("character_json", "{}"))
-    print(character_json)
+    stream, fields = turn_upload()
+    if stream is None:
+        return jsonify({"error": NO_AUDIO}), 400
+    try:
+        character_json = turn_character(fields)
+        print(character_json)
+        session_id, history = open_session(fields, character_json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        audio = preprocess(stream)
+        upstream_start = time.perf_counter()
+        replies = getResponse(audio.data, character_json, history)
+        upstream_ms = (time.perf_counter() - upstream_start) * 1000
+        return jsonify(turn_result(session_id, parse_turn_reply(replies), audio, upstream_ms))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def turn_event(kind, text):
+    """SSE for one TurnParser event: `event: caption` first, then plain content chunks."""
+    if kind == "caption":
+        return sse({"user": text}, event="caption")
+    return sse({"content": text})
+
+
+class TurnStreamRelay:
+    """Upstream deltas -> SSE events of one /api/turn/stream response, shared like ChatStreamRelay."""
+
+    def __init__(self, session_id, audio, start, upstream_start):
+        self.session_id = session_id
+        self.audio = audio
+        self.start = start
+        self.upstream_start = upstream_start
+        self.parser = TurnParser()
+        self.raw = []
+        self.caption_ms = None
+
+    def feed(self, delta):
+        text = delta.get("content") or ""
+        self.raw.append(text)
+        events = []
+        for kind, piece in self.parser.feed(text):
+            if kind == "caption":
+                self.caption_ms = (time.perf_counter() - self.start) * 1000
+                turn_stream_caption.observe(self.caption_ms, True)
+            events.append(turn_event(kind, piece))
+        return events
+
+    def finish(self):
+        """Closing events: any held-back text, the fallback reply, then `done`."""
+        events = [turn_event(kind, text) for kind, text in self.parser.flush()]
+        upstream_ms = (time.perf_counter() - self.upstream_start) * 1000
+        parsed = self.parser.result()
+        if parsed is None:
+            print(f"Bad reply: {''.join(self.raw)}")
+            events += [turn_event("caption", "[inaudible]"), turn_event("response", INAUDIBLE_REPLY)]
+        else:
+            print(f"User: {parsed[0]}")
+            print(f"Bot: {parsed[1]}")
+        body = turn_result(self.session_id, parsed, self.audio, upstream_ms)
+        body["caption_ms"] = round(self.caption_ms, 2) if self.caption_ms is not None else None
+        body["total_ms"] = round((time.perf_counter() - self.start) * 1000, 2)
+        events.append(sse(body, event="done"))
+        return events
+
+    def close(self):
+        if self.caption_ms is None:
+            turn_stream_caption.observe((time.perf_counter() - self.start) * 1000, False)
+
+
+@app.route("/api/turn/stream", methods=["POST"])
+def api_turn_stream():
+    """
+    Same as /api/turn but streamed as server-sent events: `event: caption`
+    with `{"user": ...}` as soon as the model closes the caption, then
+    `data: {"content": "..."}` per reply chunk, then `event: done` with the
+    /api/turn body plus timings.
+    """
+    start = time.perf_counter()
+    stream, fields = turn_upload()
+    if stream is None:
+        return jsonify({"error": NO_AUDIO}), 400
     try:
-        replies = getResponse(audio_bytes, character_json)
-        for reply in replies:
-            reply = reply.message.content
-            if "</user><response>" in reply:
-                reply = reply.split("</user><response>")
-                user_caption = reply[0].strip().replace("<user>", "")
-                bot_reply = reply[1].strip().replace("</response>", "")
-            else:
-                print(f"Bad reply: {reply}")
-                continue
-
-            print(f"User: {user_caption}")
-            print(f"Bot: {bot_reply}")
-            return jsonify({"user": user_caption, "bot": bot_reply, "ts": datetime.utcnow().isoformat() + "Z"})
-        return jsonify({"user": "[inaudible]", "bot": "Sorry, I couldn’t catch that. Could you repeat more clearly?", "ts": datetime.utcnow().isoformat() + "Z"})
+        character_json = turn_character(fields)
+        session_id, history = open_session(fields, character_json)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        audio = preprocess(stream)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    upstream_start = time.perf_counter()
+    payload = {**turn_payload(audio.data, character_json, history), "stream": True}
+    try:
+        r = upstream.post("boson", payload, stream=True)
+    except UpstreamError as e:
+        return jsonify({"error": str(e)}), 502
+    if r.status_code != 200:
+        return jsonify({"error": f"upstream returned {r.status_code}", "raw": r.text}), 502
+
+    def generate():
+        relay = TurnStreamRelay(session_id, audio, start, upstream_start)
+        try:
+            for delta in iter_deltas(r):
+                yield from relay.feed(delta)
+            yield from relay.finish()
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+        finally:
+            r.close()
+            relay.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/upstream/stats", methods=["GET"])
+def upstream_stats():
+    """上游連接池與延遲統計"""
+    return jsonify({
+        "success": True,
+        "data": upstream_stats_data(),
+        "message": "上游統計獲取成功"
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus 文本格式的指標"""
+    return Response(metrics.registry.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+
+def upstream_stats_data():
+    return {
+        **upstream.metrics(),
+        "chat_stream_first_token": chat_stream_first_token.snapshot(),
+        "turn_stream_caption": turn_stream_caption.snapshot(),
+        "prompt_cache": prompt_compiler.stats(),
+        "sessions": session_store.stats(),
+        "autofill_cache": autofill_cache.stats(),
+        "single_flight": upstream_flight.stats(),
+        "audio_ingest": ingest_stats.snapshot(),
+        "voice_jobs": voice_jobs.stats(),
+        "voice_cache": voice_cache.stats(),
+        "voice_downloads": download_stats.snapshot(),
+        "reasoning_tiers": tier_stats.snapshot(),
+    }
 
 # 初始化角色管理器
 character_manager = CharacterManager()
+# 開啟聲音樣本任務表與快取，啟動工作池並接手上次未完成的任務
+voice_jobs = get_voice_jobs()
+voice_cache = get_voice_cache()
+voice_jobs.start()
+# 多副本上游的後台健康檢查
+upstream.start_health_checks()
+
+# 角色列表的編碼結果快取，以快照版本號失效
+# ETag 帶上進程隨機前綴，重啟後不會與舊版本號衝突
+_listing_epoch = uuid.uuid4().hex[:8]
+_listing_cache = {"version": None, "etag": None, "body": None}
+_listing_lock = threading.Lock()
+
+
+def _listing_etag(version):
+    return f"{_listing_epoch}-{version}"
+
+
+def _encoded_listing(snapshot):
+    version = snapshot.version
+    with _listing_lock:
+        if _listing_cache["version"] != version:
+            start = time.perf_counter()
+            body = json.dumps({
+                "success": True,
+                "data": [char.to_dict() for char in snapshot.characters.values()],
+                "message": "角色列表獲取成功"
+            }, ensure_ascii=False).encode("utf-8")
+            metrics.observe_serialization("/api/characters", time.perf_counter() - start)
+            _listing_cache.update(version=version, etag=_listing_etag(version), body=body)
+        return _listing_cache["etag"], _listing_cache["body"]
+
+
+def _paging_args():
+    """解析 fields= / limit= / cursor= 參數；非法時拋出 ValueError"""
+    fields = request.args.get('fields')
+    if fields:
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in CHARACTER_FIELDS]
+        if unknown:
+            raise ValueError(f"未知欄位: {', '.join(unknown)}")
+    else:
+        fields = None
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        raise ValueError("limit 必須大於 0")
+    return fields, request.args.get('cursor') or None, limit
+
 
 # API路由
 @app.route('/api/characters', methods=['GET'])
 def get_characters():
-    """獲取所有角色"""
+    """獲取所有角色（可選 fields= 投影與 limit=/cursor= 游標分頁）"""
+    # 先應用其他 worker 的寫入，版本號才是最新的
+    character_manager.refresh()
+    # 整個請求使用同一個快照，ETag 與內容一定對應
+    snapshot = character_manager.snapshot
+    # 輪詢命中時直接 304，不做任何序列化
+    etag = _listing_etag(snapshot.version)
+    if request.query_string:
+        etag += f"-{zlib.crc32(request.query_string):08x}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    if not request.query_string:
+        etag, body = _encoded_listing(snapshot)
+        return Response(body, mimetype="application/json", headers={**headers, "ETag": f'"{etag}"'})
+
+    try:
+        fields, cursor, limit = _paging_args()
+        if limit is None and cursor is None:
+            characters, next_cursor = list(snapshot.characters.values()), None
+        else:
+            characters, next_cursor = character_manager.page_characters(cursor, limit or 50, snapshot)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"參數錯誤: {str(e)}"
+        }), 400
     return jsonify({
         "success": True,
-        "data": character_manager.get_all_characters(),
+        "data": [char.to_dict(fields) for char in characters],
+        "next_cursor": next_cursor,
         "message": "角色列表獲取成功"
-    })
+    }), 200, headers
 
 @app.route('/api/characters/<character_id>', methods=['GET'])
 def get_character(character_id):
@@ -242,6 +674,22 @@ def get_character(character_id):
             "message": "角色不存在"
         }), 404
 
+@app.route('/api/characters/<character_id>/voice-status', methods=['GET'])
+def get_voice_status(character_id):
+    """查詢角色聲音樣本的背景下載狀態"""
+    if character_manager.get_character(character_id) is None:
+        return jsonify({
+            "success": False,
+            "message": "角色不存在"
+        }), 404
+    # 沒有任務記錄（例如隊列上線前創建的角色）時返回 none
+    status = voice_jobs.status(character_id) or {"status": "none"}
+    return jsonify({
+        "success": True,
+        "data": status,
+        "message": "聲音狀態獲取成功"
+    })
+
 @app.route('/api/characters', methods=['POST'])
 def create_character():
     """創建新角色"""
@@ -250,17 +698,24 @@ def create_character():
         data = request.get_json()
         print(data)
         character = character_manager.create_character(data)
-        return jsonify({
-            "success": True,
-            "data": character.to_dict(),
-            "message": "角色創建成功"
-        }), 201
     except Exception as e:
         print(e)
         return jsonify({
             "success": False,
             "message": f"創建角色失敗: {str(e)}"
         }), 400
+    try:
+        voice_status = voice_jobs.status(character.id)
+    except Exception as e:
+        # 角色已創建；聲音狀態之後可由 voice-status 查詢
+        print(f"查詢聲音狀態時出錯: {e}")
+        voice_status = None
+    return jsonify({
+        "success": True,
+        "data": character.to_dict(),
+        "voice_status": voice_status,
+        "message": "角色創建成功"
+    }), 201
 
 @app.route('/api/characters/<character_id>', methods=['PUT'])
 def update_character(character_id):
@@ -290,6 +745,7 @@ def update_character(character_id):
 def delete_character(character_id):
     """刪除角色"""
     if character_manager.delete_character(character_id):
+        prompt_compiler.invalidate(character_id)
         return jsonify({
             "success": True,
             "message": "角色刪除成功"
@@ -303,47 +759,42 @@ def delete_character(character_id):
 @app.route('/api/characters/search', methods=['GET'])
 def search_characters():
     """搜索角色"""
-    query = request.args.get('q', '').lower()
-    characters = character_manager.get_all_characters()
-    
-    if query:
-        filtered_characters = []
-        for char in characters:
-            if (query in char['name'].lower() or 
-                query in char['personality'].lower() or 
-                any(query in trait.lower() for trait in char['traits'])):
-                filtered_characters.append(char)
-        characters = filtered_characters
+    query = request.args.get('q', '')
+    try:
+        fields, cursor, limit = _paging_args()
+        # 搜索結果按相關度排序，游標即結果中的偏移量
+        offset = int(cursor) if cursor else request.args.get('offset', 0, type=int)
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"參數錯誤: {str(e)}"
+        }), 400
+    offset = max(offset, 0)
+    total, characters = character_manager.search_characters(query, offset=offset, limit=limit)
+    end = offset + len(characters)
     
     return jsonify({
         "success": True,
-        "data": characters,
-        "message": f"搜索完成，找到 {len(characters)} 個角色"
+        "data": [char.to_dict(fields) for char in characters],
+        "total": total,
+        "offset": offset,
+        "next_cursor": str(end) if limit is not None and end < total else None,
+        "message": f"搜索完成，找到 {total} 個角色"
     })
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """獲取統計信息"""
-    characters = character_manager.get_all_characters()
-    voice_stats = {}
-    trait_stats = {}
-    
-    for char in characters:
-        # 統計聲音類型
-        voice = char['voice']
-        voice_stats[voice] = voice_stats.get(voice, 0) + 1
-        
-        # 統計特質
-        for trait in char['traits']:
-            trait_stats[trait] = trait_stats.get(trait, 0) + 1
+    character_manager.refresh()
+    snapshot = character_manager.snapshot
+    data = character_manager.get_stats(snapshot)
+    # ?verify=1 在同一個快照上比對增量統計與完整重算結果
+    if request.args.get('verify'):
+        data["consistent"] = data == character_manager.recompute_stats(snapshot)
     
     return jsonify({
         "success": True,
-        "data": {
-            "total_characters": len(characters),
-            "voice_distribution": voice_stats,
-            "trait_distribution": trait_stats
-        },
+        "data": data,
         "message": "統計信息獲取成功"
     })
 
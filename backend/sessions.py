@@ -0,0 +1,134 @@
+"""
+Server-side conversation history for /api/chat and /api/turn.
+
+Each session keeps a ring buffer of its most recent messages together with
+their estimated token counts. Sessions live in one global LRU that is bounded
+by total message bytes and drops sessions that have been idle too long, so the
+store's memory stays flat no matter how many clients come and go. Only
+requests that carry a client-chosen `session_id` use the store (see
+`server.open_session`); the rest are stateless.
+
+  SESSION_MAX_MESSAGES    ring-buffer length per session (default 64)
+  SESSION_MAX_BYTES       memory cap for all sessions (default 64 MiB)
+  SESSION_IDLE_SECONDS    idle sessions older than this are evicted (default 3600)
+  SESSION_HISTORY_TOKENS  default history budget per upstream call (default 2048)
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from prompts import estimate_tokens
+
+MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", "64"))
+MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "3600"))
+HISTORY_TOKENS = int(os.environ.get("SESSION_HISTORY_TOKENS", "2048"))
+
+
+class Session:
+    def __init__(self, id, character_id=None, max_messages=MAX_MESSAGES):
+        self.id = id
+        self.character_id = character_id
+        self.messages = deque(maxlen=max_messages)  # (role, content, tokens, nbytes)
+        self.tokens = 0
+        self.nbytes = 0
+        self.last_used = time.monotonic()
+
+    def append(self, role, content):
+        """Add a message; returns the byte delta (the oldest message may fall off)."""
+        before = self.nbytes
+        if len(self.messages) == self.messages.maxlen:
+            _, _, old_tokens, old_bytes = self.messages[0]
+            self.tokens -= old_tokens
+            self.nbytes -= old_bytes
+        nbytes = len(content.encode("utf-8"))
+        tokens = estimate_tokens(content)
+        self.messages.append((role, content, tokens, nbytes))
+        self.tokens += tokens
+        self.nbytes += nbytes
+        return self.nbytes - before
+
+    def window(self, budget):
+        """Newest messages whose estimated tokens fit `budget`, oldest first."""
+        picked = []
+        used = 0
+        for role, content, tokens, _ in reversed(self.messages):
+            if used + tokens > budget:
+                break
+            picked.append({"role": role, "content": content})
+            used += tokens
+        picked.reverse()
+        return picked
+
+
+class SessionStore:
+    def __init__(self, max_bytes=MAX_BYTES, idle_seconds=IDLE_SECONDS, max_messages=MAX_MESSAGES):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.max_messages = max_messages
+        self.sessions = OrderedDict()  # least recently used first
+        self.nbytes = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, session_id):
+        session = self.sessions.pop(session_id)
+        self.nbytes -= session.nbytes
+        self.evicted += 1
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if self.nbytes <= self.max_bytes and now - oldest.last_used < self.idle_seconds:
+                break
+            self._drop(oldest_id)
+
+    def open(self, session_id=None, character_id=None):
+        """
+        Return the id of an existing session, or start a new one.
+
+        A session is bound to one character: reusing its id with a different
+        character starts a fresh history.
+        """
+        with self._lock:
+            session = self.sessions.get(session_id) if session_id else None
+            if session is not None and character_id and session.character_id != character_id:
+                self.nbytes -= session.nbytes
+                del self.sessions[session_id]
+                session = None
+            if session is None:
+                session_id = session_id or uuid.uuid4().hex
+                session = Session(session_id, character_id, self.max_messages)
+                self.sessions[session_id] = session
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            self._evict()
+            return session_id
+
+    def history(self, session_id, budget=HISTORY_TOKENS):
+        with self._lock:
+            session = self.sessions.get(session_id)
+            return session.window(budget) if session else []
+
+    def append(self, session_id, *messages):
+        """Append (role, content) pairs; silently ignored if the session was evicted meanwhile."""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            for role, content in messages:
+                self.nbytes += session.append(role, content)
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self.sessions), "bytes": self.nbytes, "evicted": self.evicted}
+
+
+session_store = SessionStore()
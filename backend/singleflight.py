@@ -0,0 +1,102 @@
+"""
+Single-flight coalescing for identical concurrent upstream calls.
+
+The first caller for a key runs the upstream call; callers that arrive with
+the same key while it is in flight wait for it and get the same result (or
+the same exception) instead of issuing their own completion.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+
+
+def payload_key(payload):
+    """Stable hash of a JSON request payload."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run `fn()` once per key among concurrent callers and share its outcome."""
+        with self._lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+upstream_flight = SingleFlight()
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of `SingleFlight` for the ASGI serving mode."""
+
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Await `fn()` once per key among concurrent callers and share its outcome.
+
+        The call runs as its own task, so a caller that disconnects (and is
+        cancelled) does not cancel the upstream call for the others.
+        """
+        task = self.calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = self.calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self.calls.pop(key, None))
+            self.leaders += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+async_upstream_flight = AsyncSingleFlight()
@@ -0,0 +1,308 @@
+"""
+Pluggable persistence for CharacterManager.
+
+Both backends store the `Character.to_dict()` records and expose the same
+small interface:
+
+  load()                  -> records in insertion order, streamed one at a time
+  seed(records)           -> store `records` if the store is empty; returns (streams) what is stored
+  upsert(record, characters) / delete(id, characters)
+                          -> persist one change (`characters` is the manager's
+                             id -> Character map, needed only by the JSON backend)
+  changed()               -> cheap check whether another process may have written
+  poll()                  -> changes written by other processes since the last
+                             load/poll as [(id, record or None)], or None when
+                             the caller must reload everything
+
+JSONStorage keeps the original characters.json format and rewrites the file
+(atomically) on every write; it is meant for a single process. SQLiteStorage
+keeps one row per character in a WAL-mode database, so writes touch one row
+and several worker processes can share the file. Each write also appends to a
+change log, which `poll()` replays so every process's in-memory view
+converges on the database.
+
+  CHARACTER_STORE   "json" (default) or "sqlite"
+  CHARACTER_DB      SQLite database path (default ./characters.db)
+
+The first time SQLiteStorage opens an empty database it imports
+characters.json. To migrate explicitly:
+
+  python storage.py migrate [characters.json] [characters.db]
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+DATA_FILE = "./characters.json"
+STORE = os.environ.get("CHARACTER_STORE", "json")
+DB_FILE = os.environ.get("CHARACTER_DB", "./characters.db")
+
+CHANGE_LOG_KEEP = 10000   # change-log rows kept for lagging processes
+PRUNE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    id   TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+_WS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the
+    file in chunks instead of parsing it into one big list first.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill(buf, pos):
+            chunk = f.read(chunk_size)
+            return buf[pos:] + chunk, 0, not chunk
+
+        while not eof and not buf.strip():
+            buf, pos, eof = fill(buf, pos)
+        pos = _WS.match(buf, pos).end()
+        if not buf[pos:pos + 1] == "[":
+            raise ValueError(f"{path}: expected a JSON array")
+        pos += 1
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos == len(buf):
+                if eof:
+                    raise ValueError(f"{path}: unterminated JSON array")
+                buf, pos, eof = fill(buf, pos)
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos, eof = fill(buf, pos)
+                continue
+            if end == len(buf) and not eof:
+                # 可能是被切斷的數字等標量，補充數據後重新解析
+                buf, pos, eof = fill(buf, pos)
+                continue
+            yield item
+            pos = end
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return iter(())
+    return iter_json_array(path)
+
+
+class JSONStorage:
+    def __init__(self, path=DATA_FILE):
+        self.path = path
+
+    def load(self):
+        """逐個產生記錄；文件損壞時保留已讀到的部分"""
+        try:
+            yield from _read_json(self.path)
+        except Exception as e:
+            print(f"載入數據時出錯: {e}")
+
+    def save_all(self, records):
+        """寫入臨時文件後原子替換，寫入中途失敗不會留下半個文件"""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(records), f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"保存數據時出錯: {e}")
+
+    def seed(self, records):
+        self.save_all(records)
+        return records
+
+    def upsert(self, record, characters):
+        self.save_all(char.to_dict() for char in characters.values())
+
+    def delete(self, id, characters):
+        self.save_all(char.to_dict() for char in characters.values())
+
+    def changed(self):
+        return False
+
+    def poll(self):
+        return []
+
+
+class SQLiteStorage:
+    def __init__(self, path=DB_FILE, migrate_from=DATA_FILE):
+        self.path = path
+        self.migrate_from = migrate_from
+        # 已應用到內存的最後一條變更序號；同一進程內各線程共享
+        self.cursor = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: 自行以 BEGIN IMMEDIATE 控制事務
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.data_version = None
+        return conn
+
+    def _transaction(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _head(conn):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _rows(self):
+        """在同一個讀事務中取得變更游標並逐行產生記錄"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            with self._lock:
+                self.cursor = self._head(conn)
+            for (data,) in conn.execute("SELECT data FROM characters ORDER BY rowid"):
+                yield json.loads(data)
+        finally:
+            conn.execute("COMMIT")
+
+    def _import(self, conn, records):
+        rows = [(r["id"], _encode(r)) for r in records]
+        conn.executemany(
+            "INSERT INTO characters (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data", rows)
+        conn.executemany("INSERT INTO changes (id) VALUES (?)", [(id,) for id, _ in rows])
+
+    def load(self):
+        def migrate(conn):
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+                return
+            if self.migrate_from and not conn.execute("SELECT 1 FROM characters LIMIT 1").fetchone():
+                self._import(conn, _read_json(self.migrate_from))
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?)", (self.migrate_from or "",))
+
+        self._transaction(migrate)
+        return self._rows()
+
+    def seed(self, records):
+        """只有在表為空時寫入；多個進程同時啟動時只有一個會成功，其餘讀回它的結果"""
+        def seed(conn):
+            if not conn.execute("SELECT 1 FROM characters LIMIT 1").fetchone():
+                self._import(conn, records)
+
+        self._transaction(seed)
+        return self._rows()
+
+    def _write(self, id, data):
+        def write(conn):
+            head = self._head(conn)
+            if data is None:
+                conn.execute("DELETE FROM characters WHERE id = ?", (id,))
+            else:
+                conn.execute("INSERT INTO characters (id, data) VALUES (?, ?) "
+                             "ON CONFLICT(id) DO UPDATE SET data = excluded.data", (id, data))
+            seq = conn.execute("INSERT INTO changes (id) VALUES (?)", (id,)).lastrowid
+            if seq % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_LOG_KEEP,))
+            return head, seq
+
+        with self._lock:
+            head, seq = self._transaction(write)
+            # 期間沒有其他進程寫入時直接前移游標，避免下次 poll 重放自己的寫入
+            if head == self.cursor:
+                self.cursor = seq
+
+    def upsert(self, record, characters=None):
+        self._write(record["id"], _encode(record))
+
+    def delete(self, id, characters=None):
+        self._write(id, None)
+
+    def changed(self):
+        """data_version 只在其他連接提交後改變，沒有外部寫入時不必查詢變更表"""
+        conn = self._conn()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._local.data_version:
+            return False
+        self._local.data_version = version
+        return True
+
+    def poll(self):
+        conn = self._conn()
+        with self._lock:
+            rows = conn.execute(
+                "SELECT c.seq, c.id, ch.data FROM changes c LEFT JOIN characters ch ON ch.id = c.id "
+                "WHERE c.seq > ? ORDER BY c.seq", (self.cursor,)).fetchall()
+            if not rows:
+                return []
+            if rows[0][0] != self.cursor + 1:
+                return None  # 變更日誌已被裁剪，需要完整重新載入
+            self.cursor = rows[-1][0]
+        latest = {}
+        for _, id, data in rows:
+            latest[id] = json.loads(data) if data is not None else None
+        return list(latest.items())
+
+
+def open_storage(kind=STORE):
+    if kind == "sqlite":
+        return SQLiteStorage()
+    if kind == "json":
+        return JSONStorage()
+    raise ValueError(f"unknown CHARACTER_STORE '{kind}'")
+
+
+def migrate(json_path=DATA_FILE, db_path=DB_FILE):
+    """One-shot import of characters.json into a SQLite database; returns the number of rows stored."""
+    store = SQLiteStorage(db_path, migrate_from=None)
+    records = _read_json(json_path)
+
+    def run(conn):
+        store._import(conn, records)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (json_path,))
+        return conn.execute("SELECT COUNT(*) FROM characters").fetchone()[0]
+
+    return store._transaction(run)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        sys.exit("usage: python storage.py migrate [characters.json] [characters.db]")
+    count = migrate(*sys.argv[2:4])
+    print(f"migrated {count} characters")
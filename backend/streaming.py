@@ -0,0 +1,206 @@
+"""
+Helpers for proxying OpenAI-style streaming completions to the browser as SSE.
+"""
+
+import json
+import re
+
+THINK_END = "</think>"
+
+
+class ThinkStripper:
+    """
+    Incrementally drops the hidden reasoning from a thinking-model stream.
+
+    Everything up to and including `</think>` is discarded; the tag may be split
+    across chunks, so only the tail that could still be a tag prefix is held back.
+    If the stream ends without a `</think>` the buffered text is released, which
+    matches the non-streaming `content.split("</think>")[-1]` behaviour, unless
+    max_tokens cut the completion off (`flush(truncated=True)`): then it is
+    unfinished reasoning and is dropped, as `server.strip_think` does.
+
+    When the upstream separates reasoning itself (vLLM's reasoning parser puts it
+    in `delta.reasoning_content`), call `mark_reasoning_separated()` and content
+    passes straight through. `reasoning=False` (a tier with reasoning switched
+    off, whose stream never has a `</think>`) does the same from the start.
+    """
+
+    def __init__(self, reasoning=True):
+        self.parts = []  # held-back reasoning, only released if </think> never comes
+        self.tail = ""   # last few chars, in case the tag straddles two chunks
+        self.in_answer = not reasoning
+        self._leading = True  # strip whitespace between </think> and the answer
+
+    def mark_reasoning_separated(self):
+        if not self.in_answer and not self.parts:
+            self.in_answer = True
+
+    def _visible(self, text):
+        if self._leading:
+            text = text.lstrip()
+            if text:
+                self._leading = False
+        return text
+
+    def feed(self, text):
+        """Return the visible part of `text` (may be empty)."""
+        if self.in_answer:
+            return self._visible(text)
+        window = self.tail + text
+        idx = window.find(THINK_END)
+        if idx == -1:
+            self.parts.append(text)
+            self.tail = window[-(len(THINK_END) - 1):]
+            return ""
+        self.parts, self.tail = [], ""
+        self.in_answer = True
+        return self._visible(window[idx + len(THINK_END):])
+
+    def flush(self, truncated=False):
+        """Called at end of stream; returns any text that was never closed by </think>."""
+        if self.in_answer:
+            return ""
+        text = "" if truncated else "".join(self.parts)
+        self.parts, self.tail = [], ""
+        self.in_answer = True
+        return self._visible(text.strip())
+
+
+# Any closing tag ends the reply, so misspelt ones like </resonse> are tolerated.
+CLOSE_TAG_RE = re.compile(r"</\s*\w*\s*>")
+# A "<" that may still grow into a closing tag once more text arrives.
+PARTIAL_TAG_RE = re.compile(r"<(/\s*\w{0,16}\s*)?$")
+CAPTION_END_RE = re.compile(r"</\s*user\s*>|<\s*response\s*>", re.IGNORECASE)
+RESPONSE_OPEN = "<response>"
+
+
+class TurnParser:
+    """
+    Incrementally splits the understanding model's
+    `<user>caption</user><response>reply</response>` output.
+
+    `feed()` returns a list of events: `("caption", text)` once, as soon as the
+    caption is closed, then `("response", text)` pieces as the reply streams
+    in. The caption ends at `</user>` or, if that is missing, at `<response>`;
+    the reply ends at the first closing tag of any spelling. Text that could
+    be the start of a tag is held back until it is decided.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.state = "caption"  # caption -> open (expecting <response>) -> response -> done
+        self.caption = None
+        self.parts = []
+
+    def feed(self, text):
+        self.buf += text
+        events = []
+        if self.state == "caption":
+            match = CAPTION_END_RE.search(self.buf)
+            if not match:
+                return events
+            self.caption = self.buf[:match.start()].replace("<user>", "").strip()
+            events.append(("caption", self.caption))
+            opened = match.group().lower().startswith("<r")
+            self.buf = self.buf[match.end():]
+            self.state = "response" if opened else "open"
+        if self.state == "open":
+            rest = self.buf.lstrip()
+            if RESPONSE_OPEN.startswith(rest.lower()):
+                return events  # still could be <response>
+            if rest.lower().startswith(RESPONSE_OPEN):
+                rest = rest[len(RESPONSE_OPEN):]
+            self.buf = rest
+            self.state = "response"
+        if self.state == "response":
+            match = CLOSE_TAG_RE.search(self.buf)
+            if match:
+                text, self.buf, self.state = self.buf[:match.start()], "", "done"
+            else:
+                partial = PARTIAL_TAG_RE.search(self.buf)
+                cut = partial.start() if partial else len(self.buf)
+                text, self.buf = self.buf[:cut], self.buf[cut:]
+            if not self.parts:
+                text = text.lstrip()
+            if text:
+                self.parts.append(text)
+                events.append(("response", text))
+        return events
+
+    def flush(self):
+        """End of stream: release held-back reply text (minus an unfinished tag)."""
+        events = []
+        if self.state in ("response", "open"):
+            text = PARTIAL_TAG_RE.sub("", self.buf).rstrip()
+            if self.state == "open":
+                text = text.lstrip()
+            if text:
+                self.parts.append(text)
+                events.append(("response", text))
+        self.buf, self.state = "", "done"
+        return events
+
+    def result(self):
+        """(caption, reply) once the caption was closed, else None."""
+        if self.caption is None:
+            return None
+        return self.caption, "".join(self.parts).strip()
+
+
+def parse_turn(text):
+    """Non-streaming `TurnParser`: (caption, reply) or None."""
+    parser = TurnParser()
+    parser.feed(text)
+    parser.flush()
+    return parser.result()
+
+
+def parse_sse_line(line):
+    """
+    Decode one upstream SSE line into `choices[0].delta`, plus the choice's
+    `finish_reason` when the chunk carries one.
+
+    Returns None for lines that carry no delta and the string "[DONE]" at the end.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return data
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return None
+    choice = (chunk.get("choices") or [{}])[0]
+    delta = choice.get("delta") or {}
+    if choice.get("finish_reason"):
+        delta = {**delta, "finish_reason": choice["finish_reason"]}
+    return delta
+
+
+def iter_deltas(response):
+    """Yield `choices[0].delta` dicts from an upstream `text/event-stream` response."""
+    for line in response.iter_lines():
+        delta = parse_sse_line(line)
+        if delta == "[DONE]":
+            return
+        if delta is not None:
+            yield delta
+
+
+async def aiter_deltas(response):
+    """Async counterpart of `iter_deltas` for an httpx streaming response."""
+    async for line in response.aiter_lines():
+        delta = parse_sse_line(line)
+        if delta == "[DONE]":
+            return
+        if delta is not None:
+            yield delta
+
+
+def sse(data, event=None):
+    """Encode one server-sent event."""
+    out = f"event: {event}\n" if event else ""
+    return out + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
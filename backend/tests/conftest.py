@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 測試直接 import backend 底下的模組，和 `python -m bench.X` 一樣從 backend/ 執行
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,86 @@
+"""CharacterManager keeps the published snapshot and its search index intact when a storage write fails."""
+
+import pytest
+
+from character import Character, CharacterManager
+
+
+class FlakyStorage:
+    """In-memory storage whose writes raise while `fail` is set."""
+
+    def __init__(self, records):
+        self.records = {r["id"]: r for r in records}
+        self.fail = False
+
+    def load(self):
+        return list(self.records.values())
+
+    def seed(self, records):
+        return records
+
+    def _check(self):
+        if self.fail:
+            raise OSError("disk full")
+
+    def upsert(self, record, characters=None):
+        self._check()
+        self.records[record["id"]] = record
+
+    def delete(self, id, characters=None):
+        self._check()
+        self.records.pop(id, None)
+
+    def changed(self):
+        return False
+
+    def poll(self):
+        return []
+
+
+@pytest.fixture
+def manager():
+    records = [Character(name=name, personality="calm", traits=[trait], id=name.lower()).to_dict()
+               for name, trait in (("Luna", "Helpful"), ("Alex", "Creative"))]
+    return CharacterManager(FlakyStorage(records))
+
+
+def ids(manager, query):
+    return [c.id for c in manager.search_characters(query)[1]]
+
+
+def listing(manager):
+    return [c.id for c in manager.page_characters()[0]]
+
+
+def test_failed_delete_keeps_character_searchable(manager):
+    manager.storage.fail = True
+    with pytest.raises(OSError):
+        manager.delete_character("luna")
+    assert "luna" in manager.characters
+    assert ids(manager, "luna") == ["luna"]
+    assert listing(manager) == ["luna", "alex"]
+    assert manager.verify_stats()
+
+    manager.storage.fail = False
+    assert manager.delete_character("luna")
+    assert ids(manager, "luna") == []
+    assert listing(manager) == ["alex"]
+
+
+def test_failed_update_keeps_old_fields_searchable(manager):
+    manager.storage.fail = True
+    with pytest.raises(OSError):
+        manager.update_character("alex", {"name": "Zed"})
+    assert manager.characters["alex"].name == "Alex"
+    assert ids(manager, "alex") == ["alex"]
+    assert ids(manager, "zed") == []
+    assert manager.verify_stats()
+
+
+def test_failed_create_leaves_no_trace(manager):
+    manager.storage.fail = True
+    with pytest.raises(OSError):
+        manager.create_character({"name": "Nova", "traits": ["Bold"]})
+    assert ids(manager, "nova") == []
+    assert listing(manager) == ["luna", "alex"]
+    assert manager.verify_stats()
@@ -0,0 +1,70 @@
+"""SearchIndex.search against a linear scan over the same characters."""
+
+import copy
+import random
+
+import pytest
+
+from character import Character
+from character_index import TOKEN_RE, SearchIndex
+
+WORDS = ["ann", "anna", "Bob", "bo", "brave", "cat", "Cats", "é", "naïve", "o'neil", "x-ray", "42", "the",
+         "scholar", "school", "cool"]
+
+
+def random_text(rng, words=3):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, words)))
+
+
+def random_character(rng, id):
+    return Character(name=random_text(rng), personality=random_text(rng, 6),
+                     traits=[random_text(rng, 2) for _ in range(rng.randint(0, 3))], id=id)
+
+
+def linear_search(query, characters):
+    query = query.lower()
+    word_query = bool(TOKEN_RE.fullmatch(query))
+    ranked = []
+    for character in characters.values():
+        fields = [character.name, character.personality, *character.traits]
+        if any(query in field.lower() for field in fields):
+            score = SearchIndex._score(character, query, word_query)
+            assert score, (query, fields)
+            ranked.append((-score, character.name.lower(), character.id))
+    ranked.sort()
+    return [character_id for _, _, character_id in ranked]
+
+
+def random_query(rng, characters):
+    character = rng.choice(list(characters.values()))
+    text = rng.choice([character.name, character.personality, *character.traits, random_text(rng, 2)])
+    if not text:
+        return rng.choice(WORDS)
+    i = rng.randrange(len(text))
+    query = text[i:i + rng.randint(1, 8)]
+    return query.upper() if rng.random() < 0.2 else query
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_search_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    characters = {str(i): random_character(rng, str(i)) for i in range(60)}
+    index = SearchIndex.build(characters.values())
+    for step in range(300):
+        # 穿插新增、修改、刪除，讓索引留下過期的 posting
+        action = rng.random()
+        if action < 0.1:
+            character = random_character(rng, f"new{step}")
+            characters[character.id] = character
+            index.add(character)
+        elif action < 0.2:
+            old = rng.choice(list(characters.values()))
+            new = copy.copy(old)
+            new.name, new.traits = random_text(rng), [random_text(rng, 2)]
+            characters[new.id] = new
+            index.update(new, old)
+        elif action < 0.25 and len(characters) > 1:
+            character = characters.pop(rng.choice(list(characters)))
+            index.remove(character)
+        query = random_query(rng, characters)
+        assert index.search(query, characters) == linear_search(query, characters), query
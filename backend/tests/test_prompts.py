@@ -0,0 +1,35 @@
+"""PromptCompiler: static prefix first, cached per (kind, id, updated_at)."""
+
+import prompts
+from prompts import PREFIXES, PromptCompiler
+
+LUNA = {"id": "luna", "updated_at": "2026-01-01T00:00:00", "name": "Luna", "traits": ["Calm"]}
+
+
+def no_render(character):
+    raise AssertionError("a cache hit rendered the character block")
+
+
+def test_hit_skips_rendering(monkeypatch):
+    compiler = PromptCompiler()
+    first = compiler.compile("chat", LUNA)
+    assert first.text.startswith(PREFIXES["chat"]) and first.text.endswith("Voice Tone: ")
+    monkeypatch.setattr(prompts, "character_block", no_render)
+    assert compiler.compile("chat", LUNA) is first
+    assert compiler.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_new_updated_at_recompiles():
+    compiler = PromptCompiler()
+    compiler.compile("turn", LUNA)
+    edited = compiler.compile("turn", {**LUNA, "name": "Nova", "updated_at": "2026-01-02T00:00:00"})
+    assert "Character Name: Nova" in edited.text
+    assert compiler.stats()["entries"] == 1
+
+
+def test_drafts_are_not_cached():
+    compiler = PromptCompiler()
+    a = compiler.compile("chat", {"name": "A"})
+    b = compiler.compile("chat", {"name": "B"})
+    assert "Character Name: A" in a.text and "Character Name: B" in b.text
+    assert compiler.stats() == {"entries": 0, "hits": 0, "misses": 2}
@@ -0,0 +1,160 @@
+"""download_wav_window against bench/range_server.py: clip contents and bytes fetched."""
+
+import wave
+
+import numpy as np
+import pytest
+
+import voice_fetcher
+from bench.range_server import RangeServer
+from voice_fetcher import HEADER_PROBE, download_audio, download_stats, download_wav_window
+
+RATE = 16000
+SECONDS = 5.0
+WINDOW = int(SECONDS * RATE) * 2
+DATA_AT = 44
+
+
+@pytest.fixture(scope="module")
+def media(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("media")
+    pcm = (np.random.default_rng(0).normal(0, 0.1, 60 * RATE) * 32767).astype("<i2").tobytes()
+    with wave.open(str(directory / "long.wav"), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(pcm)
+    return directory, pcm
+
+
+def serve(directory, ranges, hide_length=False):
+    return RangeServer(directory, ranges=ranges, hide_length=hide_length).start()
+
+
+def fetch(server, tmp_path, start, ranged):
+    out = tmp_path / "clip.wav"
+    fetched = download_wav_window(server.url("long.wav"), out, start, SECONDS, ranged)
+    with wave.open(str(out), "rb") as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate()) == (1, 2, RATE)
+        frames = w.readframes(w.getnframes())
+    return fetched, frames
+
+
+@pytest.mark.parametrize("start", [0.0, 1.0, 30.0, 60.0 - SECONDS])
+def test_ranged_server(media, tmp_path, start):
+    directory, pcm = media
+    server = serve(directory, ranges=True)
+    try:
+        fetched, frames = fetch(server, tmp_path, start, ranged=True)
+        first = int(start * RATE) * 2
+        assert frames == pcm[first:first + WINDOW]
+        lo, hi = DATA_AT + first, DATA_AT + first + WINDOW
+        # 和標頭探測重疊的部分不會再抓一次
+        assert fetched == HEADER_PROBE + max(0, hi - max(lo, HEADER_PROBE))
+        assert fetched == sum(server.bytes_sent.values())
+        assert all(partial for _, _, partial in server.requests)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_window_inside_header_probe(media, tmp_path):
+    directory, pcm = media
+    server = serve(directory, ranges=True)
+    try:
+        out = tmp_path / "clip.wav"
+        fetched = download_wav_window(server.url("long.wav"), out, 0.0, 0.5, ranged=True)
+        assert fetched == HEADER_PROBE
+        assert len(server.requests) == 1
+        with wave.open(str(out), "rb") as w:
+            assert w.readframes(w.getnframes()) == pcm[:RATE]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+def test_full_download(media, tmp_path, ranges):
+    directory, pcm = media
+    server = serve(directory, ranges=ranges)
+    try:
+        fetched, frames = fetch(server, tmp_path, 30.0, ranged=False)
+        first = 30 * RATE * 2
+        assert frames == pcm[first:first + WINDOW]
+        assert fetched == DATA_AT + len(pcm)
+        assert [partial for _, _, partial in server.requests] == [False]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("start", [0.0, 30.0])
+def test_server_ignores_range(media, tmp_path, start):
+    directory, pcm = media
+    server = serve(directory, ranges=False)
+    try:
+        fetched, frames = fetch(server, tmp_path, start, ranged=True)
+        first = int(start * RATE) * 2
+        assert frames == pcm[first:first + WINDOW]
+        # 讀到視窗結束就停，不會把整個檔案讀完
+        assert fetched == max(DATA_AT + first + WINDOW, HEADER_PROBE)
+        assert [partial for _, _, partial in server.requests] == [False]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("start", [1.0, 60.0 - SECONDS])
+def test_unknown_complete_length(media, tmp_path, start):
+    directory, pcm = media
+    server = serve(directory, ranges=True, hide_length=True)
+    try:
+        fetched, frames = fetch(server, tmp_path, start, ranged=True)
+        first = int(start * RATE) * 2
+        assert frames == pcm[first:first + WINDOW]
+        assert all(partial for _, _, partial in server.requests)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FakeYoutubeDL:
+    """Records the options download_audio passes and writes the postprocessed .wav it would leave behind."""
+
+    runs = []
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download):
+        FakeYoutubeDL.runs.append(self.opts)
+        path = self.opts["outtmpl"].replace("%(ext)s", "wav")
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(RATE)
+            w.writeframes(b"\0\0" * RATE)
+        for hook in self.opts["progress_hooks"]:
+            hook({"status": "finished", "downloaded_bytes": 1234})
+
+
+@pytest.mark.parametrize("ranged", [True, False])
+def test_yt_dlp_window(monkeypatch, tmp_path, ranged):
+    monkeypatch.setattr(voice_fetcher.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    FakeYoutubeDL.runs = []
+    path = download_audio("https://www.youtube.com/watch?v=a", tmp_path, "A/B", start=30.0, seconds=SECONDS,
+                          ranged=ranged)
+    assert path == tmp_path / "A_B.wav" and path.exists()
+    [opts] = FakeYoutubeDL.runs
+    assert opts["postprocessor_args"][:2] == ["-t", f"{SECONDS:g}"]
+    if ranged:
+        assert list(opts["download_ranges"]({}, None)) == [{"start_time": 30.0, "end_time": 30.0 + SECONDS}]
+    else:
+        assert "download_ranges" not in opts
+    assert download_stats.last == {"url": "https://www.youtube.com/watch?v=a", "bytes": 1234, "ranged": ranged}
@@ -0,0 +1,73 @@
+"""The incremental parsers give the same result however the stream is chunked."""
+
+import random
+
+import pytest
+
+from streaming import THINK_END, ThinkStripper, TurnParser, parse_turn
+
+TURN_PIECES = ["<user>", "</user>", "< /user >", "<response>", "</response>", "</resonse>", "</ response>",
+               "<", "/", ">", " ", "\n", "hello", "world", "a<b", "1 < 2", "USER", "<Response>"]
+THINK_PIECES = [THINK_END, "</think", "</", "<", ">", "think", " ", "\n", "reasoning", "answer", "x"]
+
+
+def random_text(rng, pieces):
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, 24)))
+
+
+def random_chunks(rng, text):
+    """Split `text` at random points, including empty and one-character chunks."""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, len(text) + 2)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+def stream_turn(chunks):
+    parser = TurnParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    events += parser.flush()
+    return parser, events
+
+
+def stream_think(chunks, reasoning=True, truncated=False):
+    stripper = ThinkStripper(reasoning)
+    out = [stripper.feed(chunk) for chunk in chunks]
+    out.append(stripper.flush(truncated))
+    return "".join(out)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_turn_parser_chunking(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        text = random_text(rng, TURN_PIECES)
+        whole = parse_turn(text)
+        parser, events = stream_turn(random_chunks(rng, text))
+        assert parser.result() == whole, text
+        captions = [value for kind, value in events if kind == "caption"]
+        reply = "".join(value for kind, value in events if kind == "response")
+        if whole is None:
+            assert captions == [] and reply.strip() == "", text
+        else:
+            assert captions == [whole[0]], text
+            assert reply.strip() == whole[1], text
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_think_stripper_chunking(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        text = random_text(rng, THINK_PIECES)
+        chunks = random_chunks(rng, text)
+        assert stream_think(chunks) == stream_think([text]), text
+        if text.count(THINK_END) <= 1:
+            # 和非串流的 strip_think 一樣；模型只會關閉一次推理，串流版在第一個 </think> 就開始輸出
+            assert stream_think(chunks).rstrip() == text.split(THINK_END)[-1].strip(), text
+        if THINK_END not in text:
+            assert stream_think(chunks, truncated=True) == "", text
+
+
+def test_think_stripper_without_reasoning():
+    rng = random.Random(0)
+    for _ in range(200):
+        text = random_text(rng, THINK_PIECES)
+        assert stream_think(random_chunks(rng, text), reasoning=False) == text.lstrip(), text
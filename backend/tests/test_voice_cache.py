@@ -0,0 +1,30 @@
+"""CachedBackend: clip file names and cache keys."""
+
+from bench.fake_voice import FakeBackend, FakeVideo
+from voice_cache import CachedBackend, VoiceCache
+from voice_fetcher import sanitize_filename
+
+URL = "https://www.youtube.com/watch?v=a"
+
+
+def cached_backend(tmp_path):
+    fake = FakeBackend([FakeVideo("a", captions="Hello there.")])
+    return fake, CachedBackend(fake, VoiceCache(tmp_path / "cache"))
+
+
+def test_clip_name_is_sanitized(tmp_path):
+    _, backend = cached_backend(tmp_path)
+    out_dir = tmp_path / "voices"
+    name = "../../AC/DC"
+    path = backend.download(URL, out_dir, name)
+    assert path == out_dir / f"{sanitize_filename(name)}.wav"
+    assert path.parent == out_dir and path.exists()
+
+
+def test_clip_window_is_part_of_the_key(tmp_path):
+    fake, backend = cached_backend(tmp_path)
+    out_dir = tmp_path / "voices"
+    backend.download(URL, out_dir, "Luna", 0.0, 5.0)
+    backend.download(URL, out_dir, "Luna", 0.0, 5.0)
+    backend.download(URL, out_dir, "Alex", 30.0, 5.0)
+    assert [method for method, _ in fake.calls].count("download") == 2
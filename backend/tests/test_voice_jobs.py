@@ -0,0 +1,29 @@
+"""VoiceJobs: import side effects and queueing."""
+
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_touches_no_files(tmp_path):
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR}
+    subprocess.run([sys.executable, "-c", "import character, voice_cache, voice_jobs"],
+                   cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_requeue_runs_once_without_workers(tmp_path):
+    from voice_jobs import VoiceJobs
+
+    jobs = VoiceJobs(path=str(tmp_path / "jobs.db"), workers=0, out_dir=str(tmp_path), fetcher=None)
+    for i, name in enumerate(["Luna", "Alex", "Nova"]):
+        jobs.enqueue(f"c{i}", name)
+    assert sorted(jobs.queue.queue) == ["alex", "luna", "nova"]
+
+    # 重啟後只接手一次上次排隊中的任務
+    jobs = VoiceJobs(path=str(tmp_path / "jobs.db"), workers=0, out_dir=str(tmp_path), fetcher=None)
+    jobs.enqueue("c3", "Luna")
+    jobs.enqueue("c4", "Mira")
+    assert sorted(jobs.queue.queue) == ["alex", "luna", "mira", "nova"]
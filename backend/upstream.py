@@ -0,0 +1,512 @@
+"""
+Shared client for the upstream model endpoints (Qwen chat and Higgs understanding).
+
+Every LLM call in server.py goes through the module-level `upstream` client so
+that all Flask threads share one keep-alive connection pool instead of opening
+a fresh TCP connection per request.
+
+Each registered endpoint has its own timeouts, retry budget, circuit breaker
+and latency stats, and one or more replicas. Each attempt goes to the
+healthy replica with the fewest requests in flight; a retry prefers a replica
+it has not tried yet. A replica that fails UPSTREAM_EJECT_AFTER attempts in a
+row, or fails the background health probe (any HTTP answer from its /health
+counts as alive), is ejected for UPSTREAM_EJECT_SECONDS; when every replica is
+ejected they are all used anyway.
+
+With hedging on, a non-streamed call that has not answered within a typical
+replica's recent p95 latency is sent again to a second replica; the first
+answer wins and the other is cancelled (the async client cancels it
+outright; the sync client closes it as soon as it returns, since a blocking
+`requests` call cannot be interrupted).
+
+Configuration comes from the environment:
+
+  UPSTREAM_POOL_SIZE       max pooled connections per host (default 32)
+  UPSTREAM_RETRIES         retries after the first attempt (default 2)
+  UPSTREAM_BACKOFF         base backoff in seconds (default 0.2)
+  UPSTREAM_BREAKER_FAILS   consecutive failures that open the breaker (default 5)
+  UPSTREAM_BREAKER_RESET   seconds before a half-open probe (default 30)
+  QWEN_API / BOSON_API     override the endpoint URLs (e.g. to hit the stub server);
+                           a comma-separated list gives several replicas
+  QWEN_TIMEOUT / BOSON_TIMEOUT   per-endpoint read timeout in seconds (default 60)
+  UPSTREAM_HEDGE           1 to enable hedged requests (default 0)
+  UPSTREAM_HEDGE_QUANTILE  per-replica latency quantile to hedge after (default 0.95)
+  UPSTREAM_HEDGE_MIN_DELAY lower bound on the hedge delay in seconds (default 0.05)
+  UPSTREAM_EJECT_AFTER     consecutive failed attempts that eject a replica (default 3)
+  UPSTREAM_EJECT_SECONDS   how long an ejected replica sits out (default 30)
+  UPSTREAM_HEALTH_INTERVAL seconds between health probes, 0 to disable (default 10)
+  UPSTREAM_HEALTH_PATH     probe path on each replica's host (default /health)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+QWEN_API = os.environ.get("QWEN_API", "http://20.66.111.167:31022/v1/chat/completions")
+BOSON_API = os.environ.get("BOSON_API", "http://37.120.212.230:55843/v1/chat/completions")
+BOSON_API_KEY = os.environ.get("BOSON_API_KEY", "fdjshifohudsoiaf")
+
+POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "32"))
+RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "2"))
+BACKOFF = float(os.environ.get("UPSTREAM_BACKOFF", "0.2"))
+BREAKER_FAILS = int(os.environ.get("UPSTREAM_BREAKER_FAILS", "5"))
+BREAKER_RESET = float(os.environ.get("UPSTREAM_BREAKER_RESET", "30"))
+HEDGE = os.environ.get("UPSTREAM_HEDGE", "0") == "1"
+HEDGE_QUANTILE = float(os.environ.get("UPSTREAM_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = 20
+EJECT_AFTER = int(os.environ.get("UPSTREAM_EJECT_AFTER", "3"))
+EJECT_SECONDS = float(os.environ.get("UPSTREAM_EJECT_SECONDS", "30"))
+HEALTH_INTERVAL = float(os.environ.get("UPSTREAM_HEALTH_INTERVAL", "10"))
+HEALTH_PATH = os.environ.get("UPSTREAM_HEALTH_PATH", "/health")
+
+# Upstream answers worth retrying: overload and transient gateway errors.
+RETRY_STATUSES = {429, 502, 503, 504}
+# Transport failures worth retrying; any other requests error fails the call at once.
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def encode_payload(payload):
+    return json.dumps(payload).encode("utf-8")
+
+
+def response_size(headers, content=None):
+    """Body size from the downloaded content, else Content-Length; None if unknown (chunked stream)."""
+    if content is not None:
+        return len(content)
+    length = headers.get("content-length")
+    return int(length) if length else None
+
+
+def split_urls(value):
+    return [url.strip() for url in value.split(",") if url.strip()]
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call fails after all retries."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without touching the network while an endpoint's breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open -> closed."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILS, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Return True if a call may go out. Only one probe is let through while half-open."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """The call was cancelled before it settled: neither outcome, but let the next probe through."""
+        with self._lock:
+            self._probing = False
+
+
+class LatencyStats:
+    """Per-endpoint call counters plus a sliding window of recent latencies."""
+
+    def __init__(self, window=1024):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def bump(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def observe(self, elapsed_ms, ok):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.recent.append(elapsed_ms)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self.recent)
+            calls = self.calls
+            data = {
+                "calls": calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "avg_ms": round(self.total_ms / calls, 2) if calls else 0.0,
+                "max_ms": round(self.max_ms, 2),
+            }
+        for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            data[name] = round(recent[min(len(recent) - 1, int(q * len(recent)))], 2) if recent else 0.0
+        return data
+
+
+class Replica:
+    """One server behind an endpoint: requests in flight and passive/active ejection state."""
+
+    def __init__(self, url):
+        self.url = url
+        parts = urlsplit(url)
+        self.health_url = f"{parts.scheme}://{parts.netloc}{HEALTH_PATH}"
+        self.outstanding = 0
+        self.sent = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_at = None
+        self.recent = deque(maxlen=256)  # seconds per successful attempt
+
+    def quantile(self, q):
+        if len(self.recent) < HEDGE_MIN_SAMPLES:
+            return None
+        recent = sorted(self.recent)
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def available(self, now):
+        if self.ejected_at is None:
+            return True
+        if now - self.ejected_at < EJECT_SECONDS:
+            return False
+        # 冷卻結束後放回；再失敗一次就會重新剔除
+        self.ejected_at = None
+        self.failures = EJECT_AFTER - 1
+        return True
+
+    def eject(self):
+        if self.ejected_at is None:
+            self.ejections += 1
+        self.ejected_at = time.monotonic()
+
+    def record(self, ok):
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= EJECT_AFTER:
+            self.eject()
+
+    def snapshot(self):
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "sent": self.sent,
+            "ejected": self.ejected_at is not None,
+            "ejections": self.ejections,
+        }
+
+
+class Endpoint:
+    def __init__(self, name, url, headers=None, connect_timeout=3.05, read_timeout=60,
+                 retries=RETRIES, breaker=None, hedge=HEDGE):
+        self.name = name
+        self.replicas = [Replica(u) for u in (split_urls(url) if isinstance(url, str) else url)]
+        if not self.replicas:
+            raise ValueError(f"upstream '{name}' has no URL")
+        self.url = ",".join(r.url for r in self.replicas)
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+        self.hedge = hedge and len(self.replicas) > 1
+        self._hedge_delay = (None, 0.0)
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=()):
+        """
+        Pick the replica with the fewest requests in flight, preferring healthy
+        ones not in `exclude`, and count the request against it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            healthy = [r for r in self.replicas if r.available(now)] or self.replicas
+            candidates = [r for r in healthy if r not in exclude] or healthy
+            replica = min(candidates, key=lambda r: (r.outstanding, r.sent))
+            replica.outstanding += 1
+            replica.sent += 1
+            return replica
+
+    def second(self, primary):
+        """A healthy replica other than `primary` for a hedge, counted against it; None if there is none."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [r for r in self.replicas if r is not primary and r.available(now)]
+            if not candidates:
+                return None
+            replica = min(candidates, key=lambda r: (r.outstanding, r.sent))
+            replica.outstanding += 1
+            replica.sent += 1
+            return replica
+
+    def release(self, replica, ok, elapsed=None):
+        with self._lock:
+            replica.outstanding -= 1
+            replica.record(ok)
+            if ok and elapsed is not None:
+                replica.recent.append(elapsed)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait before hedging: the median of the replicas' recent
+        p95 attempt latency, so one slow replica (the case hedging is for)
+        does not push the delay up to its own latency. None until the
+        replicas have enough samples. Recomputed at most once a second.
+        """
+        delay, computed_at = self._hedge_delay
+        now = time.monotonic()
+        if now - computed_at >= 1.0:
+            with self._lock:
+                quantiles = sorted(q for q in (r.quantile(HEDGE_QUANTILE) for r in self.replicas) if q is not None)
+            delay = max(quantiles[(len(quantiles) - 1) // 2], HEDGE_MIN_DELAY) if quantiles else None
+            self._hedge_delay = (delay, now)
+        return delay
+
+    def probe(self, session):
+        """Health-check every replica; a replica that gives no HTTP answer is ejected."""
+        for replica in self.replicas:
+            try:
+                ok = session.get(replica.health_url, timeout=self.timeout[0]).status_code < 500
+            except requests.RequestException:
+                ok = False
+            if not ok:
+                with self._lock:
+                    replica.eject()
+
+    def snapshot(self):
+        with self._lock:
+            return [r.snapshot() for r in self.replicas]
+
+
+class UpstreamClient:
+    """Thread-safe pooled JSON client shared by all request handlers."""
+
+    def __init__(self, pool_size=POOL_SIZE, backoff=BACKOFF):
+        self.backoff = backoff
+        self.endpoints = {}
+        self.session = requests.Session()
+        # pool_block keeps us at pool_size sockets per host under bursts
+        # instead of opening (and then discarding) overflow connections.
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # 開啟對沖時主請求與對沖請求都在這個線程池中執行；
+        # 連接數已由連接池限制，線程數按多個副本留出餘量
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size * 4, thread_name_prefix="upstream-hedge")
+        self._health_thread = None
+
+    def register(self, name, url, **kwargs):
+        self.endpoints[name] = Endpoint(name, url, **kwargs)
+        return self.endpoints[name]
+
+    def start_health_checks(self, interval=HEALTH_INTERVAL):
+        """Probe multi-replica endpoints from a daemon thread every `interval` seconds (once per process)."""
+        if interval <= 0 or self._health_thread is not None:
+            return
+
+        def loop():
+            session = requests.Session()
+            while True:
+                for ep in list(self.endpoints.values()):
+                    if len(ep.replicas) > 1:
+                        ep.probe(session)
+                time.sleep(interval)
+
+        self._health_thread = threading.Thread(target=loop, name="upstream-health", daemon=True)
+        self._health_thread.start()
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: uniform in [0, base * 2^attempt].
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _send(self, ep, replica, body, stream):
+        """One attempt against one replica (already acquired); releases it."""
+        start = time.perf_counter()
+        try:
+            r = self.session.post(replica.url, headers=ep.headers, data=body, timeout=ep.timeout, stream=stream)
+        except requests.RequestException:
+            ep.release(replica, False)
+            metrics.observe_upstream_status(ep.name, "error")
+            raise
+        except BaseException:
+            ep.release(replica, False)
+            raise
+        ep.release(replica, r.status_code < 500, time.perf_counter() - start)
+        metrics.observe_upstream_status(ep.name, r.status_code)
+        return r
+
+    def _attempt(self, ep, body, stream, tried):
+        """One attempt, hedged on a second replica when it runs past the endpoint's hedge delay."""
+        replica = ep.acquire(tried)
+        tried.add(replica)
+        delay = ep.hedge_delay() if ep.hedge and not stream else None
+        if delay is None:
+            return self._send(ep, replica, body, stream)
+
+        primary = self._hedge_pool.submit(self._send, ep, replica, body, stream)
+        done, _ = wait([primary], timeout=delay)
+        second = None if done else ep.second(replica)
+        if second is None:
+            return primary.result()
+        tried.add(second)
+        ep.stats.bump("hedged")
+        hedge = self._hedge_pool.submit(self._send, ep, second, body, stream)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code not in RETRY_STATUSES:
+                    winner = future
+                    break
+            else:
+                if pending:
+                    continue
+                # 兩邊都失敗：返回主請求的結果，交給外層重試
+                winner = primary
+            break
+        if winner is hedge:
+            ep.stats.bump("hedge_wins")
+        for future in pending | ({primary, hedge} - {winner}):
+            future.add_done_callback(_close_loser)
+        return winner.result()
+
+    def post(self, name, payload, stream=False):
+        """
+        POST `payload` to the named endpoint and return the `requests.Response`.
+
+        RETRY_ERRORS and RETRY_STATUSES are retried with jittered exponential
+        backoff, each time on the least-loaded replica not tried yet; any other
+        `requests` error raises UpstreamError straight away. Any other HTTP
+        error is returned as-is so the caller can surface the upstream body.
+        """
+        ep = self.endpoints[name]
+        if not ep.breaker.allow():
+            ep.stats.bump("rejected")
+            metrics.observe_upstream_status(name, "circuit_open")
+            raise CircuitOpenError(f"upstream '{name}' circuit is open")
+
+        # Encode once: the same bytes are reused by retries and counted for metrics.
+        body = encode_payload(payload)
+        start = time.perf_counter()
+        last_error = None
+        tried = set()
+        settled = False
+        try:
+            for attempt in range(ep.retries + 1):
+                if attempt:
+                    ep.stats.bump("retries")
+                    self._sleep_before_retry(attempt - 1)
+                try:
+                    r = self._attempt(ep, body, stream, tried)
+                except RETRY_ERRORS as e:
+                    last_error = UpstreamError(f"upstream '{name}' request failed: {e}")
+                    continue
+                except requests.RequestException as e:
+                    last_error = UpstreamError(f"upstream '{name}' request failed: {e}")
+                    break
+                if r.status_code in RETRY_STATUSES:
+                    last_error = UpstreamError(f"upstream '{name}' returned {r.status_code}", status=r.status_code)
+                    r.close()
+                    continue
+                ok = r.status_code < 500
+                elapsed = time.perf_counter() - start
+                settled = True
+                (ep.breaker.record_success if ok else ep.breaker.record_failure)()
+                ep.stats.observe(elapsed * 1000, ok)
+                metrics.observe_upstream(name, elapsed, len(body),
+                                         response_size(r.headers, None if stream else r.content))
+                return r
+
+            elapsed = time.perf_counter() - start
+            settled = True
+            ep.breaker.record_failure()
+            ep.stats.observe(elapsed * 1000, False)
+            metrics.observe_upstream(name, elapsed, len(body))
+            raise last_error
+        finally:
+            # 任何沒預料到的例外也要結算斷路器，否則半開探測會一直佔著
+            if not settled:
+                ep.breaker.record_failure()
+
+    def chat_completion(self, name, payload):
+        """Non-streaming chat completion; returns the decoded JSON body."""
+        r = self.post(name, payload)
+        try:
+            return r.json()
+        except ValueError:
+            raise UpstreamError(f"upstream '{name}' returned non-JSON body ({r.status_code})", status=r.status_code)
+
+    def metrics(self):
+        return {
+            name: {"url": ep.url, "breaker": ep.breaker.state, **ep.stats.snapshot(), "replicas": ep.snapshot()}
+            for name, ep in self.endpoints.items()
+        }
+
+
+def _close_loser(future):
+    """Done-callback for the slower half of a hedged pair: drop its connection."""
+    if future.exception() is None:
+        future.result().close()
+
+
+upstream = UpstreamClient()
+upstream.register("qwen", QWEN_API, read_timeout=float(os.environ.get("QWEN_TIMEOUT", "60")))
+upstream.register("boson", BOSON_API, headers={"Authorization": f"Bearer {BOSON_API_KEY}"},
+                  read_timeout=float(os.environ.get("BOSON_TIMEOUT", "60")))
@@ -0,0 +1,179 @@
+"""
+Non-blocking counterpart of `upstream.UpstreamClient` for the ASGI serving mode.
+
+Uses a small set of pooled `httpx.AsyncClient`s and shares the endpoint registry of the
+sync client, so timeouts, retry budgets, circuit breakers, latency stats and
+replica load/ejection state are the same objects whichever serving mode
+handles the request. A hedged call's loser is cancelled, which closes its
+connection and lets the model server abort the generation.
+"""
+
+import asyncio
+import itertools
+import random
+import time
+
+import httpx
+
+import metrics
+from upstream import (upstream, UpstreamError, CircuitOpenError, RETRY_STATUSES, POOL_SIZE, BACKOFF,
+                      encode_payload, response_size)
+
+
+# httpcore scans every connection in a pool when assigning a request, which
+# degrades badly past a few dozen connections; several small pools scale better.
+CONNECTIONS_PER_SHARD = 16
+
+
+class AsyncUpstreamClient:
+    def __init__(self, endpoints, pool_size=POOL_SIZE, backoff=BACKOFF):
+        self.endpoints = endpoints
+        self.backoff = backoff
+        # pool_size is per host, as in the sync client, so replicas do not share one budget
+        pool_size *= max((len(ep.replicas) for ep in endpoints.values()), default=1)
+        shards = max(1, -(-pool_size // CONNECTIONS_PER_SHARD))
+        per_shard = -(-pool_size // shards)
+        self.clients = [
+            httpx.AsyncClient(limits=httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard))
+            for _ in range(shards)
+        ]
+        self._next_client = itertools.cycle(self.clients)
+
+    async def _send(self, ep, replica, body, timeout, stream):
+        """One attempt against one replica (already acquired); releases it."""
+        client = next(self._next_client)
+        request = client.build_request("POST", replica.url, headers=ep.headers, content=body, timeout=timeout)
+        start = time.perf_counter()
+        try:
+            r = await client.send(request, stream=stream)
+        except asyncio.CancelledError:
+            # 對沖落敗被取消，不算副本故障
+            ep.release(replica, True)
+            raise
+        except httpx.HTTPError:
+            ep.release(replica, False)
+            metrics.observe_upstream_status(ep.name, "error")
+            raise
+        except BaseException:
+            ep.release(replica, False)
+            raise
+        ep.release(replica, r.status_code < 500, time.perf_counter() - start)
+        metrics.observe_upstream_status(ep.name, r.status_code)
+        return r
+
+    async def _attempt(self, ep, body, timeout, stream, tried):
+        """One attempt, hedged on a second replica when it runs past the endpoint's hedge delay."""
+        replica = ep.acquire(tried)
+        tried.add(replica)
+        delay = ep.hedge_delay() if ep.hedge and not stream else None
+        if delay is None:
+            return await self._send(ep, replica, body, timeout, stream)
+
+        primary = asyncio.ensure_future(self._send(ep, replica, body, timeout, stream))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        second = None if done else ep.second(replica)
+        if second is None:
+            return await primary
+        tried.add(second)
+        ep.stats.bump("hedged")
+        hedge = asyncio.ensure_future(self._send(ep, second, body, timeout, stream))
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRY_STATUSES:
+                        winner = task
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+        winner = winner or primary
+        if winner is hedge:
+            ep.stats.bump("hedge_wins")
+        loser = hedge if winner is primary else primary
+        if loser.done() and not loser.cancelled() and loser.exception() is None:
+            await loser.result().aclose()
+        return await winner
+
+    async def post(self, name, payload, stream=False):
+        """
+        POST `payload` to the named endpoint and return the `httpx.Response`.
+
+        Same retry, replica and hedging policy as the sync client (transport
+        errors are retried, any other httpx error raises UpstreamError). With
+        `stream=True` the body is not read; the caller must `await response.aclose()`.
+        """
+        ep = self.endpoints[name]
+        if not ep.breaker.allow():
+            ep.stats.bump("rejected")
+            metrics.observe_upstream_status(name, "circuit_open")
+            raise CircuitOpenError(f"upstream '{name}' circuit is open")
+
+        connect_timeout, read_timeout = ep.timeout
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        body = encode_payload(payload)
+        start = time.perf_counter()
+        last_error = None
+        tried = set()
+        settled = False
+        try:
+            for attempt in range(ep.retries + 1):
+                if attempt:
+                    ep.stats.bump("retries")
+                    await asyncio.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+                try:
+                    r = await self._attempt(ep, body, timeout, stream, tried)
+                except httpx.TransportError as e:
+                    last_error = UpstreamError(f"upstream '{name}' request failed: {e}")
+                    continue
+                except httpx.HTTPError as e:
+                    last_error = UpstreamError(f"upstream '{name}' request failed: {e}")
+                    break
+                if r.status_code in RETRY_STATUSES:
+                    last_error = UpstreamError(f"upstream '{name}' returned {r.status_code}", status=r.status_code)
+                    await r.aclose()
+                    continue
+                ok = r.status_code < 500
+                elapsed = time.perf_counter() - start
+                settled = True
+                (ep.breaker.record_success if ok else ep.breaker.record_failure)()
+                ep.stats.observe(elapsed * 1000, ok)
+                metrics.observe_upstream(name, elapsed, len(body),
+                                         response_size(r.headers, None if stream else r.content))
+                return r
+
+            elapsed = time.perf_counter() - start
+            settled = True
+            ep.breaker.record_failure()
+            ep.stats.observe(elapsed * 1000, False)
+            metrics.observe_upstream(name, elapsed, len(body))
+            raise last_error
+        except asyncio.CancelledError:
+            # 客戶端斷線取消了呼叫：不算失敗，但要放開半開探測
+            if not settled:
+                settled = True
+                ep.breaker.abandon()
+            raise
+        finally:
+            if not settled:
+                ep.breaker.record_failure()
+
+    async def chat_completion(self, name, payload):
+        """Non-streaming chat completion; returns the decoded JSON body."""
+        r = await self.post(name, payload)
+        try:
+            return r.json()
+        except ValueError:
+            raise UpstreamError(f"upstream '{name}' returned non-JSON body ({r.status_code})", status=r.status_code)
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients))
+
+
+async_upstream = AsyncUpstreamClient(upstream.endpoints)
@@ -0,0 +1,292 @@
+"""
+Persistent cache for the network side of `voice_fetcher.fetch`, so
+re-provisioning a known character (recreated, after a restart, or from
+another process) needs no YouTube search, caption fetch or download.
+
+Entries live in one SQLite index under VOICE_CACHE_DIR:
+
+  search    normalized query (NFKC, casefolded, whitespace collapsed) -> results
+  captions  video id + languages + window -> caption snippet, or "none found"
+            (kept only VOICE_CACHE_NEGATIVE_TTL: voice_fetcher reports IP blocks
+            and other transient failures as "none found" too)
+  clip      video id + clip window -> the trimmed audio, stored content-addressed as
+            blobs/<sha256[:2]>/<sha256>
+
+Every entry records the SHA-256 of its value and is checked on read; one that
+fails the check is dropped and fetched again. Entries are evicted least
+recently used first once their total size passes VOICE_CACHE_BYTES.
+`CachedBackend` puts the cache in front of a voice_fetcher backend and copies
+a cached clip into ref_audio/ only when the file there differs.
+`get_voice_cache()` opens the process-wide cache on first use, so importing
+this module creates no directories.
+
+  VOICE_CACHE_DIR     index and blobs (default cache/voice next to this file)
+  VOICE_CACHE_BYTES   size budget (default 256 MiB)
+  VOICE_CACHE_NEGATIVE_TTL  seconds a "none found" caption entry is trusted (default 3600)
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from voice_fetcher import CLIP_SECONDS, fetch, sanitize_filename, youtube
+
+CACHE_DIR = os.environ.get("VOICE_CACHE_DIR", str(Path(__file__).resolve().parent / "cache" / "voice"))
+CACHE_BYTES = int(os.environ.get("VOICE_CACHE_BYTES", str(256 * 1024 * 1024)))
+NEGATIVE_TTL = float(os.environ.get("VOICE_CACHE_NEGATIVE_TTL", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key        TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    value      TEXT,
+    sha256     TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at);
+"""
+
+MISS = object()
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+def video_id_of(url):
+    return url.rsplit("v=", 1)[-1]
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _replace_with_copy(src, dst):
+    # 先寫暫存檔再 rename，讀取端不會看到寫了一半的檔案
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class VoiceCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.corrupt = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _blob_path(self, sha):
+        return os.path.join(self.directory, "blobs", sha[:2], sha)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _lookup(self, key):
+        row = self._conn().execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+        return row
+
+    def _touch(self, key):
+        self._conn().execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+
+    def _drop_corrupt(self, key):
+        print(f"voice cache entry {key} failed its integrity check; refetching")
+        self._delete(self._conn(), key)
+        self._count("corrupt")
+        self._count("misses")
+
+    def get(self, key, negative_ttl=None):
+        """The cached JSON value for `key`, or MISS; a null stored over `negative_ttl` seconds ago is a miss."""
+        row = self._lookup(key)
+        if row is None:
+            return MISS
+        if hashlib.sha256(row["value"].encode("utf-8")).hexdigest() != row["sha256"]:
+            self._drop_corrupt(key)
+            return MISS
+        value = json.loads(row["value"])
+        if value is None and negative_ttl is not None and time.time() - row["created_at"] > negative_ttl:
+            self._count("misses")
+            return MISS
+        self._touch(key)
+        return value
+
+    def put(self, key, kind, value):
+        data = json.dumps(value, ensure_ascii=False)
+        self._insert(key, kind, data, hashlib.sha256(data.encode("utf-8")).hexdigest(), len(data.encode("utf-8")))
+
+    def get_clip(self, key):
+        """(blob path, metadata) of a cached clip whose content still matches its hash, or None."""
+        row = self._lookup(key)
+        if row is None:
+            return None
+        path = self._blob_path(row["sha256"])
+        try:
+            ok = file_sha256(path) == row["sha256"]
+        except OSError:
+            ok = False
+        if not ok:
+            self._drop_corrupt(key)
+            return None
+        self._touch(key)
+        return path, json.loads(row["value"])
+
+    def put_clip(self, key, src, meta):
+        """Store the file at `src` under its content hash; returns the blob path."""
+        sha = file_sha256(src)
+        path = self._blob_path(sha)
+        if not os.path.exists(path) or file_sha256(path) != sha:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _replace_with_copy(src, path)
+        self._insert(key, "clip", json.dumps(meta), sha, os.path.getsize(path))
+        return path
+
+    def _insert(self, key, kind, value, sha, size):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO entries (key, kind, value, sha256, size, created_at, used_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, kind, value, sha, size, now, now))
+            self._evict(conn, keep=key)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, keep):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute("SELECT key, size FROM entries WHERE key != ? ORDER BY used_at",
+                                (keep,)).fetchall():
+            self._delete(conn, row["key"])
+            self._count("evicted")
+            total -= row["size"]
+            if total <= self.max_bytes:
+                break
+
+    def _delete(self, conn, key):
+        row = conn.execute("SELECT kind, sha256 FROM entries WHERE key = ?", (key,)).fetchone()
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if row is not None and row["kind"] == "clip":
+            # 內容定址：沒有其他條目引用時才刪 blob
+            shared = conn.execute("SELECT 1 FROM entries WHERE kind = 'clip' AND sha256 = ?",
+                                  (row["sha256"],)).fetchone()
+            if shared is None:
+                try:
+                    os.remove(self._blob_path(row["sha256"]))
+                except OSError:
+                    pass
+
+    def stats(self):
+        rows = self._conn().execute("SELECT kind, COUNT(*) AS n, SUM(size) AS bytes FROM entries GROUP BY kind")
+        entries = {row["kind"]: {"entries": row["n"], "bytes": row["bytes"]} for row in rows}
+        with self._lock:
+            return {
+                **entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "corrupt": self.corrupt,
+                "evicted": self.evicted,
+            }
+
+
+class CachedBackend:
+    """A voice_fetcher backend that answers from `cache` and only calls `backend` on a miss."""
+
+    def __init__(self, backend, cache, negative_ttl=NEGATIVE_TTL):
+        self.backend = backend
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+
+    def search(self, query, limit):
+        key = f"search:{limit}:{normalize_query(query)}"
+        items = self.cache.get(key)
+        if items is MISS:
+            items = self.backend.search(query, limit)
+            if items:
+                self.cache.put(key, "search", items)
+        return items
+
+    def captions(self, video_id, lang_preference, max_seconds=5):
+        key = f"captions:{video_id}:{','.join(lang_preference)}:{max_seconds}"
+        text = self.cache.get(key, negative_ttl=self.negative_ttl)
+        if text is MISS:
+            # "沒有字幕" 也快取起來，但只保留 negative_ttl：
+            # try_fetch_captions 把 IP 封鎖等暫時性錯誤也當成沒有字幕
+            text = self.backend.captions(video_id, lang_preference, max_seconds)
+            self.cache.put(key, "captions", text)
+        return text
+
+    def download(self, url, out_dir, filename, start=0.0, seconds=CLIP_SECONDS):
+        key = f"clip:{video_id_of(url)}:{start:g}:{seconds:g}"
+        cached = self.cache.get_clip(key)
+        if cached is None:
+            with tempfile.TemporaryDirectory() as tmp:
+                downloaded = Path(self.backend.download(url, Path(tmp), filename, start, seconds))
+                blob = self.cache.put_clip(key, downloaded, {"ext": downloaded.suffix})
+            cached = blob, {"ext": downloaded.suffix}
+        blob, meta = cached
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        dst = out_dir / f"{sanitize_filename(filename)}{meta['ext']}"
+        # 同樣內容就不覆寫 ref_audio/<Name>.wav
+        if not (dst.exists() and file_sha256(dst) == os.path.basename(blob)):
+            _replace_with_copy(blob, str(dst))
+        return dst
+
+
+_voice_cache = None
+_voice_cache_lock = threading.Lock()
+
+
+def get_voice_cache():
+    """The process-wide VoiceCache, created on first use."""
+    global _voice_cache
+    with _voice_cache_lock:
+        if _voice_cache is None:
+            _voice_cache = VoiceCache()
+        return _voice_cache
+
+
+def fetch_cached(character_name, out_dir, backend=youtube):
+    """`voice_fetcher.fetch` through the voice cache."""
+    return fetch(character_name, out_dir, backend=CachedBackend(backend, get_voice_cache()))
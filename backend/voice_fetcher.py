@@ -15,16 +15,36 @@ Usage:
 
 Tip:
   Add --lang en to prefer English captions; omit to auto-detect.
+
+`fetch` (used by voice_jobs) checks the search results' captions
+concurrently on up to VOICE_FETCH_WORKERS threads (default 4), keeps the
+best-ranked result that has captions and only then downloads its audio. The
+network calls go through a backend object (`search`, `captions`,
+`download`); `youtube` is the real one and bench/fake_voice.py has an
+offline fake.
+
+Only the CLIP_SECONDS window of a video is needed. With VOICE_RANGED_DOWNLOAD
+on (the default) yt_dlp is given `download_ranges`, so only the fragments or
+byte ranges covering the window are fetched instead of the whole stream.
+Direct links to PCM .wav files are clipped with HTTP Range requests (no
+ffmpeg needed). Bytes fetched per clip are logged and kept in
+`download_stats`; bench/range_server.py is a local server with Range support
+to try it against.
 """
 
 import argparse
 import json
 import os
 import re
-import sys
+import struct
 import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+from urllib.parse import urlparse
 
+import requests
 from tqdm import tqdm
 
 # --- YouTube search & download (no API key) ---
@@ -36,6 +56,11 @@ from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, No
 # --- Local transcription ---
 # import whisper
 
+FETCH_WORKERS = int(os.environ.get("VOICE_FETCH_WORKERS", "4"))
+CLIP_SECONDS = 5.0
+RANGED = os.environ.get("VOICE_RANGED_DOWNLOAD", "1") != "0"
+HEADER_PROBE = 64 * 1024  # first request of a ranged .wav fetch; holds the RIFF header
+
 
 def search_youtube(query: str, limit: int = 5):
     """
@@ -102,14 +127,59 @@ def try_fetch_captions(video_id: str, lang_preference, max_seconds=5):
         return None
 
 
-def download_audio(url: str, out_dir: Path, filename: str) -> Path:
+class DownloadStats:
+    """Bytes fetched per reference clip, for /api/upstream/stats."""
+
+    def __init__(self):
+        self.clips = 0
+        self.ranged = 0
+        self.bytes = 0
+        self.last = None
+        self._lock = threading.Lock()
+
+    def record(self, url, fetched, ranged, seconds):
+        print(f"[voice] fetched {fetched} bytes for a {seconds:g}s clip of {url} ({'ranged' if ranged else 'full'})")
+        with self._lock:
+            self.clips += 1
+            self.ranged += int(ranged)
+            self.bytes += fetched
+            self.last = {"url": url, "bytes": fetched, "ranged": ranged}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "clips": self.clips,
+                "ranged": self.ranged,
+                "bytes": self.bytes,
+                "avg_bytes_per_clip": round(self.bytes / self.clips) if self.clips else 0,
+                "last": self.last,
+            }
+
+
+download_stats = DownloadStats()
+
+
+def download_audio(url: str, out_dir: Path, filename: str, start: float = 0.0, seconds: float = CLIP_SECONDS,
+                   ranged: bool = RANGED) -> Path:
     """
-    Download best audio to a .mp3 (or .m4a) file via yt_dlp.
-    Returns the file path.
+    Download `seconds` of audio from `start` as a 16 kHz .wav via yt_dlp
+    (a direct .wav link is clipped as is). With `ranged`, only the part of the
+    stream covering the window is fetched. Returns the file path.
     """
     out_dir.mkdir(parents=True, exist_ok=True)
     safe_name = sanitize_filename(filename)
+    if urlparse(url).path.lower().endswith(".wav"):
+        path = out_dir / f"{safe_name}.wav"
+        download_stats.record(url, download_wav_window(url, path, start, seconds, ranged), ranged, seconds)
+        return path
+
     out_tmpl = str(out_dir / f"{safe_name}.%(ext)s")
+    fetched = []
+
+    def on_progress(d):
+        if d["status"] == "finished":
+            fetched.append(d.get("downloaded_bytes") or 0)
+
     ydl_opts = {
         "quiet": True,
         "format": "bestaudio/best",
@@ -117,50 +187,197 @@ def download_audio(url: str, out_dir: Path, filename: str) -> Path:
         "postprocessors": [
             {"key": "FFmpegExtractAudio", "preferredcodec": "wav", "preferredquality": "192"}
         ],
-        "postprocessor_args": ["-t", "5", "-ar", "16000"],  # downsample to 16k for STT efficiency
+        "postprocessor_args": ["-t", f"{seconds:g}", "-ar", "16000"],  # downsample to 16k for STT efficiency
         "prefer_ffmpeg": True,
+        "progress_hooks": [on_progress],
     }
+    if ranged:
+        # 只抓取涵蓋這段時間的分段/位元組範圍，而不是整支影片的音訊
+        ydl_opts["download_ranges"] = yt_dlp.utils.download_range_func(None, [(start, start + seconds)])
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        vid = info.get("id")
-        # After postprocess, expect an mp3 with that id
-        candidate = out_dir / f"{vid}.wav"
-        if not candidate.exists():
-            # Fallback: find the file with this base id
-            for p in out_dir.glob(f"{vid}.*"):
-                return p
-        return candidate
+        ydl.extract_info(url, download=True)
+    download_stats.record(url, sum(fetched), ranged, seconds)
+    # After postprocess, expect a wav named after the output template
+    candidate = out_dir / f"{safe_name}.wav"
+    if not candidate.exists():
+        # Fallback: find the file with this base name
+        for p in out_dir.glob(f"{safe_name}.*"):
+            return p
+    return candidate
+
+
+def _wav_layout(head):
+    """(channels, rate, sample width, block align, data offset, data size) of a PCM WAV header, or None."""
+    if head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    pos, fmt = 12, None
+    while pos + 8 <= len(head):
+        chunk_id, size = head[pos:pos + 4], struct.unpack("<I", head[pos + 4:pos + 8])[0]
+        if chunk_id == b"fmt " and pos + 24 <= len(head):
+            tag, channels, rate, _, align, bits = struct.unpack("<HHIIHH", head[pos + 8:pos + 24])
+            if tag not in (1, 0xFFFE):  # PCM, WAVE_FORMAT_EXTENSIBLE
+                return None
+            fmt = (channels, rate, bits // 8, align)
+        elif chunk_id == b"data":
+            return (*fmt, pos + 8, size) if fmt else None
+        pos += 8 + size + (size & 1)
+    return None
+
+
+def _range_total(content_range):
+    """Complete length from a `bytes a-b/total` Content-Range, or None when missing or `*` (unknown)."""
+    total = (content_range or "").rsplit("/", 1)[-1].strip()
+    return int(total) if total.isdigit() else None
+
+
+class _Body:
+    """Sequential reader over a streamed response that counts the bytes it pulls."""
+
+    def __init__(self, response):
+        self.response = response
+        self.fetched = 0
+
+    def read(self, n):
+        data = self.response.raw.read(n, decode_content=True)
+        self.fetched += len(data)
+        return data
+
+
+def download_wav_window(url, out_path, start=0.0, seconds=CLIP_SECONDS, ranged=RANGED):
+    """
+    Write [start, start + seconds) of the PCM WAV at `url` to `out_path`;
+    returns the bytes fetched. Ranged: the header comes from a first Range
+    request, then only the window's frames it did not already cover are
+    asked for; a server that ignores Range is read only up to the end of the
+    window. Otherwise the whole file is downloaded and trimmed, as yt_dlp +
+    ffmpeg `-t` would.
+    """
+    fetched = 0
+    with requests.Session() as session:
+        headers = {"Range": f"bytes=0-{HEADER_PROBE - 1}"} if ranged else {}
+        with session.get(url, headers=headers, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            body = _Body(r)
+            head = body.read(HEADER_PROBE)
+            layout = _wav_layout(head)
+            if layout is None:
+                raise ValueError(f"{url} is not a PCM WAV (or its header is past the first {HEADER_PROBE} bytes)")
+            channels, rate, width, align, data_at, data_size = layout
+            total = _range_total(r.headers.get("Content-Range")) if r.status_code == 206 else None
+            data_end = data_at + data_size
+            if total:
+                data_end = min(data_end, total)
+            first = data_at + int(start * rate) * align
+            last = min(data_end, first + int(seconds * rate) * align)
+            if r.status_code == 206 and last > len(head):
+                # 視窗超出第一個範圍：已經收到的部分直接沿用，只再要剩下的位元組
+                frames = head[first:last]
+                rest = max(first, len(head))
+                with session.get(url, headers={"Range": f"bytes={rest}-{last - 1}"}, stream=True, timeout=60) as r2:
+                    r2.raise_for_status()
+                    if r2.status_code != 206:
+                        raise ValueError(f"{url} answered a Range request with {r2.status_code}")
+                    tail = r2.raw.read(last - rest, decode_content=True)
+                    fetched += len(tail)
+                frames += tail
+            else:
+                # 整個 body：讀到視窗結束為止（ranged）或讀完（full），視窗前的資料直接丟掉
+                frames = bytearray(head[first:last])
+                pos = len(head)
+                while pos < last:
+                    block = body.read(min(1 << 16, last - pos))
+                    if not block:
+                        break
+                    lo, hi = max(first, pos), min(last, pos + len(block))
+                    if hi > lo:
+                        frames += block[lo - pos:hi - pos]
+                    pos += len(block)
+                if not ranged:
+                    while body.read(1 << 16):
+                        pass
+            fetched += body.fetched
+
+    with wave.open(str(out_path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(width)
+        w.setframerate(rate)
+        w.writeframes(frames[:len(frames) // align * align])
+    return fetched
 
 
 def sanitize_filename(s: str) -> str:
     return re.sub(r"[^\w\-. ]", "_", s).strip()[:150]
 
 
-def fetch(character_name, out_dir):
+class YouTubeBackend:
+    """The network side of `fetch`. Fakes only need the same three methods."""
+
+    def search(self, query, limit):
+        return search_youtube(query, limit=limit)
+
+    def captions(self, video_id, lang_preference, max_seconds=5):
+        return try_fetch_captions(video_id, lang_preference, max_seconds)
+
+    def download(self, url, out_dir, filename, start=0.0, seconds=CLIP_SECONDS):
+        return download_audio(url, out_dir, filename, start, seconds)
+
+
+youtube = YouTubeBackend()
+
+
+def first_captioned(items, captions, workers=FETCH_WORKERS):
+    """
+    (item, transcript) of the best-ranked item for which `captions(item)` is
+    non-empty, or None. All items are checked concurrently; the call returns
+    as soon as every better-ranked item has come back empty, and checks that
+    have not started yet are cancelled. If nothing has captions but a check
+    raised, the first such error is re-raised.
+    """
+    if not items:
+        return None
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(items))), thread_name_prefix="voice-fetch")
+    futures = [pool.submit(captions, item) for item in items]
+    try:
+        pending = set(futures)
+        while True:
+            # 依搜尋排名決定：前面的候選都確定沒有字幕時才採用後面的
+            for item, future in zip(items, futures):
+                if not future.done():
+                    break
+                if future.exception() is None and future.result():
+                    return item, future.result()
+            else:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise errors[0]
+        return None
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch(character_name, out_dir, backend=None, workers=FETCH_WORKERS):
+    """Fetch a captioned voice sample for `character_name`; returns the audio path, or None if nothing usable."""
+    backend = backend or youtube
     query = f"{character_name} voice sample"
     limit = 3
     lang_pref = ["en"]
     out = character_name.replace(" ", "")
 
     print(f"Searching YouTube for: {query} (limit={limit})")
-    items = search_youtube(query, limit=limit)
+    items = backend.search(query, limit)
     if not items:
         print("No results found.")
-        sys.exit(0)
-
-    for item in items:
-        vid = item["video_id"]
-        url = item["url"]
-
-        # 1) Try official captions
-        transcript_text = try_fetch_captions(vid, lang_preference=lang_pref)
+        return None
 
-        if not transcript_text:
-            continue
+    # 1) Try official captions, all candidates at once
+    found = first_captioned(items, lambda item: backend.captions(item["video_id"], lang_pref), workers)
+    if found is None:
+        return None
+    item, transcript_text = found
 
-        with open(f"{out_dir}/{out}.txt", "w") as f:
-            f.write(transcript_text)
+    with open(f"{out_dir}/{out}.txt", "w") as f:
+        f.write(transcript_text)
 
-        download_audio(url, Path(f"{out_dir}"), out)
-        
-        return
+    return backend.download(item["url"], Path(f"{out_dir}"), out)
@@ -0,0 +1,204 @@
+"""
+Background provisioning of reference voice samples for new characters.
+
+`create_character` used to run `voice_fetcher.fetch` inline: a YouTube
+search, caption fetches and an ffmpeg download inside the POST. Now it only
+enqueues a job, and a small worker pool does the fetching.
+
+Jobs live in a SQLite table, keyed by the normalized character name (NFKC,
+casefolded, whitespace removed), so "Morgan Freeman" and "morgan  freeman"
+share one job and one sample. The table survives restarts: jobs that were
+queued, or running past their lease, are picked up again when the pool
+starts. Several processes may share the table. A worker claims a job with a
+conditional UPDATE, so each job runs once.
+
+Job states: queued -> running -> ready | not_found | failed.
+
+Fetches go through voice_cache, so a name whose sample was fetched before
+(even under another job key) is provisioned without network I/O.
+`get_voice_jobs()` opens the process-wide instance on first use, so
+importing this module touches no files.
+
+  VOICE_JOBS_DB          job table path (default voice_jobs.db next to this file)
+  VOICE_WORKERS          worker threads per process (default 2)
+  VOICE_REF_DIR          where samples are written (default ../higgs-audio-hackathon-starter/ref_audio)
+  VOICE_JOB_LEASE        seconds before a running job is considered abandoned (default 600)
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from voice_cache import fetch_cached
+
+DB_FILE = os.environ.get("VOICE_JOBS_DB", str(Path(__file__).resolve().parent / "voice_jobs.db"))
+WORKERS = int(os.environ.get("VOICE_WORKERS", "2"))
+REF_DIR = os.environ.get("VOICE_REF_DIR", "../higgs-audio-hackathon-starter/ref_audio")
+LEASE_SECONDS = float(os.environ.get("VOICE_JOB_LEASE", "600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS voice_jobs (
+    key        TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    path       TEXT,
+    error      TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS character_voices (
+    character_id TEXT PRIMARY KEY,
+    key          TEXT NOT NULL
+);
+"""
+
+
+def normalize_name(name):
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", name)).casefold()
+
+
+class VoiceJobs:
+    def __init__(self, path=DB_FILE, workers=WORKERS, out_dir=REF_DIR, fetcher=fetch_cached):
+        self.path = path
+        self.workers = workers
+        self.out_dir = out_dir
+        self.fetcher = fetcher
+        self.queue = queue.Queue()
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        """Start the worker pool (once) and requeue unfinished jobs from the table."""
+        with self._start_lock:
+            # 用旗標而不是 self._threads 判斷：VOICE_WORKERS=0 時沒有執行緒，不能每次 enqueue 都重新排隊
+            if self._started:
+                return
+            self._started = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"voice-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            stale = time.time() - LEASE_SECONDS
+            rows = self._conn().execute(
+                "SELECT key FROM voice_jobs WHERE status = 'queued' OR (status = 'running' AND updated_at < ?)",
+                (stale,)).fetchall()
+            for row in rows:
+                self.queue.put(row["key"])
+
+    def enqueue(self, character_id, name):
+        """Record the character's job and queue it unless one for the same name is pending or ready."""
+        # 先啟動（接手舊任務），再寫入這個任務，同一個 key 不會排進佇列兩次
+        self.start()
+        key = normalize_name(name)
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO character_voices (character_id, key) VALUES (?, ?) "
+                         "ON CONFLICT(character_id) DO UPDATE SET key = excluded.key", (character_id, key))
+            job = conn.execute("SELECT status FROM voice_jobs WHERE key = ?", (key,)).fetchone()
+            if job is None:
+                conn.execute("INSERT INTO voice_jobs (key, name, status, created_at, updated_at) "
+                             "VALUES (?, ?, 'queued', ?, ?)", (key, name, now, now))
+                queued = True
+            elif job["status"] in ("failed", "not_found"):
+                # 新角色再次使用同一名字時重試
+                conn.execute("UPDATE voice_jobs SET status = 'queued', error = NULL, updated_at = ? WHERE key = ?",
+                             (now, key))
+                queued = True
+            else:
+                queued = False
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if queued:
+            self.queue.put(key)
+        return self.status(character_id)
+
+    def forget(self, character_id):
+        """Drop a deleted character's link; the job and sample stay for other characters with that name."""
+        self._conn().execute("DELETE FROM character_voices WHERE character_id = ?", (character_id,))
+
+    def status(self, character_id):
+        row = self._conn().execute(
+            "SELECT j.* FROM character_voices c JOIN voice_jobs j ON j.key = c.key WHERE c.character_id = ?",
+            (character_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row["status"],
+            "name": row["name"],
+            "attempts": row["attempts"],
+            "path": row["path"],
+            "error": row["error"],
+            "updated_at": row["updated_at"],
+        }
+
+    def stats(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM voice_jobs GROUP BY status").fetchall()
+        return {"queue_depth": self.queue.qsize(), "workers": len(self._threads),
+                **{row["status"]: row["n"] for row in rows}}
+
+    def _claim(self, key):
+        """Atomically move a queued (or abandoned) job to running; False if another worker has it."""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE voice_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+            "WHERE key = ? AND (status = 'queued' OR (status = 'running' AND updated_at < ?))",
+            (now, key, now - LEASE_SECONDS))
+        return cur.rowcount == 1
+
+    def _finish(self, key, status, path=None, error=None):
+        self._conn().execute("UPDATE voice_jobs SET status = ?, path = ?, error = ?, updated_at = ? WHERE key = ?",
+                             (status, path, error, time.time(), key))
+
+    def _work(self):
+        while True:
+            key = self.queue.get()
+            try:
+                if not self._claim(key):
+                    continue
+                name = self._conn().execute("SELECT name FROM voice_jobs WHERE key = ?", (key,)).fetchone()["name"]
+                try:
+                    path = self.fetcher(name, out_dir=self.out_dir)
+                except Exception as e:
+                    print(f"Error fetching voice sample: {e}")
+                    self._finish(key, "failed", error=str(e) or type(e).__name__)
+                else:
+                    self._finish(key, "ready" if path else "not_found", path=str(path) if path else None)
+            except Exception as e:
+                print(f"voice job {key} crashed: {e}")
+            finally:
+                self.queue.task_done()
+
+
+_voice_jobs = None
+_voice_jobs_lock = threading.Lock()
+
+
+def get_voice_jobs():
+    """The process-wide VoiceJobs, created on first use."""
+    global _voice_jobs
+    with _voice_jobs_lock:
+        if _voice_jobs is None:
+            _voice_jobs = VoiceJobs()
+        return _voice_jobs
@@ -12,7 +12,7 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 import { Badge } from "@/components/ui/badge";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
-import { chatWithQwen } from "@/lib/api";
+import { chatWithQwenStream } from "@/lib/api";
 import { TypingBubble } from "@/components/TypingBubble";
 import VoiceCaptionOverlay, { Caption as VCaption } from "@/components/VoiceCaptionOverlay"
 import { useVoiceTurn } from "@/hooks/useVoiceTurn";
@@ -319,6 +319,14 @@ const ChatInterface = () => {
 
   const abortRef = useRef<AbortController | null>(null);
 
+  // One server-side conversation per character. The backend only keeps
+  // history for requests that carry a session_id, so we name ours here.
+  const sessionIds = useRef<Record<string, string>>({});
+  const sessionFor = (characterId: string) => {
+    if (!sessionIds.current[characterId]) sessionIds.current[characterId] = crypto.randomUUID();
+    return sessionIds.current[characterId];
+  };
+
   // 發送消息
   const handleSendMessage = async () => {
     if (!inputValue.trim()) return;
@@ -364,32 +372,44 @@ const ChatInterface = () => {
       abortRef.current?.abort();
       abortRef.current = new AbortController();
 
-      const characterName = characters.find((c) => c.id === activeCharacter)?.name;
-      const reply = await chatWithQwen({
+      const characterId = activeCharacter;
+      const character = characters.find((c) => c.id === characterId);
+      const replyId = `${now.getTime()}-reply`;
+
+      // 3) the first token replaces the typing bubble; later tokens grow the same message
+      const showReply = (content: string) =>
+        setThreads((prev) => {
+          const list = prev[characterId] ?? [];
+          const reply: Message = {
+            id: replyId,
+            content,
+            sender: "ai",
+            timestamp: new Date(),
+            characterId,
+          };
+          return {
+            ...prev,
+            [characterId]: list.some((m) => m.id === replyId)
+              ? list.map((m) => (m.id === replyId ? { ...m, content } : m))
+              : [...list.filter((m) => m.id !== typingId), reply],
+          };
+        });
+
+      let streamed = "";
+      const reply = await chatWithQwenStream({
         prompt: userMsg.content,
-        character: characterName,
-        character_json: JSON.stringify(characters.find((c) => c.id === activeCharacter)),
+        character: character?.name,
+        character_json: JSON.stringify(character),
+        session_id: sessionFor(characterId),
+        onToken: (text) => {
+          if (!text) return;
+          streamed += text;
+          showReply(streamed);
+        },
         signal: abortRef.current.signal,
       });
 
-      // 3) replace typing with real message
-      setThreads((prev) => {
-        const list = prev[activeCharacter] ?? [];
-        const withoutTyping = list.filter((m) => m.id !== typingId);
-        return {
-          ...prev,
-          [activeCharacter]: [
-            ...withoutTyping,
-            {
-              id: `${Date.now() + 1}`,
-              content: reply || "(no content)",
-              sender: "ai",
-              timestamp: new Date(),
-              characterId: activeCharacter,
-            },
-          ],
-        };
-      });
+      showReply(reply || "(no content)");
       addCaption("ai", reply || "(no content)");
     } catch (err: any) {
       // show error inside the thread
@@ -453,12 +473,20 @@ const ChatInterface = () => {
       // Add a temporary placeholder and keep its id
       const tempId = addCaption("user", "(voice) — sending audio…")
 
-      const form = new FormData()
-      form.append("audio", wav, "turn.wav")
-      form.append("character_json", JSON.stringify(characters.find((c) => c.id === activeCharacter)))
+      // raw audio/wav body with the fields in the query string: the backend
+      // decodes it as it arrives instead of spooling a multipart form first.
+      // Only the character's id goes in the URL; the server looks it up.
+      const params = new URLSearchParams({
+        character_id: activeCharacter,
+        session_id: sessionFor(activeCharacter),
+      })
 
       try {
-        const r = await fetch("http://localhost:8000/api/turn", { method: "POST", body: form })
+        const r = await fetch(`http://localhost:8000/api/turn?${params}`, {
+          method: "POST",
+          headers: { "Content-Type": "audio/wav" },
+          body: wav,
+        })
         const data = await r.json()
         if (!r.ok) throw new Error(data.error || r.statusText)
 
@@ -477,15 +505,18 @@ const ChatInterface = () => {
               transcript: reply,
               speaker_tag: JSON.stringify(characters.find((c) => c.id === activeCharacter)),
               temperature: 0.35,
-              return_audio: "url",
+              // raw wav body: no base64 inflation and no second request for the file
+              return_audio: "wav",
             }),
           })
-          const ttsData = await ttsRes.json()
-          if (ttsRes.ok && ttsData.audio_url) {
-            aiAudioUrl = ttsData.audio_url
+          if (ttsRes.ok) {
+            aiAudioUrl = URL.createObjectURL(await ttsRes.blob())
             // 🎧 auto-play right away
             const audio = new Audio(aiAudioUrl)
-            audio.addEventListener("ended", () => setIsTurnBusy(false))
+            audio.addEventListener("ended", () => {
+              URL.revokeObjectURL(audio.src)
+              setIsTurnBusy(false)
+            })
             audio.play().catch(() => setIsTurnBusy(false))
           } else {
             setIsTurnBusy(false)
@@ -2,11 +2,14 @@ export async function chatWithQwen({
   prompt,
   character,
   character_json,
+  session_id,
   signal,
 }: {
   prompt: string;
   character?: string;
   character_json?: string;
+  // keeps the conversation's history on the server; omit for a stateless call
+  session_id?: string;
   signal?: AbortSignal;
 }): Promise<string> {
   const res = await fetch("http://localhost:8000/api/chat", {
@@ -17,6 +20,7 @@ export async function chatWithQwen({
       character,
       max_tokens: 4096,
       character_json,
+      session_id,
       // optional system: "You are a helpful assistant."
     }),
     signal,
@@ -30,4 +34,66 @@ export async function chatWithQwen({
   const data = await res.json();
   console.log(data);
   return data.content ?? "";
-}
\ No newline at end of file
+}
+// Streams the visible answer from /api/chat/stream (server-sent events).
+// `onToken` is called for each chunk; resolves with the full answer.
+export async function chatWithQwenStream({
+  prompt,
+  character,
+  character_json,
+  session_id,
+  onToken,
+  signal,
+}: {
+  prompt: string;
+  character?: string;
+  character_json?: string;
+  session_id?: string;
+  onToken: (text: string) => void;
+  signal?: AbortSignal;
+}): Promise<string> {
+  const res = await fetch("http://localhost:8000/api/chat/stream", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      prompt,
+      character,
+      max_tokens: 4096,
+      character_json,
+      session_id,
+    }),
+    signal,
+  });
+
+  if (!res.ok || !res.body) {
+    const text = await res.text().catch(() => "");
+    throw new Error(`Qwen proxy error (${res.status}): ${text || res.statusText}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+  let full = "";
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffered.indexOf("\n\n")) !== -1) {
+      const raw = buffered.slice(0, sep);
+      buffered = buffered.slice(sep + 2);
+      const event = raw.match(/^event: (.*)$/m)?.[1];
+      const data = raw.match(/^data: (.*)$/m)?.[1];
+      if (!data) continue;
+      const parsed = JSON.parse(data);
+      if (event === "error") throw new Error(parsed.error);
+      if (event === "done") continue;
+      full += parsed.content ?? "";
+      onToken(parsed.content ?? "");
+    }
+  }
+
+  return full;
+}
@@ -17,9 +17,9 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--temperature", type=float, default=0.35, help="Sampling temperature")
     parser.add_argument(
         "--mode",
-        choices=["base64", "url"],
+        choices=["base64", "url", "wav", "ogg"],
         default="url",
-        help="Whether to request base64 or a downloadable URL",
+        help="Whether to request base64, a downloadable URL, or the raw wav/ogg file as the response body",
     )
     parser.add_argument("--out", default="client.wav", help="Output path if saving audio")
     return parser.parse_args()
@@ -34,13 +34,23 @@ def main() -> int:
         "temperature": float(args.temperature),
         "return_audio": args.mode,
     }
+    binary = args.mode in ("wav", "ogg")
     try:
-        resp = requests.post(endpoint, json=payload, timeout=300)
+        # stream=True: write a binary body to disk as it arrives instead of holding it in memory
+        resp = requests.post(endpoint, json=payload, timeout=300, stream=binary)
         resp.raise_for_status()
     except Exception as e:
         print(f"Request failed: {e}", file=sys.stderr)
         return 2
 
+    if binary:
+        out_path = Path(args.out)
+        with out_path.open("wb") as f:
+            for chunk in resp.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+        print(f"Saved: {out_path} ({resp.headers.get('X-Duration-Sec', '?')} s)")
+        return 0
+
     data = resp.json()
 
     if args.mode == "base64":
@@ -12,6 +12,7 @@ import ast
 import json
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
@@ -29,6 +30,7 @@ app.add_middleware(
     allow_credentials=False,          # set True only if you send cookies/auth
     allow_methods=["*"],              # POST/GET/OPTIONS etc.
     allow_headers=["*"],              # Content-Type, Authorization, etc.
+    expose_headers=["X-Audio-Id", "X-Duration-Sec"],  # metadata of binary /generate responses
 )
 
 # Where to write generated audio files
@@ -198,8 +200,10 @@ model_client, audio_tokenizer = setup_model()
 class GenerateRequest(BaseModel):
     transcript: str = Field(..., description="Text to turn into speech/audio")
     temperature: float = Field(0.35, ge=0.0, le=2.0, description="Sampling temperature")
-    return_audio: Literal["base64", "url"] = Field(
-        "base64", description="Whether to return the audio as base64 or a downloadable URL"
+    return_audio: Literal["base64", "url", "wav", "ogg"] = Field(
+        "base64",
+        description="Return the audio as base64 in JSON, a downloadable URL, or the raw audio/wav or "
+        "audio/ogg file as the response body (also chosen by an 'Accept: audio/wav' or 'audio/ogg' header)",
     )
     filename: Optional[str] = Field(
         None,
@@ -232,8 +236,26 @@ def health() -> dict:
     return {"status": "ok", "gpu": smi}
 
 
-@app.post("/generate", response_model=GenerateResponse)
-def generate(req: GenerateRequest, request: Request) -> GenerateResponse:
+AUDIO_TYPES = {"wav": "audio/wav", "ogg": "audio/ogg"}
+
+
+def _binary_format(req: GenerateRequest, request: Request) -> Optional[str]:
+    if req.return_audio in AUDIO_TYPES:
+        return req.return_audio
+    if req.return_audio == "base64":  # the default; an audio Accept header overrides it
+        accept = request.headers.get("accept", "")
+        for fmt, media_type in AUDIO_TYPES.items():
+            if media_type in accept:
+                return fmt
+    return None
+
+
+@app.post(
+    "/generate",
+    response_model=GenerateResponse,
+    responses={200: {"content": {media_type: {} for media_type in AUDIO_TYPES.values()}}},
+)
+def generate(req: GenerateRequest, request: Request):
     # Resolve output filename
     audio_id = str(uuid.uuid4()) if not req.filename else Path(req.filename).stem + "-" + str(uuid.uuid4())
     out_name = (Path(req.filename).name if req.filename else f"{audio_id}.wav")
@@ -254,6 +276,19 @@ def generate(req: GenerateRequest, request: Request) -> GenerateResponse:
     if not out_path.exists():
         raise HTTPException(status_code=500, detail="Expected output file was not created.")
 
+    fmt = _binary_format(req, request)
+    if fmt is not None:
+        # Raw bytes straight from disk, streamed in chunks: no base64 (+33%) and no copy in memory
+        if fmt == "ogg":
+            wv, sr = sf.read(out_path)
+            out_path = out_path.with_suffix(".ogg")
+            sf.write(out_path, wv, sr, format="OGG", subtype="VORBIS")
+        return FileResponse(
+            out_path,
+            media_type=AUDIO_TYPES[fmt],
+            headers={"X-Audio-Id": audio_id, "X-Duration-Sec": f"{sf.info(str(out_path)).duration:.3f}"},
+        )
+
     if req.return_audio == "base64":
         b = out_path.read_bytes()
         b64 = base64.b64encode(b).decode("utf-8")